@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+students表索引基准测试脚本
+
+在临时数据库中生成指定数量的学生数据，分别在创建索引前后
+输出热点查询的查询计划（SCAN / SEARCH）和平均耗时。
+
+用法:
+    python benchmark_indexes.py --students 20000 --classes 450
+"""
+
+import os
+import sqlite3
+import argparse
+import random
+import tempfile
+import time
+import datetime
+
+from database import ensure_indexes, student_id_num
+
+# 热点查询：(说明, SQL, 参数生成函数)
+HOT_QUERIES = [
+    ('按班级ID获取学生列表', 'SELECT * FROM students WHERE class_id = ? ORDER BY id_num',
+     lambda ctx: (ctx['class_id'],)),
+    ('按班级名称获取学生列表', 'SELECT id, name, gender, class, comments, updated_at FROM students WHERE class = ? ORDER BY id_num',
+     lambda ctx: (ctx['class_name'],)),
+    ('全校学生按班级排序', 'SELECT id, name, class FROM students ORDER BY class, id_num',
+     lambda ctx: ()),
+    ('学生访问权限检查', 'SELECT id FROM students WHERE class_id = ? AND id = ?',
+     lambda ctx: (ctx['class_id'], ctx['student_id'])),
+    ('班级学号列表', 'SELECT id FROM students WHERE class_id = ?',
+     lambda ctx: (ctx['class_id'],)),
+    ('获取当前班级名称', 'SELECT DISTINCT class FROM students WHERE class_id = ?',
+     lambda ctx: (ctx['class_id'],)),
+    ('最近活动', 'SELECT id, name, class, updated_at FROM students WHERE updated_at IS NOT NULL ORDER BY updated_at DESC LIMIT 10',
+     lambda ctx: ()),
+]
+
+
+def create_database(path, student_count, class_count):
+    """创建与线上结构一致的students表并填充测试数据"""
+    conn = sqlite3.connect(path)
+    conn.execute('''
+    CREATE TABLE students (
+        id TEXT,
+        id_num INTEGER,
+        name TEXT NOT NULL,
+        gender TEXT NOT NULL,
+        class TEXT,
+        class_id INTEGER,
+        comments TEXT,
+        created_at TEXT,
+        updated_at TEXT,
+        PRIMARY KEY (id, class_id)
+    )''')
+
+    start = datetime.datetime(2025, 3, 1)
+    rows = []
+    for i in range(student_count):
+        class_id = i % class_count + 1
+        updated_at = start + datetime.timedelta(minutes=random.randint(0, 60 * 24 * 60))
+        student_id = str(i // class_count + 1 + (class_id * 1000))
+        rows.append((
+            student_id,
+            student_id_num(student_id),
+            f'学生{i}',
+            random.choice(['男', '女']),
+            f'{class_id // 20 + 1}年级{class_id % 20 + 1}班',
+            class_id,
+            '该生学习认真，积极参加班级活动。' * 5,
+            start.strftime('%Y-%m-%d %H:%M:%S'),
+            updated_at.strftime('%Y-%m-%d %H:%M:%S'),
+        ))
+    conn.executemany('INSERT INTO students VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+    conn.commit()
+    return conn
+
+
+def run_queries(conn, ctx, repeat):
+    """返回每个查询的(查询计划, 平均耗时毫秒)"""
+    results = []
+    for title, sql, make_params in HOT_QUERIES:
+        params = make_params(ctx)
+        plan = ' | '.join(row[3] for row in conn.execute(f'EXPLAIN QUERY PLAN {sql}', params))
+
+        begin = time.perf_counter()
+        for _ in range(repeat):
+            conn.execute(sql, params).fetchall()
+        elapsed = (time.perf_counter() - begin) / repeat * 1000
+        results.append((title, plan, elapsed))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='students表索引基准测试')
+    parser.add_argument('--students', type=int, default=20000, help='学生数量 (默认: 20000)')
+    parser.add_argument('--classes', type=int, default=450, help='班级数量 (默认: 450)')
+    parser.add_argument('--repeat', type=int, default=20, help='每个查询重复次数 (默认: 20)')
+    args = parser.parse_args()
+
+    random.seed(0)
+    fd, path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    try:
+        conn = create_database(path, args.students, args.classes)
+        sample = conn.execute('SELECT id, class_id, class FROM students LIMIT 1 OFFSET ?',
+                              (args.students // 2,)).fetchone()
+        ctx = {'student_id': sample[0], 'class_id': sample[1], 'class_name': sample[2]}
+
+        before = run_queries(conn, ctx, args.repeat)
+        ensure_indexes(conn)
+        after = run_queries(conn, ctx, args.repeat)
+
+        print(f"学生数量: {args.students}, 班级数量: {args.classes}, 重复次数: {args.repeat}")
+        for (title, plan_before, ms_before), (_, plan_after, ms_after) in zip(before, after):
+            print(f"\n== {title}")
+            print(f"  创建索引前 {ms_before:8.3f} ms  {plan_before}")
+            print(f"  创建索引后 {ms_after:8.3f} ms  {plan_after}")
+        conn.close()
+    finally:
+        os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
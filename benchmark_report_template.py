@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+报告模板渲染基准测试脚本
+
+对比两种方式为每个学生生成报告的平均耗时：
+- 每个学生重新创建 DocxTemplate（原做法，每次都重新解析、编译模板）
+- 使用 utils.docx_template_cache 的编译缓存
+
+用法:
+    python benchmark_report_template.py --students 50
+    python benchmark_report_template.py --template templates/docx/泉州东海湾实验学校综合素质发展报告单.docx
+"""
+
+import io
+import argparse
+import time
+
+from docxtpl import DocxTemplate
+
+from utils.report_exporter import ReportExporter
+from utils.docx_template_cache import load_template, template_from_bytes, clear_template_cache
+
+
+def make_students(count):
+    """生成测试用的学生、评语和成绩数据"""
+    students = []
+    for i in range(count):
+        student_id = str(i + 1)
+        students.append((
+            {
+                'id': student_id, 'name': f'学生{i + 1}', 'gender': '男' if i % 2 else '女',
+                'class': '三年级2班', 'height': 130 + i % 10, 'weight': 28 + i % 5,
+                'pinzhi': 28, 'xuexi': 18, 'jiankang': 19, 'shenmei': 9, 'shijian': 9, 'shenghuo': 10,
+            },
+            {'content': '该生学习认真，积极参加班级活动，与同学相处融洽。' * 4},
+            {'grades': {'yuwen': '优', 'shuxue': '良', 'yingyu': '优', 'kexue': '良'}},
+        ))
+    return students
+
+
+def render_uncached(template_bytes, context):
+    doc = DocxTemplate(io.BytesIO(template_bytes))
+    doc.render(context)
+    output = io.BytesIO()
+    doc.save(output)
+    return output.getvalue()
+
+
+def run(label, render, contexts):
+    begin = time.perf_counter()
+    for context in contexts:
+        render(context)
+    elapsed = time.perf_counter() - begin
+    print(f"  {label}: 共 {elapsed * 1000:9.1f} ms，每个学生 {elapsed / len(contexts) * 1000:7.2f} ms")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='报告模板渲染基准测试')
+    parser.add_argument('--students', type=int, default=50, help='学生数量 (默认: 50)')
+    parser.add_argument('--template', help='模板文件路径 (默认: 内置默认模板)')
+    args = parser.parse_args()
+
+    exporter = ReportExporter()
+    settings = {'schoolYear': '2024-2025', 'semester': '1', 'teacherName': '王老师'}
+    contexts = [exporter.prepare_template_data(student, comment, grades, settings)
+                for student, comment, grades in make_students(args.students)]
+
+    if args.template:
+        with open(args.template, 'rb') as f:
+            template_bytes = f.read()
+        get_cached = lambda: load_template(args.template)
+    else:
+        template_bytes = exporter.default_template
+        get_cached = lambda: template_from_bytes('内置默认模板', template_bytes)
+
+    print(f"学生数量: {args.students}, 模板: {args.template or '内置默认模板'}")
+    before = run('每个学生重新加载模板', lambda context: render_uncached(template_bytes, context), contexts)
+    clear_template_cache()
+    after = run('使用模板编译缓存    ', lambda context: get_cached().render(context), contexts)
+    print(f"  加速比: {before / after:.2f}x")
+
+
+if __name__ == '__main__':
+    main()
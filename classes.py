@@ -11,6 +11,8 @@ import datetime
 import logging
 from flask import Blueprint, request, jsonify
 from flask_login import login_required, current_user
+from database import get_db_connection
+from models.user import invalidate_user_cache
 
 # 配置日志
 logger = logging.getLogger(__name__)
@@ -18,16 +20,6 @@ logger = logging.getLogger(__name__)
 # 班级蓝图
 classes_bp = Blueprint('classes', __name__)
 
-# 配置
-DATABASE = 'students.db'
-
-# 获取数据库连接
-def get_db_connection():
-    conn = sqlite3.connect(DATABASE)
-    conn.row_factory = sqlite3.Row
-    conn.execute('PRAGMA foreign_keys = ON')  # 启用外键约束
-    return conn
-
 # 初始化班级表
 def init_classes():
     """初始化班级表，如果不存在则创建"""
@@ -412,6 +404,8 @@ def delete_class(class_id):
         
         conn.commit()
         conn.close()
+        # 按班级批量修改了用户，清空全部用户缓存
+        invalidate_user_cache()
         
         logger.info(f"成功删除班级 ID={class_id}, 名称={class_name}")
         return jsonify({
@@ -557,6 +551,7 @@ def assign_teacher(class_id):
         
         conn.commit()
         conn.close()
+        invalidate_user_cache()
         
         logger.info(f"成功{action}")
         return jsonify({
@@ -1,6 +1,6 @@
 # -*- coding: utf-8 -*-
-from flask import Blueprint, request, jsonify, send_from_directory, current_app, make_response
-from flask_login import current_user
+from flask import Blueprint, request, jsonify, send_file, send_from_directory, current_app, make_response, stream_with_context, json
+from flask_login import current_user, login_required
 import sqlite3
 import os
 import datetime
@@ -10,7 +10,6 @@ import tempfile
 import zipfile
 import sys
 import platform
-import threading
 
 # 尝试导入pythoncom，如果不可用则跳过
 try:
@@ -22,7 +21,20 @@ except ImportError:
 
 # 导入评语相关的工具类
 from utils.comment_processor import batch_update_comments, generate_comments_pdf, generate_preview_html
-from utils.comment_generator import CommentGenerator
+from utils.comment_generator import get_comment_generator
+from utils.comment_batch import generate_comments
+from database import get_db_connection
+from logger_config import Payload
+from utils.student_list import parse_list_args, query_students, count_students
+from utils.class_filter import student_access_filter
+from utils.report_data import load_report_data
+from utils.export_jobs import (create_job, get_job, request_cancel, start_job, ExportCancelled, JobProgress,
+                               STATUS_DONE, STATUS_FAILED)
+from utils import export_cache
+from utils.libreoffice_pool import libreoffice_available, convert_with_libreoffice
+from utils.word_converter import convert_with_word, WORD_COM_AVAILABLE
+from utils.report_pdf_renderer import has_pdf_layout, layout_matches_template
+from config import EXPORTS_FOLDER, PDF_CONVERT_RETRIES, NATIVE_PDF_REPORTS, AI_COMMENT_BATCH_MAX
 try:
     from utils.pdf_exporter_fixed import export_comments_to_pdf
 except ImportError:
@@ -38,14 +50,6 @@ except ImportError:
 comments_bp = Blueprint('comments', __name__)
 logger = logging.getLogger(__name__)
 
-# 获取数据库连接函数
-def get_db_connection():
-    DATABASE = 'students.db'
-    conn = sqlite3.connect(DATABASE)
-    conn.row_factory = sqlite3.Row
-    conn.execute('PRAGMA foreign_keys = ON')  # 启用外键约束
-    return conn
-
 # 获取单个学生评语
 @comments_bp.route('/api/comments/<student_id>', methods=['GET'], strict_slashes=False)
 def get_student_comment(student_id):
@@ -97,13 +101,41 @@ def get_student_comment(student_id):
             'message': f'获取评语时出错: {str(e)}'
         }), 500
 
+def update_student_comment(conn, student_id, class_id, content, previous=None, append_mode=False):
+    """
+    保存学生评语（保存评语接口和AI流式生成共用）
+
+    Args:
+        conn: 数据库连接
+        student_id / class_id: 学生ID和所在班级ID，只更新该班级中的学生
+        content: 评语内容
+        previous: 学生当前的评语，追加模式下新评语加在其后
+        append_mode: 是否追加到原有评语之后
+
+    Returns:
+        Tuple[str, str]: (保存后的评语, 更新时间)
+    """
+    now = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    
+    # 如果是追加模式且已有评语，则在原有评语基础上添加新内容（添加时间戳和分隔符）
+    if append_mode and previous:
+        updated_content = f"{previous}\n\n--- {now} ---\n{content}"
+    else:
+        updated_content = content
+    
+    # 更新学生评语，确保只更新指定班级的学生记录
+    conn.execute('UPDATE students SET comments = ?, updated_at = ? WHERE id = ? AND class_id = ?',
+                 (updated_content, now, student_id, class_id))
+    conn.commit()
+    return updated_content, now
+
 # 保存学生评语
 @comments_bp.route('/api/comments', methods=['POST'], strict_slashes=False)
 def save_student_comment():
     data = request.json
     
     # 详细记录请求信息以便调试
-    logger.info(f"收到保存评语请求: {data}")
+    logger.debug("收到保存评语请求: %s", Payload(data))
     
     if not data or 'studentId' not in data or 'content' not in data:
         logger.error(f"请求数据验证失败: {data}")
@@ -162,21 +194,9 @@ def save_student_comment():
                 'message': '未找到该班级中的学生'
             }), 404
         
-        now = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        
         try:
-            # 如果是追加模式且已有评语，则在原有评语基础上添加新内容
-            if append_mode and student['comments']:
-                # 在原评语后添加新评语（添加时间戳和分隔符）
-                updated_content = f"{student['comments']}\n\n--- {now} ---\n{content}"
-            else:
-                # 直接使用新评语
-                updated_content = content
-                
-            # 更新学生评语，确保只更新指定班级的学生记录
-            cursor.execute('UPDATE students SET comments = ?, updated_at = ? WHERE id = ? AND class_id = ?', 
-                          (updated_content, now, student_id, class_id))
-            conn.commit()
+            updated_content, now = update_student_comment(conn, student_id, class_id, content,
+                                                          student['comments'], append_mode)
             
             logger.info(f"评语保存成功: 学生ID={student_id}, 班级ID={class_id}")
             return jsonify({
@@ -187,7 +207,7 @@ def save_student_comment():
             })
         except Exception as e:
             conn.rollback()
-            logger.error(f"更新评语SQL错误: {str(e)}, SQL: 'UPDATE students SET comments = ?, updated_at = ? WHERE id = ? AND class_id = ?', 参数: ({len(updated_content)}字节, {now}, {student_id}, {class_id})")
+            logger.error(f"更新评语SQL错误: {str(e)}, SQL: 'UPDATE students SET comments = ?, updated_at = ? WHERE id = ? AND class_id = ?', 参数: ({len(content)}字节, {student_id}, {class_id})")
             return jsonify({
                 'status': 'error',
                 'message': f'保存评语时出错: {str(e)}'
@@ -262,22 +282,17 @@ def batch_update_comments_api():
         conn = get_db_connection()
         cursor = conn.cursor()
         
-        # 记录更新的学生数量
-        updated_count = 0
-        
         # 获取当前时间，但不再添加到评语中
         now = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         
-        # 对选中的每个学生更新评语
-        for student_id in student_ids:
-            # 查询学生当前评语，确保只查询当前班级的学生
-            cursor.execute('SELECT comments FROM students WHERE id = ? AND class_id = ?', (student_id, class_id))
-            student = cursor.fetchone()
-            
-            if not student:
-                continue  # 跳过不存在的学生ID或不属于当前班级的学生
-            
-            current_comment = student[0] or ''
+        # 一次查询选中学生的当前评语，只查询当前班级的学生，不存在或不属于当前班级的学生ID会被跳过
+        placeholders = ','.join(['?' for _ in student_ids])
+        cursor.execute(f'SELECT id, comments FROM students WHERE class_id = ? AND id IN ({placeholders})',
+                       [class_id] + [str(student_id) for student_id in student_ids])
+        
+        updates = []
+        for student in cursor.fetchall():
+            current_comment = student['comments'] or ''
             
             # 根据模式设置新评语
             if append_mode and current_comment:
@@ -286,12 +301,11 @@ def batch_update_comments_api():
             else:
                 # 如果是替换模式或无评语，则直接使用新内容
                 new_comment = content
-            
-            # 更新学生评语和更新时间，确保只更新当前班级的学生
-            cursor.execute('UPDATE students SET comments = ?, updated_at = ? WHERE id = ? AND class_id = ?', 
-                          (new_comment, now, student_id, class_id))
-            
-            updated_count += 1
+            updates.append((new_comment, now, student['id'], class_id))
+        
+        # 更新学生评语和更新时间，确保只更新当前班级的学生
+        cursor.executemany('UPDATE students SET comments = ?, updated_at = ? WHERE id = ? AND class_id = ?', updates)
+        updated_count = len(updates)
         
         conn.commit()
         conn.close()
@@ -312,13 +326,10 @@ def generate_comment():
     try:
         # 获取请求数据
         data = request.get_json()
-        logger.info(f"收到评语生成请求: {data}")
+        logger.debug("收到评语生成请求: %s", Payload(data))
         
-        # 获取全局变量
-        deepseek_api = current_app.config.get('deepseek_api')
-        
-        # 验证请求数据
-        comment_generator = CommentGenerator(deepseek_api.api_key if deepseek_api else None)
+        # 验证请求数据（复用进程内的评语生成器及其连接）
+        comment_generator = get_comment_generator(current_app.config.get('deepseek_api'))
         is_valid, error_msg = comment_generator.validate_request(data)
         if not is_valid:
             logger.error(f"请求数据验证失败: {error_msg}")
@@ -394,7 +405,8 @@ def generate_comment():
                 student_info=student_info,
                 style=style,
                 tone=tone,
-                max_length=max_length
+                max_length=max_length,
+                regenerate=bool(data.get('regenerate'))
             )
         except Exception as e:
             logger.error(f"评语生成引擎错误: {str(e)}")
@@ -410,6 +422,7 @@ def generate_comment():
             return jsonify({
                 "status": "ok",
                 "comment": result["comment"],
+                "cached": result.get("cached", False),
                 "student_id": student_id,
                 "class_id": class_id
             })
@@ -429,8 +442,194 @@ def generate_comment():
             "message": f"生成评语时出错: {str(e)}"
         }), 500
 
+# 流式AI生成评语API
+@comments_bp.route('/api/generate-comment/stream', methods=['POST'])
+@login_required
+def generate_comment_stream():
+    """
+    流式生成AI评语，模型每生成一段文字就以SSE事件推送给浏览器
+
+    请求: 同 /api/generate-comment，另有 "save"（默认false；为true时生成完成后保存为该学生的评语，
+          只能保存本班学生，管理员不限）
+    响应（text/event-stream）:
+        event: delta  data: {"text"}                                   新生成的文字
+        event: done   data: {"comment", "cached", "saved", "updateDate"} 生成完成
+        event: error  data: {"message"}                                生成失败
+    """
+    data = request.get_json(silent=True) or {}
+    logger.debug("收到流式评语生成请求: %s", Payload(data))
+    
+    comment_generator = get_comment_generator(current_app.config.get('deepseek_api'))
+    is_valid, error_msg = comment_generator.validate_request(data)
+    if not is_valid:
+        return jsonify({"status": "error", "message": error_msg}), 400
+    
+    student_id = data['student_id']
+    class_id = data.get('class_id') or current_user.class_id
+    save = bool(data.get('save', False))
+    if save and not current_user.is_admin and str(class_id) != str(current_user.class_id):
+        logger.error(f"权限检查失败: 用户班级ID={current_user.class_id}, 请求班级ID={class_id}")
+        return jsonify({"status": "error", "message": "您没有权限修改其他班级学生的评语"}), 403
+    
+    try:
+        conn = get_db_connection()
+        try:
+            student = conn.execute('SELECT name, gender FROM students WHERE id = ? AND class_id = ?',
+                                   (student_id, class_id)).fetchone()
+        finally:
+            conn.close()
+    except Exception as e:
+        logger.error(f"数据库查询错误: {str(e)}")
+        return jsonify({"status": "error", "message": f"数据库查询错误: {str(e)}"}), 500
+    if not student:
+        return jsonify({
+            "status": "error",
+            "message": f"未找到ID为 {student_id} 的学生或该学生不在班级 {class_id} 中"
+        }), 404
+    
+    student_info = {
+        "name": student['name'],
+        "gender": student['gender'],
+        "personality": data.get('personality', ''),
+        "study_performance": data.get('study_performance', ''),
+        "hobbies": data.get('hobbies', ''),
+        "improvement": data.get('improvement', '')
+    }
+    if data.get('additional_instructions'):
+        student_info['additional_instructions'] = data['additional_instructions']
+    
+    logger.info(f"正在为学生 {student_info['name']}(ID: {student_id}, 班级ID: {class_id}) 流式生成评语")
+    
+    def sse(event, payload):
+        return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+    
+    def generate():
+        for event in comment_generator.generate_comment_stream(
+                student_info=student_info,
+                style=data.get('style', '鼓励性的'),
+                tone=data.get('tone', '正式的'),
+                max_length=int(data.get('max_length', 260)),
+                regenerate=bool(data.get('regenerate'))):
+            if event['type'] == 'delta':
+                yield sse('delta', {"text": event['text']})
+            elif event['type'] == 'error':
+                yield sse('error', {"message": event['message']})
+            else:
+                result = {"comment": event['comment'], "cached": event['cached'], "saved": False}
+                if save:
+                    # 与保存评语接口相同的保存逻辑
+                    try:
+                        conn = get_db_connection()
+                        try:
+                            _, result['updateDate'] = update_student_comment(conn, student_id, class_id, event['comment'])
+                        finally:
+                            conn.close()
+                        result['saved'] = True
+                        logger.info(f"流式生成的评语已保存: 学生ID={student_id}, 班级ID={class_id}")
+                    except Exception as e:
+                        logger.error(f"保存流式生成的评语时出错: {str(e)}")
+                        result['message'] = f'评语已生成，但保存失败: {str(e)}'
+                yield sse('done', result)
+    
+    response = current_app.response_class(stream_with_context(generate()), mimetype='text/event-stream')
+    # 禁止缓存和反向代理缓冲，保证文字生成后立即送到浏览器
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+# 批量AI生成评语API
+@comments_bp.route('/api/generate-comments', methods=['POST'])
+@login_required
+def generate_comments_batch():
+    """
+    为多个学生生成AI评语，同时请求多个学生，结果按生成完成的顺序以NDJSON逐行返回
+    
+    请求: {"students": [{"student_id", "personality", "study_performance", "hobbies", "improvement",
+                         "additional_instructions"}, ...], "class_id", "style", "tone", "max_length",
+          "regenerate"（为true时跳过评语缓存）}
+    响应: 每个学生一行 {"status", "student_id", "comment", "message", "cached"}，
+          最后一行 {"status": "done", "total", "succeeded", "failed"}
+    """
+    data = request.get_json(silent=True) or {}
+    logger.debug("收到批量评语生成请求: %s", Payload(data))
+    
+    items = data.get('students')
+    if not isinstance(items, list) or not items:
+        return jsonify({"status": "error", "message": "请提供要生成评语的学生列表"}), 400
+    if len(items) > AI_COMMENT_BATCH_MAX:
+        return jsonify({"status": "error", "message": f"每次最多为 {AI_COMMENT_BATCH_MAX} 个学生生成评语"}), 400
+    
+    comment_generator = get_comment_generator(current_app.config.get('deepseek_api'))
+    
+    style = data.get('style', '鼓励性的')
+    tone = data.get('tone', '正式的')
+    max_length = data.get('max_length', 260)
+    for item in items:
+        if not isinstance(item, dict):
+            return jsonify({"status": "error", "message": "学生列表格式错误"}), 400
+        is_valid, error_msg = comment_generator.validate_request(dict(item, max_length=max_length))
+        if not is_valid:
+            return jsonify({"status": "error", "message": error_msg}), 400
+    max_length = int(max_length)
+    regenerate = bool(data.get('regenerate'))
+    
+    # 获取班级ID，优先使用请求中的class_id，如果没有则使用当前用户的class_id
+    class_id = data.get('class_id') or current_user.class_id
+    student_ids = [str(item['student_id']) for item in items]
+    
+    # 一次查询全部学生的姓名和性别
+    try:
+        conn = get_db_connection()
+        try:
+            rows = conn.execute(
+                'SELECT id, name, gender FROM students WHERE id IN (SELECT value FROM json_each(?)) AND class_id = ?',
+                (json.dumps(student_ids), class_id)).fetchall()
+        finally:
+            conn.close()
+    except Exception as e:
+        logger.error(f"数据库查询错误: {str(e)}")
+        return jsonify({"status": "error", "message": f"数据库查询错误: {str(e)}"}), 500
+    students = {str(row['id']): row for row in rows}
+    
+    jobs = []
+    missing = []
+    for item, student_id in zip(items, student_ids):
+        student = students.get(student_id)
+        if student is None:
+            missing.append(student_id)
+            continue
+        student_info = {
+            "name": student['name'],
+            "gender": student['gender'],
+            "personality": item.get('personality', ''),
+            "study_performance": item.get('study_performance', ''),
+            "hobbies": item.get('hobbies', ''),
+            "improvement": item.get('improvement', '')
+        }
+        if item.get('additional_instructions'):
+            student_info['additional_instructions'] = item['additional_instructions']
+        jobs.append((student_id, student_info))
+    
+    logger.info(f"批量生成评语: 班级ID={class_id}, 学生数={len(jobs)}, 未找到={len(missing)}")
+    
+    def generate():
+        succeeded = 0
+        for student_id in missing:
+            yield json.dumps({"status": "error", "student_id": student_id, "comment": "",
+                              "message": f"未找到ID为 {student_id} 的学生或该学生不在班级 {class_id} 中"}) + '\n'
+        for result in generate_comments(comment_generator, jobs, style, tone, max_length, regenerate=regenerate):
+            if result['status'] == 'ok':
+                succeeded += 1
+            yield json.dumps(result) + '\n'
+        logger.info(f"批量生成评语完成: 成功 {succeeded}/{len(items)}")
+        yield json.dumps({"status": "done", "total": len(items), "succeeded": succeeded,
+                          "failed": len(items) - succeeded}) + '\n'
+    
+    return current_app.response_class(stream_with_context(generate()), mimetype='application/x-ndjson')
+
 # 导出评语为PDF
 @comments_bp.route('/api/export-comments-pdf', methods=['GET'])
+@login_required
 def api_export_comments_pdf():
     # 获取班级参数（可选）
     class_name = request.args.get('class')
@@ -548,6 +747,11 @@ def api_export_comments_pdf():
         # 正常处理字典类型的结果
         if result.get('status') == 'ok':
             logger.info(f"PDF导出成功: {result.get('file_path')}")
+            # 生成的文件记录为当前用户已完成的导出任务，通过任务下载接口（检查任务归属）下载
+            if result.get('filename'):
+                job_id = create_job(current_user.id, 'comments_pdf', 1)
+                JobProgress(job_id).finish(STATUS_DONE, '评语导出成功', result['filename'], done=1)
+                result['download_url'] = f"/api/export-jobs/{job_id}/download"
             # 确保下载URL可用
             if 'download_url' in result:
                 download_url = result['download_url']
@@ -627,233 +831,453 @@ def api_preview_comments():
             'message': f'生成打印预览时出错: {str(e)}'
         }), 500
 
-# 添加取消导出功能
-import threading
+# 导出任务的状态、进度和取消标记保存在数据库中（utils.export_jobs），
+# 多进程部署时查询进度和取消请求无论由哪个进程处理都能生效
 
-# 用于存储活动导出请求的字典和锁
-active_export_requests = {}
-export_requests_lock = threading.Lock()
+def _can_access_job(job):
+    """只有创建任务的用户和管理员可以查看、取消导出任务"""
+    return current_user.is_admin or job['user_id'] == str(current_user.id)
 
-# 检查导出请求是否被取消
-def is_export_cancelled(request_id):
-    """检查指定的导出请求是否已被取消"""
-    if not request_id:
-        return False
-        
-    with export_requests_lock:
-        request_info = active_export_requests.get(request_id)
-        if request_info and request_info.get('cancelled', False):
-            logger.info(f"导出请求 {request_id} 已被取消")
-            return True
-    return False
+def _job_info(job):
+    """导出任务返回给前端的字段"""
+    return {
+        'jobId': job['id'],
+        'status': job['status'],
+        'exportType': job['export_type'],
+        'total': job['total'],
+        'done': job['done'],
+        'failed': job['failed'],
+        'current': job['current'],
+        'message': job['message'],
+        'filename': job['filename'],
+        'downloadUrl': f"/api/export-jobs/{job['id']}/download" if job['filename'] else None
+    }
 
-# 清理过期的导出请求
-def cleanup_export_requests():
-    """清理超过30分钟的导出请求"""
-    now = datetime.datetime.now()
-    with export_requests_lock:
-        expired_requests = []
-        for req_id, info in active_export_requests.items():
-            if (now - info['started_at']).total_seconds() > 1800:  # 30分钟
-                expired_requests.append(req_id)
-                
-        for req_id in expired_requests:
-            logger.info(f"清理过期的导出请求: {req_id}")
-            del active_export_requests[req_id]
+def _cancel_job(job_id):
+    """标记导出任务为取消，返回接口响应"""
+    if not job_id:
+        return jsonify({'status': 'error', 'message': '未提供请求ID'})
+        
+    logger.info(f"收到取消导出请求: {job_id}")
+    job = get_job(job_id)
+    if job is None or not _can_access_job(job):
+        logger.warning(f"未找到要取消的导出任务: {job_id}")
+        return jsonify({
+            'status': 'warning',
+            'message': '未找到指定的导出请求，可能已完成或不存在'
+        })
+        
+    if request_cancel(job_id):
+        logger.info(f"已标记导出任务 {job_id} 为已取消")
+        return jsonify({
+            'status': 'success',
+            'message': '导出操作已取消'
+        })
+    return jsonify({
+        'status': 'warning',
+        'message': '导出任务已结束，无法取消'
+    })
 
 # 取消导出API
 @comments_bp.route('/api/cancel-export', methods=['POST'])
+@login_required
 def cancel_export():
     try:
         data = request.get_json()
-        request_id = data.get('requestId')
-        
-        if not request_id:
-            return jsonify({'status': 'error', 'message': '未提供请求ID'})
-            
-        logger.info(f"收到取消导出请求: {request_id}")
-        
-        # 清理过期请求
-        cleanup_export_requests()
-        
-        # 标记请求为已取消
-        found = False
-        with export_requests_lock:
-            if request_id in active_export_requests:
-                active_export_requests[request_id]['cancelled'] = True
-                active_export_requests[request_id]['status'] = 'cancelled'
-                found = True
-                logger.info(f"已标记导出请求 {request_id} 为已取消")
-            
-        if found:
-            return jsonify({
-                'status': 'success',
-                'message': '导出操作已取消'
-            })
-        else:
-            logger.warning(f"未找到要取消的导出请求: {request_id}")
-            return jsonify({
-                'status': 'warning',
-                'message': '未找到指定的导出请求，可能已完成或不存在'
-            })
+        return _cancel_job(data.get('requestId'))
     except Exception as e:
         logger.error(f"取消导出请求处理出错: {str(e)}")
         logger.error(traceback.format_exc())
         return jsonify({'status': 'error', 'message': f'取消导出失败: {str(e)}'})
 
-# 在文件转换过程中定期检查取消状态
-def convert_docx_to_pdf(input_file, output_file, request_id=None):
-    """转换单个Word文档为PDF，确保COM环境正确初始化，并支持取消操作"""
-    # 如果pythoncom不可用，直接返回错误
-    if not PYTHONCOM_AVAILABLE:
-        logger.error("无法转换Word文档：pythoncom模块不可用，请安装pywin32包")
-        return False
-        
+# 查询导出任务进度
+@comments_bp.route('/api/export-jobs/<job_id>', methods=['GET'])
+@login_required
+def get_export_job(job_id):
     try:
-        # 检查是否已取消
-        if request_id and is_export_cancelled(request_id):
-            logger.info(f"文件 {os.path.basename(input_file)} 的转换已被取消")
-            return False
-            
-        # 初始化COM环境
-        logger.info(f"为文件 {os.path.basename(input_file)} 初始化COM环境")
-        pythoncom.CoInitialize()
+        job = get_job(job_id)
+        if job is None or not _can_access_job(job):
+            return jsonify({'status': 'error', 'message': '导出任务不存在'}), 404
+        return jsonify({'status': 'ok', 'job': _job_info(job)})
+    except Exception as e:
+        logger.error(f"查询导出任务 {job_id} 出错: {str(e)}")
+        logger.error(traceback.format_exc())
+        return jsonify({'status': 'error', 'message': f'查询导出任务失败: {str(e)}'}), 500
+
+# 下载导出任务生成的文件（只有创建任务的用户和管理员可以下载）
+@comments_bp.route('/api/export-jobs/<job_id>/download', methods=['GET'])
+@login_required
+def download_export_job(job_id):
+    job = get_job(job_id)
+    if job is None or not _can_access_job(job) or job['status'] != STATUS_DONE or not job['filename']:
+        return jsonify({'status': 'error', 'message': '导出任务不存在或尚未完成'}), 404
+    
+    file_path = os.path.abspath(os.path.join(EXPORTS_FOLDER, job['filename']))
+    if not os.path.isfile(file_path):
+        logger.error(f"导出任务 {job_id} 的文件不存在: {file_path}")
+        return jsonify({'status': 'error', 'message': '导出文件不存在，请重新导出'}), 404
+    return send_file(file_path, as_attachment=True, download_name=job['filename'])
+
+# 取消导出任务
+@comments_bp.route('/api/export-jobs/<job_id>/cancel', methods=['POST'])
+@login_required
+def cancel_export_job(job_id):
+    try:
+        return _cancel_job(job_id)
+    except Exception as e:
+        logger.error(f"取消导出任务 {job_id} 出错: {str(e)}")
+        logger.error(traceback.format_exc())
+        return jsonify({'status': 'error', 'message': f'取消导出失败: {str(e)}'})
+
+# 是否使用LibreOffice转换PDF（没有Word的Linux等系统）
+def use_libreoffice():
+    return platform.system() != 'Windows' and libreoffice_available()
+
+# 批量转换Word文档为PDF
+def batch_convert_docx_to_pdf(docx_paths, output_dir, check_cancelled=None, retries=PDF_CONVERT_RETRIES):
+    """
+    一次转换一批Word文档，转换引擎只启动一次
+    
+    - Linux等系统：LibreOffice实例池
+    - Windows：同一个Word会话中逐个转换，每份文档有超时
+    - 都不可用时使用docx2pdf（按目录一次转换）
+    
+    Args:
+        docx_paths: 待转换的文档路径列表
+        output_dir: PDF输出目录
+        check_cancelled: 转换过程中定期调用，可抛出异常中止转换
+        retries: 失败文件的重试次数
+        
+    Returns:
+        dict: {docx路径: pdf路径或None}
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    if use_libreoffice():
+        return convert_with_libreoffice(docx_paths, output_dir, check_cancelled=check_cancelled, retries=retries)
+    
+    if WORD_COM_AVAILABLE:
+        results = {}
+        pending = list(docx_paths)
+        for attempt in range(retries + 1):
+            if attempt > 0:
+                logger.info(f"重试第{attempt}次转换 {len(pending)} 个文件")
+            results.update(convert_with_word(pending, output_dir, check_cancelled=check_cancelled))
+            pending = [docx_path for docx_path in pending if not results[docx_path]]
+            if not pending:
+                break
+        return results
+    
+    # docx2pdf 按目录转换时只启动一次Word
+    results = {docx_path: None for docx_path in docx_paths}
+    try:
+        from docx2pdf import convert
+    except ImportError:
+        logger.error("无法转换Word文档：未找到LibreOffice、pywin32或docx2pdf")
+        return results
+    
+    source_dirs = {os.path.dirname(os.path.abspath(docx_path)) for docx_path in docx_paths}
+    try:
+        if len(source_dirs) == 1:
+            convert(source_dirs.pop(), output_dir)
+        else:
+            for docx_path in docx_paths:
+                convert(docx_path, output_dir)
+    except Exception as e:
+        logger.error(f"docx2pdf转换失败: {str(e)}")
+    
+    for docx_path in docx_paths:
+        pdf_path = os.path.join(output_dir, os.path.splitext(os.path.basename(docx_path))[0] + '.pdf')
+        if os.path.exists(pdf_path) and os.path.getsize(pdf_path) > 0:
+            results[docx_path] = pdf_path
+    return results
+
+
+# 检查系统是否安装了Microsoft Word
+def check_word_installed():
+    """检查系统是否安装了Microsoft Word"""
+    logger.info("开始检查Microsoft Word是否安装")
+    try:
+        # 根据操作系统类型采用不同的检测方法
+        system = platform.system()
+        logger.info(f"当前操作系统: {system}")
         
-        # 直接使用win32com进行更可靠的转换，而不是依赖docx2pdf
-        try:
-            from win32com.client import Dispatch, constants
-            
-            # 确保输入文件路径是绝对路径
-            input_file_abs = os.path.abspath(input_file)
-            output_file_abs = os.path.abspath(output_file)
-            
-            logger.info(f"使用win32com直接转换: {input_file_abs} -> {output_file_abs}")
-            
-            # 创建Word应用实例
-            word = Dispatch('Word.Application')
-            word.Visible = False  # 不显示Word界面
-            
-            # 检查Word是否成功启动
-            if word is None:
-                logger.error("无法创建Word应用程序实例")
-                return False
-                
-            logger.info("Word应用程序实例创建成功")
-            
-            # 打开文档
+        if system == "Windows":
+            # Windows系统：尝试通过注册表检查
             try:
-                doc = word.Documents.Open(input_file_abs)
-                logger.info(f"成功打开文档: {input_file_abs}")
-            except Exception as e:
-                logger.error(f"打开文档失败: {str(e)}")
-                word.Quit()
-                return False
-            
-            # 另存为PDF
-            try:
-                # 检查目录是否存在
-                output_dir = os.path.dirname(output_file_abs)
-                if not os.path.exists(output_dir):
-                    os.makedirs(output_dir, exist_ok=True)
-                
-                # 使用不同的常量格式另存为PDF
-                try:
-                    # PDF格式常量(17)
-                    doc.SaveAs(output_file_abs, FileFormat=17)
-                    logger.info(f"使用FileFormat=17成功保存PDF: {output_file_abs}")
-                except Exception as save_error:
-                    logger.warning(f"使用FileFormat=17保存失败: {str(save_error)}，尝试使用wdFormatPDF")
-                    try:
-                        # 尝试使用常量名
-                        doc.SaveAs(output_file_abs, FileFormat=constants.wdFormatPDF)
-                        logger.info(f"使用wdFormatPDF成功保存PDF: {output_file_abs}")
-                    except Exception as e:
-                        logger.error(f"所有保存方法都失败: {str(e)}")
-                        raise
+                import winreg
+                # 尝试打开Word注册表键
+                word_key = winreg.OpenKey(winreg.HKEY_LOCAL_MACHINE, r"SOFTWARE\Microsoft\Office\Word")
+                winreg.CloseKey(word_key)
+                logger.info("通过注册表确认Microsoft Word已安装")
+                return True
+            except ImportError:
+                logger.warning("无法导入winreg模块，将尝试通过COM接口检测Word")
             except Exception as e:
-                logger.error(f"保存PDF时出错: {str(e)}")
-                doc.Close(False)  # 不保存更改
-                word.Quit()
-                return False
-            finally:
-                # 关闭文档
-                try:
-                    doc.Close()
-                    logger.info("文档已关闭")
-                except:
-                    logger.warning("关闭文档时出错")
-            
-            # 退出Word
-            try:
-                word.Quit()
-                logger.info("Word应用已退出")
-            except:
-                logger.warning("退出Word时出错")
+                logger.warning(f"无法通过注册表检测Word: {str(e)}")
             
-        except ImportError:
-            # 如果win32com不可用，尝试使用docx2pdf
-            logger.warning("win32com不可用，回退到docx2pdf")
-            from docx2pdf import convert
-            logger.info(f"使用docx2pdf转换Word文件: {input_file} -> {output_file}")
-            convert(input_file, output_file)
-        
-        # 再次检查是否在转换过程中被取消
-        if request_id and is_export_cancelled(request_id):
-            logger.info(f"文件 {os.path.basename(input_file)} 转换完成，但请求已被取消")
-            # 如果已取消，尝试删除生成的文件
-            if os.path.exists(output_file):
+            # 尝试通过COM接口创建Word实例
+            if PYTHONCOM_AVAILABLE:
                 try:
-                    os.remove(output_file)
-                    logger.info(f"已删除已取消请求生成的文件: {output_file}")
+                    from win32com.client import Dispatch
+                    pythoncom.CoInitialize()
+                    word = Dispatch("Word.Application")
+                    word.Quit()
+                    pythoncom.CoUninitialize()
+                    logger.info("通过COM接口确认Microsoft Word已安装")
+                    return True
                 except Exception as e:
-                    logger.warning(f"无法删除已取消请求生成的文件: {output_file}, 错误: {str(e)}")
+                    logger.error(f"通过COM接口检测Word失败: {str(e)}")
+                    return False
+            else:
+                logger.warning("pythoncom模块不可用，无法通过COM接口检测Word")
+                return False
+        elif system == "Darwin":  # macOS
+            # 检查macOS上的Word应用位置
+            common_paths = [
+                "/Applications/Microsoft Word.app",
+                "/Applications/Microsoft Office/Microsoft Word.app"
+            ]
+            for path in common_paths:
+                if os.path.exists(path):
+                    logger.info(f"在路径 {path} 找到Microsoft Word")
+                    return True
+            logger.warning("在macOS上未找到Microsoft Word")
             return False
-        
-        # 验证文件是否成功创建
-        if os.path.exists(output_file):
-            file_size = os.path.getsize(output_file)
-            if file_size > 0:
-                logger.info(f"成功转换文件为PDF: {output_file}, 文件大小: {file_size} 字节")
+            
+        elif system == "Linux":
+            # Linux上使用LibreOffice
+            if libreoffice_available():
+                logger.info("在Linux上找到LibreOffice，可用于文档转换")
                 return True
             else:
-                logger.error(f"转换后的PDF文件大小为0: {output_file}")
+                logger.warning("在Linux上未找到LibreOffice")
                 return False
         else:
-            logger.error(f"转换后的PDF文件不存在: {output_file}")
+            logger.warning(f"未知操作系统类型: {system}，无法确定Word安装状态")
             return False
     except Exception as e:
-        logger.error(f"转换文件 {os.path.basename(input_file)} 失败: {str(e)}")
-        logger.error(f"错误详情: {traceback.format_exc()}")
+        logger.error(f"检查Word安装状态时出错: {str(e)}")
+        logger.error(traceback.format_exc())
         return False
+
+# 将Word报告压缩包转换为PDF报告压缩包
+def convert_reports_to_pdf(word_zip_path, pdf_zip_path, progress):
+    """
+    将Word报告压缩包中的每份报告转换为PDF
+    
+    Args:
+        word_zip_path: Word报告压缩包文件路径
+        pdf_zip_path: PDF报告压缩包的输出路径
+        progress: 导出任务进度句柄，用于报告转换进度和检查取消
+        
+    转换失败时抛出异常，任务被取消时抛出 ExportCancelled
+    """
+    # 检查是否安装了Word
+    word_installed = check_word_installed()
+    if not word_installed:
+        logger.warning("系统中未检测到Microsoft Word，PDF转换可能失败")
+        # 继续尝试，因为可能有其他方式转换
+    else:
+        logger.info("检测到Microsoft Word，将继续PDF转换")
+    
+    # 创建临时目录解压ZIP文件
+    with tempfile.TemporaryDirectory() as temp_dir:
+        # 解压ZIP文件
+        extract_dir = os.path.join(temp_dir, "extracted")
+        os.makedirs(extract_dir, exist_ok=True)
+        logger.info(f"解压ZIP文件到: {extract_dir}")
+        
+        with zipfile.ZipFile(word_zip_path, 'r') as zipf:
+            file_list = zipf.namelist()
+            logger.info(f"ZIP文件中包含的文件: {file_list}")
+            zipf.extractall(extract_dir)
+        
+        # 检查是否有docx文件
+        docx_files = [f for f in os.listdir(extract_dir) if f.endswith('.docx')]
+        if not docx_files:
+            logger.error("未找到任何.docx文件需要转换")
+            raise Exception("解压后未找到任何Word文档文件")
+            
+        # 创建PDF输出目录
+        pdf_dir = os.path.join(temp_dir, "pdf")
+        os.makedirs(pdf_dir, exist_ok=True)
+        
+        # 设置转换计数器
+        total_files = len(docx_files)
+        successful_conversions = 0
+        
+        # 整批转换，转换引擎（LibreOffice实例池或Word）只启动一次，失败的文件由转换器重试
+        # 转换期间会被定期调用，同时刷新任务的进度时间，长时间转换不会被判定为中断
+        def check_cancelled():
+            progress.check_cancelled()
+            progress.update(message=f'正在将Word转换为PDF ({len(os.listdir(pdf_dir))}/{total_files})')
+        
+        logger.info(f"开始批量转换 {total_files} 个文件: {extract_dir} -> {pdf_dir}")
+        progress.update(force=True, message=f'正在将Word转换为PDF (0/{total_files})')
+        converted = batch_convert_docx_to_pdf([os.path.join(extract_dir, f) for f in docx_files], pdf_dir,
+                                              check_cancelled=check_cancelled)
+        progress.check_cancelled()
+        
+        pdf_files = []
+        for docx_file in docx_files:
+            pdf_path = converted.get(os.path.join(extract_dir, docx_file))
+            if pdf_path:
+                logger.info(f"转换成功: {os.path.basename(pdf_path)} (大小: {os.path.getsize(pdf_path)} 字节)")
+                pdf_files.append(os.path.basename(pdf_path))
+                successful_conversions += 1
+            else:
+                logger.warning(f"转换失败: {docx_file}")
+        
+        # 检查转换成功率
+        if len(pdf_files) == 0:
+            logger.error("没有成功转换的PDF文件")
+            raise Exception("未能成功转换任何PDF文件")
+        elif len(pdf_files) < total_files:
+            success_rate = (successful_conversions / total_files) * 100
+            logger.warning(f"部分文件转换失败: {successful_conversions}/{total_files} 成功 (成功率: {success_rate:.1f}%)")
+            # 如果成功率太低，回退到Word格式
+            if success_rate < 50:
+                logger.error(f"成功率低于50%，回退到Word格式")
+                raise Exception(f"PDF转换成功率太低 ({success_rate:.1f}%)，回退到Word格式")
+        else:
+            logger.info(f"所有文件均成功转换: {successful_conversions}/{total_files}")
+        
+        # 创建PDF文件的ZIP
+        with zipfile.ZipFile(pdf_zip_path, 'w') as zipf:
+            for pdf_file in pdf_files:
+                zipf.write(os.path.join(pdf_dir, pdf_file), pdf_file)
+        
+        logger.info(f"PDF转换成功，ZIP文件大小: {os.path.getsize(pdf_zip_path)} 字节")
+
+# 将导出结果写入exports目录
+def save_export_file(filename, chunks):
+    """
+    逐段写入导出文件，写完后再改为正式文件名，下载时不会读到写了一半的文件
+    
+    Args:
+        filename: exports目录下的文件名
+        chunks: 文件数据，bytes 或 bytes 的迭代器
+    """
+    os.makedirs(EXPORTS_FOLDER, exist_ok=True)
+    export_path = os.path.join(EXPORTS_FOLDER, filename)
+    partial_path = export_path + '.part'
+    try:
+        with open(partial_path, 'wb') as f:
+            if isinstance(chunks, bytes):
+                f.write(chunks)
+            else:
+                for chunk in chunks:
+                    f.write(chunk)
+        os.replace(partial_path, export_path)
     finally:
-        # 释放COM资源
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+    logger.info(f"报告生成成功，保存为: {export_path}")
+
+def iter_file_chunks(path, chunk_size=1024 * 1024):
+    """按块读取文件，配合 save_export_file 复制大文件时不必整个读入内存"""
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            yield chunk
+
+# 后台导出任务
+def use_native_pdf(template_id, template_path):
+    """PDF导出是否直接按模板版式生成（不经过Word转换）；模板文件被修改过时仍由Word文档转换"""
+    return (NATIVE_PDF_REPORTS and has_pdf_layout(template_id)
+            and layout_matches_template(template_id, template_path))
+
+def report_cache_key(exporter, students, comments_dict, grades_dict, template_id, settings, export_type):
+    """报告导出的缓存键：模板文件、导出设置、学生及其评语和成绩都相同时生成的压缩包相同"""
+    template_path = exporter.get_template_path(template_id)
+    native_pdf = export_type == 'pdf' and use_native_pdf(template_id, template_path)
+    template_version = export_cache.file_version(template_path)
+    # 模板中的"日期"占位符取导出当天的日期
+    cache_settings = {'settings': settings, 'native_pdf': native_pdf, 'date': datetime.date.today().isoformat()}
+    rows = [[student, comments_dict.get(str(student['id'])), grades_dict.get(str(student['id']))]
+            for student in students]
+    return export_cache.make_cache_key(f'reports_{export_type}', template_id, template_version, cache_settings, rows)
+
+def run_export_job(progress, students, comments_dict, grades_dict, template_id, settings, export_type, cache_key=None):
+    """在后台线程中生成报告压缩包并保存到exports目录，进度和结果记录到导出任务中"""
+    from utils.report_exporter import ReportExporter
+    
+    exporter = ReportExporter()
+    native_pdf = export_type == 'pdf' and use_native_pdf(template_id, exporter.get_template_path(template_id))
+    counts = {'done': 0, 'failed': 0}
+    
+    def on_report(student, success):
+        counts['done' if success else 'failed'] += 1
+        # 每个学生之后检查一次取消标记
+        progress.check_cancelled()
+        progress.update(done=counts['done'], failed=counts['failed'],
+                        current=student.get('name') or student.get('id'), message='正在生成报告')
+    
+    success, result = exporter.stream_reports(
+        students=students,
+        comments=comments_dict,
+        grades=grades_dict,
+        template_id=template_id,
+        settings=settings,
+        on_report=on_report,
+        native_pdf=native_pdf
+    )
+    
+    if not success:
+        logger.error(f"导出报告失败: {result}")
+        progress.finish(STATUS_FAILED, f'导出报告失败: {result}', done=counts['done'], failed=counts['failed'])
+        return
+    
+    export_filename = f"student_reports_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}_{progress.job_id[:8]}.zip"
+    
+    if export_type != 'pdf' or native_pdf:
+        # 报告边生成边写入文件，内存中只保留当前这一份报告
+        save_export_file(export_filename, result)
+        if not counts['failed']:
+            export_cache.store(cache_key, export_filename)
+        progress.finish(STATUS_DONE, f"成功导出 {counts['done']} 个学生的{export_type}报告", export_filename,
+                        done=counts['done'], failed=counts['failed'])
+        return
+    
+    # PDF导出：先把全部Word报告逐段写入临时文件，再逐个转换
+    logger.info("开始PDF导出流程")
+    with tempfile.TemporaryDirectory() as work_dir:
+        word_zip_path = os.path.join(work_dir, 'reports_word.zip')
+        pdf_zip_path = os.path.join(work_dir, 'reports_pdf.zip')
+        with open(word_zip_path, 'wb') as f:
+            for chunk in result:
+                f.write(chunk)
+        progress.update(force=True, done=counts['done'], failed=counts['failed'], message='正在将Word转换为PDF')
+        
         try:
-            if PYTHONCOM_AVAILABLE:
-                logger.info(f"释放文件 {os.path.basename(input_file)} 的COM资源")
-                pythoncom.CoUninitialize()
-        except:
-            logger.warning("CoUninitialize失败，可能COM资源未正确初始化")
+            convert_reports_to_pdf(word_zip_path, pdf_zip_path, progress)
+        except ExportCancelled:
+            raise
+        except Exception as pdf_error:
+            # 记录转换失败详情，回退到Word格式
+            logger.error(f"PDF转换失败: {str(pdf_error)}")
+            logger.error(traceback.format_exc())
+            logger.info("将使用原始Word文档作为后备方案")
+            save_export_file(export_filename, iter_file_chunks(word_zip_path))
+            progress.finish(STATUS_DONE, f'PDF转换失败，但已成功导出Word版本报告: {str(pdf_error)[:200]}',
+                            export_filename, export_type='word', done=counts['done'], failed=counts['failed'])
+            return
+        
+        save_export_file(export_filename, iter_file_chunks(pdf_zip_path))
+    if not counts['failed']:
+        export_cache.store(cache_key, export_filename)
+    progress.finish(STATUS_DONE, f"成功导出 {counts['done']} 个学生的pdf报告", export_filename,
+                    done=counts['done'], failed=counts['failed'])
 
 # 导出报告API
 @comments_bp.route('/api/export-reports', methods=['POST'])
+@login_required
 def api_export_reports():
     try:
         # 获取请求数据
         data = request.get_json()
         
-        # 记录请求ID，用于支持取消功能
-        request_id = request.headers.get('X-Export-Request-ID')
-        if request_id:
-            logger.info(f"收到导出报告请求 [请求ID: {request_id}]: {data}")
-            # 将请求ID存储到活动请求字典中
-            with export_requests_lock:
-                active_export_requests[request_id] = {
-                    'status': 'processing',
-                    'started_at': datetime.datetime.now(),
-                    'cancelled': False
-                }
-        else:
-            logger.info(f"收到导出报告请求 (无请求ID): {data}")
+        logger.info("收到导出报告请求")
+        logger.debug("导出报告请求数据: %s", Payload(data))
         
         # 验证请求数据
         student_ids = data.get('studentIds', [])
@@ -872,7 +1296,8 @@ def api_export_reports():
             template_id = '泉州东海湾实验学校综合素质发展报告单'
             logger.info(f"未指定模板ID，将使用默认模板: {template_id}")
             
-        logger.info(f"导出学生: {student_ids}, 模板ID: {template_id}, 使用内置默认模板: {use_default_template}, 设置: {settings}")
+        logger.info(f"导出学生数量: {len(student_ids)}, 模板ID: {template_id}, 使用内置默认模板: {use_default_template}, 设置: {settings}")
+        logger.debug("导出学生: %s", Payload(student_ids))
             
         # 使用默认设置补充缺失的设置
         default_settings = {
@@ -900,91 +1325,22 @@ def api_export_reports():
         if not os.path.exists(template_path):
             return jsonify({'status': 'error', 'message': f'模板不存在: {template_id}'})
                 
-        # 查询学生数据
-        conn = get_db_connection()
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        
-        # 准备SQL查询
-        placeholders = ','.join(['?' for _ in student_ids])
-        
-        # 添加班级ID筛选，确保班主任只能导出本班级的学生
-        if current_user.is_admin:
-            # 管理员可以导出所有学生
-            query = f'SELECT * FROM students WHERE id IN ({placeholders})'
-            params = student_ids
-        else:
-            # 班主任只能导出本班级学生
-            query = f'SELECT * FROM students WHERE id IN ({placeholders}) AND class_id = ?'
-            params = student_ids + [current_user.class_id]
+        # 一次读取学生信息、评语和成绩
+        # 添加权限范围筛选，确保班主任只能导出本班级的学生（管理员不限制）
+        access_where, access_params = student_access_filter()
+        if not current_user.is_admin:
             logger.info(f"班主任模式：只导出班级ID为 {current_user.class_id} 的学生")
         
-        # 执行查询
-        cursor.execute(query, params)
-        students_rows = cursor.fetchall()
-        
-        # 转换成字典列表，确保字段非空
-        students = []
-        for row in students_rows:
-            student_dict = dict(row)
-            # 确保关键字段非空 - 这里补充空字符串而不是None
-            for key in ['id', 'name', 'gender', 'class']:
-                if key not in student_dict or student_dict[key] is None:
-                    student_dict[key] = ''
-            students.append(student_dict)
+        conn = get_db_connection()
+        try:
+            students, comments_dict, grades_dict = load_report_data(conn, student_ids, access_where, access_params)
+        finally:
+            conn.close()
             
         # 如果没有找到任何学生，返回错误
         if not students:
             logger.error(f"未找到任何符合条件的学生: {student_ids}")
             return jsonify({'status': 'error', 'message': '未找到所选学生数据，或者您没有权限导出这些学生的报告'})
-            
-        # 获取评语数据
-        comments_dict = {}
-        for student in students:
-            student_id = str(student['id'])  # 确保是字符串
-            # 评语直接从学生表中获取
-            cursor.execute('SELECT comments FROM students WHERE id = ? AND class_id = ?', 
-                          (student_id, student.get('class_id')))
-            row = cursor.fetchone()
-            if row and row['comments']:
-                comments_dict[student_id] = {'content': row['comments']}
-            else:
-                comments_dict[student_id] = {'content': ''}
-        
-        # 获取成绩数据
-        grades_dict = {}
-        for student in students:
-            student_id = str(student['id'])  # 确保是字符串
-            
-            try:
-                # 尝试从grades表获取成绩
-                cursor.execute('SELECT * FROM grades WHERE student_id = ?', (student_id,))
-                grades_row = cursor.fetchone()
-                
-                if grades_row:
-                    grades = dict(grades_row)
-                    # 移除不需要的字段
-                    if 'id' in grades: del grades['id']
-                    if 'student_id' in grades: del grades['student_id']
-                    grades_dict[student_id] = {'grades': grades}
-                else:
-                    # 尝试从students表获取成绩字段
-                    cursor.execute('SELECT yuwen, shuxue, yingyu, daof, kexue, tiyu, yinyue, meishu, laodong, xinxi, zonghe, shufa FROM students WHERE id = ? AND class_id = ?', (student_id, student.get('class_id')))
-                    grades_row = cursor.fetchone()
-                    
-                    if grades_row:
-                        grades = dict(grades_row)
-                        grades_dict[student_id] = {'grades': grades}
-                    else:
-                        # 都没有成绩数据，使用空成绩
-                        grades_dict[student_id] = {'grades': {}}
-            except sqlite3.OperationalError as e:
-                # 处理表不存在或列不存在的情况
-                logger.warning(f"获取成绩时出错: {str(e)}, 将使用空成绩数据")
-                grades_dict[student_id] = {'grades': {}}
-        
-        # 关闭数据库连接
-        conn.close()
         
         # 生成报告
         try:
@@ -997,7 +1353,11 @@ def api_export_reports():
                 logger.info("依赖检查: docxtpl和docx库已安装")
                 
                 # 如果是PDF导出，检查PDF相关依赖
-                if export_type == 'pdf':
+                if export_type == 'pdf' and use_native_pdf(template_id, template_path):
+                    logger.info("依赖检查: 将按模板版式直接生成PDF")
+                elif export_type == 'pdf' and use_libreoffice():
+                    logger.info("依赖检查: 将使用LibreOffice转换PDF")
+                elif export_type == 'pdf':
                     try:
                         from docx2pdf import convert
                         logger.info("依赖检查: docx2pdf库已安装")
@@ -1005,7 +1365,7 @@ def api_export_reports():
                         logger.error(f"缺少PDF导出依赖: {str(e)}")
                         return jsonify({
                             'status': 'error', 
-                            'message': f'PDF报告导出失败: 缺少必要依赖，请安装 docx2pdf 库'
+                            'message': f'PDF报告导出失败: 缺少必要依赖，请安装 docx2pdf 库或 LibreOffice'
                         })
             except ImportError as e:
                 logger.error(f"缺少必要依赖: {str(e)}")
@@ -1015,310 +1375,37 @@ def api_export_reports():
                 })
             
             logger.info(f"开始生成报告，学生数量: {len(students)}")
-            logger.info(f"学生数据示例: {students[0] if students else '无'}")
-            logger.info(f"评语数据: {comments_dict}")
-            logger.info(f"成绩数据: {grades_dict}")
+            logger.debug("学生数据示例: %s", Payload(students[0] if students else '无'))
+            logger.debug("评语数据: %s", Payload(comments_dict))
+            logger.debug("成绩数据: %s", Payload(grades_dict))
             
-            exporter = ReportExporter()
-            success, result = exporter.export_reports(
-                students=students,
-                comments=comments_dict,
-                grades=grades_dict,
-                template_id=template_id,
-                settings=settings
-            )
+            # 创建导出任务，报告由后台线程生成，请求立即返回任务ID，前端通过 /api/export-jobs/<任务ID> 查询进度
+            job_id = create_job(current_user.id, export_type, len(students))
             
-            if not success:
-                logger.error(f"导出报告失败: {result}")
-                return jsonify({'status': 'error', 'message': f'导出报告失败: {result}'})
-            
-            # 检查系统是否安装了Microsoft Word
-            def check_word_installed():
-                """检查系统是否安装了Microsoft Word"""
-                logger.info("开始检查Microsoft Word是否安装")
-                try:
-                    # 根据操作系统类型采用不同的检测方法
-                    system = platform.system()
-                    logger.info(f"当前操作系统: {system}")
-                    
-                    if system == "Windows":
-                        # Windows系统：尝试通过注册表检查
-                        try:
-                            import winreg
-                            # 尝试打开Word注册表键
-                            word_key = winreg.OpenKey(winreg.HKEY_LOCAL_MACHINE, r"SOFTWARE\Microsoft\Office\Word")
-                            winreg.CloseKey(word_key)
-                            logger.info("通过注册表确认Microsoft Word已安装")
-                            return True
-                        except ImportError:
-                            logger.warning("无法导入winreg模块，将尝试通过COM接口检测Word")
-                        except Exception as e:
-                            logger.warning(f"无法通过注册表检测Word: {str(e)}")
-                        
-                        # 尝试通过COM接口创建Word实例
-                        if PYTHONCOM_AVAILABLE:
-                            try:
-                                from win32com.client import Dispatch
-                                pythoncom.CoInitialize()
-                                word = Dispatch("Word.Application")
-                                word.Quit()
-                                pythoncom.CoUninitialize()
-                                logger.info("通过COM接口确认Microsoft Word已安装")
-                                return True
-                            except Exception as e:
-                                logger.error(f"通过COM接口检测Word失败: {str(e)}")
-                                return False
-                        else:
-                            logger.warning("pythoncom模块不可用，无法通过COM接口检测Word")
-                            return False
-                    elif system == "Darwin":  # macOS
-                        # 检查macOS上的Word应用位置
-                        common_paths = [
-                            "/Applications/Microsoft Word.app",
-                            "/Applications/Microsoft Office/Microsoft Word.app"
-                        ]
-                        for path in common_paths:
-                            if os.path.exists(path):
-                                logger.info(f"在路径 {path} 找到Microsoft Word")
-                                return True
-                        logger.warning("在macOS上未找到Microsoft Word")
-                        return False
-                        
-                    elif system == "Linux":
-                        # Linux上可能使用LibreOffice
-                        try:
-                            import subprocess
-                            result = subprocess.run(["which", "libreoffice"], capture_output=True, text=True)
-                            if result.returncode == 0:
-                                logger.info("在Linux上找到LibreOffice，可用于文档转换")
-                                return True
-                            else:
-                                logger.warning("在Linux上未找到LibreOffice")
-                                return False
-                        except Exception as e:
-                            logger.error(f"检查LibreOffice时出错: {str(e)}")
-                            return False
-                    else:
-                        logger.warning(f"未知操作系统类型: {system}，无法确定Word安装状态")
-                        return False
-                except Exception as e:
-                    logger.error(f"检查Word安装状态时出错: {str(e)}")
-                    logger.error(traceback.format_exc())
-                    return False
-
-            # 如果是PDF导出，需要将Word文档转换为PDF
-            if export_type == 'pdf':
-                logging.info("开始PDF导出流程")
-                try:
-                    # 检查是否安装了Word
-                    word_installed = check_word_installed()
-                    if not word_installed:
-                        logger.warning("系统中未检测到Microsoft Word，PDF转换可能失败")
-                        # 继续尝试，因为可能有其他方式转换
-                    else:
-                        logger.info("检测到Microsoft Word，将继续PDF转换")
-                    
-                    # 保存原始Word文档结果作为回退
-                    original_word_result = result
-                    
-                    # 创建临时目录解压ZIP文件
-                    with tempfile.TemporaryDirectory() as temp_dir:
-                        # 检查请求是否已取消
-                        if request_id and is_export_cancelled(request_id):
-                            logger.info(f"PDF转换前检测到请求已取消: {request_id}")
-                            return jsonify({
-                                'status': 'warning',
-                                'message': '导出操作已被用户取消'
-                            })
-                            
-                        # 保存ZIP文件
-                        zip_path = os.path.join(temp_dir, "word_reports.zip")
-                        logger.info(f"保存ZIP文件到临时目录: {zip_path}")
-                        with open(zip_path, 'wb') as f:
-                            f.write(result)
-                        
-                        # 解压ZIP文件
-                        extract_dir = os.path.join(temp_dir, "extracted")
-                        os.makedirs(extract_dir, exist_ok=True)
-                        logger.info(f"解压ZIP文件到: {extract_dir}")
-                        
-                        # 解压ZIP文件
-                        with zipfile.ZipFile(zip_path, 'r') as zipf:
-                            file_list = zipf.namelist()
-                            logger.info(f"ZIP文件中包含的文件: {file_list}")
-                            zipf.extractall(extract_dir)
-                        
-                        # 检查是否有docx文件
-                        extracted_files = os.listdir(extract_dir)
-                        logger.info(f"解压后的文件列表: {extracted_files}")
-                        docx_files = [f for f in extracted_files if f.endswith('.docx')]
-                        
-                        if not docx_files:
-                            logger.error("未找到任何.docx文件需要转换")
-                            raise Exception("解压后未找到任何Word文档文件")
-                            
-                        # 再次检查请求是否已取消
-                        if request_id and is_export_cancelled(request_id):
-                            logger.info(f"解压后检测到请求已取消: {request_id}")
-                            return jsonify({
-                                'status': 'warning',
-                                'message': '导出操作已被用户取消'
-                            })
-                            
-                        # 创建PDF输出目录
-                        pdf_dir = os.path.join(temp_dir, "pdf")
-                        os.makedirs(pdf_dir, exist_ok=True)
-                        logger.info(f"创建PDF输出目录: {pdf_dir}")
-                        
-                        # 设置转换计数器
-                        total_files = len(docx_files)
-                        successful_conversions = 0
-                        
-                        # 转换DOCX文件为PDF
-                        pdf_files = []
-                        for i, docx_file in enumerate(docx_files):
-                            # 检查请求是否已取消
-                            if request_id and is_export_cancelled(request_id):
-                                logger.info(f"转换过程中检测到请求已取消: {request_id}")
-                                return jsonify({
-                                    'status': 'warning',
-                                    'message': '导出操作已被用户取消'
-                                })
-                                
-                            # 准备转换路径
-                            docx_path = os.path.join(extract_dir, docx_file)
-                            pdf_file = docx_file.replace('.docx', '.pdf')
-                            pdf_path = os.path.join(pdf_dir, pdf_file)
-                            
-                            # 执行转换，添加重试逻辑
-                            logger.info(f"开始转换 [{i+1}/{total_files}]: {docx_path} -> {pdf_path}")
-                            
-                            # 尝试最多3次转换
-                            success = False
-                            for attempt in range(3):
-                                try:
-                                    if attempt > 0:
-                                        logger.info(f"重试第{attempt+1}次转换: {docx_file}")
-                                    
-                                    # 执行转换
-                                    success = convert_docx_to_pdf(docx_path, pdf_path, request_id)
-                                    
-                                    if success:
-                                        logger.info(f"转换成功 (尝试 {attempt+1}): {docx_file}")
-                                        break
-                                    else:
-                                        logger.warning(f"转换失败 (尝试 {attempt+1}): {docx_file}")
-                                except Exception as e:
-                                    logger.error(f"转换异常 (尝试 {attempt+1}): {str(e)}")
-                                    if attempt == 2:  # 最后一次尝试
-                                        logger.error(f"转换 {docx_file} 的所有尝试均失败")
-                            
-                            if success and os.path.exists(pdf_path):
-                                pdf_size = os.path.getsize(pdf_path)
-                                if pdf_size > 0:
-                                    logger.info(f"转换成功: {pdf_file} (大小: {pdf_size} 字节)")
-                                    pdf_files.append(pdf_file)
-                                    successful_conversions += 1
-                                else:
-                                    logger.warning(f"PDF文件大小为0: {pdf_file}")
-                            else:
-                                logger.warning(f"转换失败: {docx_file}")
-                        
-                        # 检查转换成功率
-                        if len(pdf_files) == 0:
-                            logger.error("没有成功转换的PDF文件")
-                            raise Exception("未能成功转换任何PDF文件")
-                        elif len(pdf_files) < total_files:
-                            success_rate = (successful_conversions / total_files) * 100
-                            logger.warning(f"部分文件转换失败: {successful_conversions}/{total_files} 成功 (成功率: {success_rate:.1f}%)")
-                            # 如果成功率太低，可以考虑回退到Word格式
-                            if success_rate < 50:
-                                logger.error(f"成功率低于50%，回退到Word格式")
-                                raise Exception(f"PDF转换成功率太低 ({success_rate:.1f}%)，回退到Word格式")
-                        else:
-                            logger.info(f"所有文件均成功转换: {successful_conversions}/{total_files}")
-                            
-                        # 再次检查请求是否已取消
-                        if request_id and is_export_cancelled(request_id):
-                            logger.info(f"转换完成后检测到请求已取消: {request_id}")
-                            return jsonify({
-                                'status': 'warning',
-                                'message': '导出操作已被用户取消'
-                            })
-                            
-                        # 创建PDF文件的ZIP
-                        pdf_zip_path = os.path.join(temp_dir, "pdf_reports.zip")
-                        logger.info(f"创建PDF ZIP文件: {pdf_zip_path}")
-                        
-                        with zipfile.ZipFile(pdf_zip_path, 'w') as zipf:
-                            for pdf_file in pdf_files:
-                                file_path = os.path.join(pdf_dir, pdf_file)
-                                logger.info(f"添加PDF到ZIP: {file_path} -> {pdf_file}")
-                                zipf.write(file_path, pdf_file)
-                        
-                        # 读取最终的ZIP文件
-                        with open(pdf_zip_path, 'rb') as f:
-                            result = f.read()
-                            
-                        logger.info(f"PDF转换成功，ZIP文件大小: {len(result)} 字节")
-                        export_type = 'pdf'
-                        
-                except Exception as pdf_error:
-                    # 检查是否是用户取消导致的错误
-                    if isinstance(pdf_error, Exception) and "用户取消" in str(pdf_error):
-                        logger.info("用户取消了PDF转换")
-                        return jsonify({
-                            'status': 'warning',
-                            'message': '导出操作已被用户取消'
-                        })
-                        
-                    # 记录转换失败详情
-                    logger.error(f"PDF转换失败: {str(pdf_error)}")
-                    logger.error(traceback.format_exc())
-                    logger.info("将使用原始Word文档作为后备方案")
-                    
-                    # 回退到Word格式
-                    export_type = 'word'
-                    result = original_word_result
-                    
-                    # 如果这是直接下载模式，添加特殊头部
-                    if os.environ.get('EXPORT_DIRECT_DOWNLOAD', '1') == '1':
-                        response = make_response(result)
-                        response.headers['Content-Type'] = 'application/zip'
-                        response.headers['Content-Disposition'] = f'attachment; filename=student_reports_word_{datetime.datetime.now().strftime("%Y%m%d_%H%M%S")}.zip'
-                        response.headers['X-PDF-Conversion-Failed'] = 'true'
-                        response.headers['X-PDF-Conversion-Error'] = str(pdf_error)[:200]  # 限制错误消息长度
-                        logger.info("返回带有PDF转换失败标记的Word文档")
-                        return response
-            
-            # 直接返回文件
-            if os.environ.get('EXPORT_DIRECT_DOWNLOAD', '1') == '1':
-                logger.info("使用直接下载模式")
-                response = make_response(result)
-                response.headers['Content-Type'] = 'application/zip'
-                file_ext = 'pdf' if export_type == 'pdf' else 'docx'
-                response.headers['Content-Disposition'] = f'attachment; filename=student_reports_{datetime.datetime.now().strftime("%Y%m%d_%H%M%S")}.zip'
-                return response
-            
-            # 保存导出文件
-            file_ext = 'pdf' if export_type == 'pdf' else 'docx'
-            export_filename = f"student_reports_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.zip"
-            export_path = os.path.join('exports', export_filename)
-            
-            # 确保exports目录存在
-            os.makedirs('exports', exist_ok=True)
-            
-            # 写入文件
-            with open(export_path, 'wb') as f:
-                f.write(result)
+            # 数据和设置都没有变化时直接使用上次生成的压缩包，任务立即完成
+            cache_key = report_cache_key(exporter, students, comments_dict, grades_dict, template_id, settings, export_type)
+            cached_filename = export_cache.lookup(cache_key)
+            if cached_filename:
+                JobProgress(job_id).finish(STATUS_DONE, f'成功导出 {len(students)} 个学生的{export_type}报告（数据未变化，使用已生成的文件）',
+                                           cached_filename, done=len(students))
+                return jsonify({
+                    'status': 'ok',
+                    'jobId': job_id,
+                    'total': len(students),
+                    'cached': True,
+                    'message': f'学生数据未变化，直接使用已生成的{export_type}报告'
+                }), 202
             
-            logger.info(f"报告生成成功，保存为: {export_path}")
+            start_job(job_id, run_export_job, students, comments_dict, grades_dict, template_id, settings, export_type,
+                      cache_key)
+            logger.info(f"已创建导出任务: {job_id}")
             
             return jsonify({
                 'status': 'ok',
-                'filename': export_filename,
-                'message': f'成功导出 {len(students)} 个学生的{export_type}报告'
-            })
+                'jobId': job_id,
+                'total': len(students),
+                'message': f'已开始导出 {len(students)} 个学生的{export_type}报告'
+            }), 202
             
         except Exception as e:
             logger.error(f"导出报告时出错: {str(e)}")
@@ -1331,9 +1418,14 @@ def api_export_reports():
 
 # 初始化评语模块
 def init_comments(app):
-    # 只注册下载评语导出文件的路由，不创建表
+    # 只注册按文件名下载导出文件的路由，不创建表；
+    # 文件名可以猜到且不检查归属，只供管理员使用，其他用户通过 /api/export-jobs/<任务ID>/download 下载
     @app.route('/download/exports/<path:filename>', methods=['GET'])
+    @login_required
     def download_export(filename):
+        if not current_user.is_admin:
+            return jsonify({'status': 'error', 'message': '只有管理员可以按文件名下载导出文件'}), 403
+        
         EXPORTS_FOLDER = 'exports'
         app.logger.info(f"请求下载文件: {filename}, 从目录: {EXPORTS_FOLDER}")
         
@@ -1363,31 +1455,32 @@ def get_students():
     """
     try:
         conn = get_db_connection()
-        cursor = conn.cursor()
         
         # 获取当前用户信息
         if not current_user.is_authenticated:
             return jsonify({'error': '未登录'}), 401
+        
+        try:
+            list_args = parse_list_args(conn, request.args)
+        except ValueError as e:
+            conn.close()
+            return jsonify({'error': str(e)}), 400
             
         # 如果是管理员，返回所有学生
         if current_user.is_admin:
-            cursor.execute('SELECT * FROM students ORDER BY class, CAST(id AS INTEGER)')
+            students_list, next_after = query_students(conn, list_args, order_by='class, id_num')
+            total = count_students(conn)
         else:
             # 如果是班主任，只返回其班级的学生
-            cursor.execute('SELECT * FROM students WHERE class_id = ? ORDER BY CAST(id AS INTEGER)', (current_user.class_id,))
-            
-        students = cursor.fetchall()
+            students_list, next_after = query_students(conn, list_args, 'class_id = ?', (current_user.class_id,))
+            total = count_students(conn, current_user.class_id)
         conn.close()
-        
-        # 转换为字典列表
-        students_list = []
-        for student in students:
-            student_dict = dict(student)
-            students_list.append(student_dict)
             
         return jsonify({
             'status': 'ok',
-            'students': students_list
+            'students': students_list,
+            'total': total,
+            'next_after': next_after
         })
     except Exception as e:
         logger.error(f"获取学生列表时出错: {str(e)}")
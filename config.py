@@ -4,7 +4,78 @@ import os
 UPLOAD_FOLDER = 'uploads'
 TEMPLATE_FOLDER = 'templates'
 EXPORTS_FOLDER = 'exports'
-DATABASE = 'students.db'
+# 数据库文件路径，可通过环境变量 CLASS_MASTER_DB 指定
+DATABASE = os.environ.get('CLASS_MASTER_DB', 'students.db')
+
+# SQLite调优参数，连接打开时应用（journal_mode会持久化到数据库文件，启动时设置一次）
+SQLITE_PRAGMAS = {
+    'journal_mode': os.environ.get('CLASS_MASTER_DB_JOURNAL_MODE', 'WAL'),  # WAL模式下读写互不阻塞
+    'synchronous': 'NORMAL',      # WAL模式下NORMAL已足够安全
+    'busy_timeout': int(os.environ.get('CLASS_MASTER_DB_BUSY_TIMEOUT', 10000)),  # 等待写锁的毫秒数
+    'cache_size': -16000,         # 负数表示KB，约16MB页缓存
+    'mmap_size': 134217728,       # 128MB内存映射读取
+    'temp_store': 'MEMORY',       # 临时表和排序使用内存
+}
+
+# 日志配置：全局级别、各模块级别（环境变量格式 "模块=级别,模块=级别"）和请求数据在日志中的最大长度
+LOG_FILE = os.path.join('logs', 'root_server.log')
+LOG_LEVEL = os.environ.get('CLASS_MASTER_LOG_LEVEL', 'INFO')
+LOG_LEVELS = {
+    'werkzeug': 'WARNING',
+}
+LOG_LEVELS.update(
+    item.split('=', 1) for item in os.environ.get('CLASS_MASTER_LOG_LEVELS', '').split(',') if '=' in item
+)
+LOG_PAYLOAD_LIMIT = 500
+
+# 登录用户缓存：每个进程最多缓存的用户数和缓存秒数
+# 多进程部署时其他进程的缓存最迟在过期后失效
+USER_CACHE_SIZE = 256
+USER_CACHE_TTL = int(os.environ.get('CLASS_MASTER_USER_CACHE_TTL', 60))
+
+# 批量导出报告的渲染进程数（1表示在请求进程中串行渲染）和启用并行渲染的最少学生数
+# 进程总数：每个 gunicorn 工作进程（gunicorn_conf.py 的 workers）各有一个渲染进程池和一个 LibreOffice 实例池，
+# 整台服务器约 workers × (1 + REPORT_RENDER_WORKERS + PDF_CONVERT_WORKERS) 个进程，默认配置下为 4 × (1 + 4 + 2) = 28 个；
+# 渲染是纯CPU计算，workers × REPORT_RENDER_WORKERS 超过CPU核数不会更快，核数较少的服务器应调小
+REPORT_RENDER_WORKERS = int(os.environ.get('CLASS_MASTER_REPORT_WORKERS', min(4, os.cpu_count() or 1)))
+REPORT_PARALLEL_MIN_STUDENTS = 8
+
+# Linux上PDF转换使用的LibreOffice：可执行文件路径（默认从PATH查找soffice）、常驻实例数、每份文档超时秒数和失败重试次数
+SOFFICE_PATH = os.environ.get('CLASS_MASTER_SOFFICE')
+PDF_CONVERT_WORKERS = int(os.environ.get('CLASS_MASTER_PDF_WORKERS', 2))
+PDF_CONVERT_TIMEOUT = int(os.environ.get('CLASS_MASTER_PDF_TIMEOUT', 60))
+PDF_CONVERT_RETRIES = 2
+
+# 有版式描述的报告模板导出PDF时直接用ReportLab生成，不经过Word转换（设为0时总是先生成Word再转换）
+# 模板文件被修改过、与版式描述对应的模板不同时，仍先生成Word再转换
+NATIVE_PDF_REPORTS = os.environ.get('CLASS_MASTER_NATIVE_PDF', '1') != '0'
+
+# PDF中文字体子集缓存的条目数（0表示不缓存），同一批学生反复导出PDF时不再重复提取字体子集
+PDF_FONT_SUBSET_CACHE = int(os.environ.get('CLASS_MASTER_PDF_SUBSET_CACHE', 0))
+
+# 导出文件缓存：数据未变化时直接返回上次生成的文件；exports目录的大小上限（MB），超出时删除最久未用的文件
+EXPORT_CACHE_ENABLED = os.environ.get('CLASS_MASTER_EXPORT_CACHE', '1') != '0'
+EXPORT_CACHE_MAX_MB = int(os.environ.get('CLASS_MASTER_EXPORT_CACHE_MB', 500))
+
+# AI评语：DeepSeek接口地址（可指向本地测试服务）、批量生成时同时请求的学生数和每批最多的学生数
+DEEPSEEK_API_URL = os.environ.get('CLASS_MASTER_DEEPSEEK_URL', 'https://api.deepseek.com/v1/chat/completions')
+AI_COMMENT_CONCURRENCY = int(os.environ.get('CLASS_MASTER_AI_CONCURRENCY', 4))
+AI_COMMENT_BATCH_MAX = 100
+
+# DeepSeek接口返回429/5xx或连接失败时的重试次数，以及指数退避的初始和最长等待秒数
+AI_API_RETRIES = int(os.environ.get('CLASS_MASTER_AI_RETRIES', 3))
+AI_API_BACKOFF = 1.0
+AI_API_BACKOFF_MAX = 30.0
+
+# DeepSeek接口限速（所有工作进程共用）：每分钟最多调用次数（0表示不限速）、空闲后可连续调用的次数、最长排队秒数
+AI_RATE_LIMIT = int(os.environ.get('CLASS_MASTER_AI_RATE_LIMIT', 60))
+AI_RATE_BURST = int(os.environ.get('CLASS_MASTER_AI_RATE_BURST', 5))
+AI_RATE_MAX_WAIT = int(os.environ.get('CLASS_MASTER_AI_RATE_MAX_WAIT', 30))
+
+# AI评语结果缓存：相同输入（学生特点、风格、语气、字数）直接返回上次生成的评语；有效期（小时）和最多缓存的条目数
+AI_COMMENT_CACHE_ENABLED = os.environ.get('CLASS_MASTER_AI_CACHE', '1') != '0'
+AI_COMMENT_CACHE_TTL_HOURS = int(os.environ.get('CLASS_MASTER_AI_CACHE_TTL', 24 * 7))
+AI_COMMENT_CACHE_MAX = int(os.environ.get('CLASS_MASTER_AI_CACHE_MAX', 5000))
 
 # 确保所有必要的文件夹存在
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
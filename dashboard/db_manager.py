@@ -2,20 +2,18 @@
 import sqlite3
 import os
 import datetime
+from database import get_db_connection
 
 class DashboardManager:
     """首页仪表盘数据管理器"""
     
-    def __init__(self, db_path='students.db'):
+    def __init__(self, db_path=None):
         """初始化数据库连接"""
         self.db_path = db_path
         
     def get_db_connection(self):
         """获取数据库连接"""
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
-        conn.execute('PRAGMA foreign_keys = ON')  # 启用外键约束
-        return conn
+        return get_db_connection(self.db_path)
     
     def get_current_class(self, user=None):
         """获取当前班级"""
@@ -4,20 +4,19 @@ import json
 import os
 import datetime
 from flask import jsonify, request
+from database import get_db_connection
 
 class TodoManager:
     """待办事项管理模块，支持简化版番茄时钟功能"""
     
-    def __init__(self, db_path='students.db'):
+    def __init__(self, db_path=None):
         """初始化待办事项管理器"""
         self.db_path = db_path
         self._ensure_todo_table()
     
     def get_db_connection(self):
         """获取数据库连接"""
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
-        return conn
+        return get_db_connection(self.db_path)
     
     def _ensure_todo_table(self):
         """确保待办事项表存在"""
@@ -1,23 +1,319 @@
+# -*- coding: utf-8 -*-
+"""
+数据库连接管理模块
+
+所有模块统一通过 get_db_connection() 获取 SQLite 连接：
+- 在 Flask 请求（应用上下文）内，同一请求共享一个物理连接，请求结束时由 teardown 统一关闭；
+- 在请求之外（启动初始化、脚本、后台线程），每次返回一个独立连接，close() 时真正关闭。
+
+连接打开时只执行一次 PRAGMA 配置，调用方无需再重复设置；调优参数见 config.SQLITE_PRAGMAS。
+"""
+
+import re
 import sqlite3
 import logging
+from flask import g, has_app_context
+from config import DATABASE, SQLITE_PRAGMAS
 
 logger = logging.getLogger(__name__)
 
-def get_db_connection():
-    """获取数据库连接"""
-    conn = sqlite3.connect('students.db')
+# 持久化到数据库文件的PRAGMA，只在启动检查时设置一次
+PERSISTENT_PRAGMAS = ('journal_mode',)
+
+# 连接打开时执行一次的PRAGMA
+CONNECTION_PRAGMAS = {
+    'foreign_keys': 'ON',  # 启用外键约束
+}
+CONNECTION_PRAGMAS.update({
+    name: value for name, value in SQLITE_PRAGMAS.items() if name not in PERSISTENT_PRAGMAS
+})
+
+# PRAGMA查询结果为数字时对应的名称
+_PRAGMA_VALUE_NAMES = {
+    'synchronous': {0: 'OFF', 1: 'NORMAL', 2: 'FULL', 3: 'EXTRA'},
+    'temp_store': {0: 'DEFAULT', 1: 'FILE', 2: 'MEMORY'},
+    'foreign_keys': {0: 'OFF', 1: 'ON'},
+}
+
+# 启动检查结果，由 check_database_settings() 填充
+DATABASE_SETTINGS_CHECK = {}
+
+# students表的索引，对应各接口按班级筛选、按学号数值排序和按更新时间排序的查询
+# id_num 是学号的整数排序键，列表查询使用 ORDER BY id_num 直接走索引
+STUDENTS_INDEXES = {
+    'idx_students_class_id_sort': 'students (class_id, id_num)',
+    'idx_students_class_sort': 'students (class, id_num)',
+    'idx_students_class_id_id': 'students (class_id, id)',
+    'idx_students_id_sort': 'students (id_num)',
+    'idx_students_updated_at': 'students (updated_at)',
+}
+
+# 已被替换的旧索引（基于 CAST(id AS INTEGER) 表达式），迁移时删除
+OBSOLETE_INDEXES = (
+    'idx_students_class_id_num',
+    'idx_students_class_num',
+    'idx_students_id_num',
+)
+
+_ID_NUM_PATTERN = re.compile(r'[ \t\n\r\f]*([+-]?[0-9]+)')
+_INT64_MAX = 2 ** 63 - 1
+
+
+def _connect(db_path):
+    """打开物理连接并应用PRAGMA配置"""
+    busy_timeout = SQLITE_PRAGMAS.get('busy_timeout', 5000)
+    conn = sqlite3.connect(db_path, timeout=busy_timeout / 1000)
     conn.row_factory = sqlite3.Row
-    conn.execute('PRAGMA foreign_keys = ON')  # 启用外键约束
+    for name, value in CONNECTION_PRAGMAS.items():
+        conn.execute(f'PRAGMA {name} = {value}')
     return conn
 
+
+class ConnectionHandle:
+    """
+    数据库连接句柄，接口与 sqlite3.Connection 保持一致
+
+    每个调用方拿到自己的句柄，row_factory 只作用于该句柄创建的游标，
+    因此不同模块在共享连接上设置 row_factory 不会互相影响。
+    与 sqlite3.Connection 一样，row_factory 默认为None（查询结果为元组）。
+    """
+
+    def __init__(self, conn, shared=None, row_factory=None):
+        self._conn = conn
+        self._shared = shared
+        self._closed = False
+        self.row_factory = row_factory
+
+    def cursor(self):
+        cursor = self._conn.cursor()
+        cursor.row_factory = self.row_factory
+        return cursor
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        return self.cursor().executescript(sql_script)
+
+    def close(self):
+        """释放句柄；共享连接在请求结束时才真正关闭"""
+        if self._closed:
+            return
+        self._closed = True
+        if self._shared is None:
+            self._conn.close()
+        else:
+            self._shared.release()
+
+    def __enter__(self):
+        self._conn.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        return self._conn.__exit__(exc_type, exc_value, tb)
+
+    def __getattr__(self, name):
+        # commit / rollback / in_transaction 等直接转发给底层连接
+        return getattr(self._conn, name)
+
+
+class _SharedConnection:
+    """请求内共享的物理连接，按句柄计数"""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.refs = 0
+
+    def acquire(self, row_factory=None):
+        self.refs += 1
+        return ConnectionHandle(self.conn, self, row_factory)
+
+    def release(self):
+        self.refs -= 1
+        # 与真正关闭连接的语义保持一致：最后一个句柄释放时丢弃未提交的修改
+        if self.refs <= 0 and self.conn.in_transaction:
+            self.conn.rollback()
+
+
+def get_db_connection(db_path=None, row_factory=sqlite3.Row):
+    """
+    获取数据库连接
+
+    Args:
+        db_path: 数据库文件路径，默认使用配置中的 DATABASE
+        row_factory: 句柄的 row_factory，默认 sqlite3.Row；
+            原来直接用 sqlite3.connect 打开连接、按元组读取结果的调用方传 None
+
+    Returns:
+        ConnectionHandle: 用法与 sqlite3.Connection 相同，用完后调用 close()
+    """
+    db_path = db_path or DATABASE
+
+    if not has_app_context():
+        return ConnectionHandle(_connect(db_path), row_factory=row_factory)
+
+    connections = g.setdefault('_db_connections', {})
+    shared = connections.get(db_path)
+    if shared is None:
+        shared = connections[db_path] = _SharedConnection(_connect(db_path))
+    return shared.acquire(row_factory)
+
+
+def close_db(exception=None):
+    """关闭当前请求打开的所有共享连接"""
+    if not has_app_context():
+        return
+    connections = g.pop('_db_connections', None)
+    if not connections:
+        return
+    for db_path, shared in connections.items():
+        try:
+            shared.conn.close()
+        except sqlite3.Error as e:
+            logger.error(f"关闭数据库连接 {db_path} 时出错: {e}")
+
+
+def read_database_settings(conn):
+    """读取连接上当前生效的PRAGMA配置"""
+    settings = {}
+    for name in list(SQLITE_PRAGMAS) + ['foreign_keys']:
+        try:
+            value = conn.execute(f'PRAGMA {name}').fetchone()[0]
+        except sqlite3.Error as e:
+            logger.warning(f"读取PRAGMA {name} 失败: {e}")
+            continue
+        settings[name] = _PRAGMA_VALUE_NAMES.get(name, {}).get(value, value)
+    return settings
+
+
+def check_database_settings(db_path=None):
+    """
+    启动检查：设置持久化的PRAGMA（如WAL），并核对实际生效的配置
+
+    Returns:
+        dict: 包含 settings（生效值）和 mismatches（与配置不一致的项）
+    """
+    conn = get_db_connection(db_path)
+    try:
+        for name in PERSISTENT_PRAGMAS:
+            value = SQLITE_PRAGMAS.get(name)
+            if value is None:
+                continue
+            try:
+                conn.execute(f'PRAGMA {name} = {value}')
+            except sqlite3.Error as e:
+                logger.error(f"设置PRAGMA {name}={value} 失败: {e}")
+        settings = read_database_settings(conn)
+    finally:
+        conn.close()
+
+    mismatches = {}
+    for name, expected in SQLITE_PRAGMAS.items():
+        actual = settings.get(name)
+        if str(actual).upper() != str(expected).upper():
+            mismatches[name] = {'expected': expected, 'actual': actual}
+
+    if mismatches:
+        logger.warning(f"数据库配置与预期不一致: {mismatches}")
+    logger.info(f"数据库生效配置: {settings}")
+
+    DATABASE_SETTINGS_CHECK.clear()
+    DATABASE_SETTINGS_CHECK.update({
+        'settings': settings,
+        'mismatches': mismatches,
+    })
+    return DATABASE_SETTINGS_CHECK
+
+
+def student_id_num(student_id):
+    """
+    计算学号的整数排序键，规则与 SQLite 的 CAST(id AS INTEGER) 一致
+
+    例如 '007' -> 7，'12abc' -> 12，无法解析的学号 -> 0
+    """
+    if student_id is None:
+        return None
+    match = _ID_NUM_PATTERN.match(str(student_id))
+    if not match:
+        return 0
+    return max(-_INT64_MAX - 1, min(_INT64_MAX, int(match.group(1))))
+
+
+def ensure_student_id_num(conn):
+    """
+    迁移学号排序键：旧数据库的 students 表没有 id_num 列时添加，并回填与学号不一致的记录（可重复执行）
+
+    成绩、德育模块导入时就会按 id_num 查询学生生成模板，因此启动时要在导入这些模块之前调用。
+    students 表还不存在时（新数据库）不做任何事，建表时已包含 id_num 列。
+    """
+    columns = [row[1] for row in conn.execute('PRAGMA table_info(students)').fetchall()]
+    if not columns:
+        return
+    if 'id_num' not in columns:
+        logger.warning("添加缺失的列: id_num (INTEGER)")
+        conn.execute('ALTER TABLE students ADD COLUMN id_num INTEGER')
+    # 回填学号排序键（旧数据或脚本直接写入的记录）
+    cursor = conn.execute('UPDATE students SET id_num = CAST(id AS INTEGER) WHERE id_num IS NOT CAST(id AS INTEGER)')
+    if cursor.rowcount:
+        logger.info(f"已回填 {cursor.rowcount} 条学号排序键")
+    conn.commit()
+
+
+def ensure_indexes(conn):
+    """创建缺失的索引（可重复执行），并更新查询优化器的统计信息"""
+    cursor = conn.cursor()
+    cursor.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'students'")
+    existing = {row[0] for row in cursor.fetchall()}
+
+    for name in OBSOLETE_INDEXES:
+        if name in existing:
+            cursor.execute(f'DROP INDEX IF EXISTS {name}')
+            logger.info(f"已删除旧索引: {name}")
+
+    created = []
+    for name, target in STUDENTS_INDEXES.items():
+        if name in existing:
+            continue
+        try:
+            cursor.execute(f'CREATE INDEX IF NOT EXISTS {name} ON {target}')
+            created.append(name)
+        except sqlite3.Error as e:
+            logger.error(f"创建索引 {name} 时出错: {e}")
+    conn.commit()
+
+    if created:
+        logger.info(f"已创建索引: {created}")
+        cursor.execute('ANALYZE students')
+        conn.commit()
+    else:
+        cursor.execute('PRAGMA optimize')
+    return created
+
+
+def checkpoint_database(db_path=None):
+    """将WAL中的内容写回主数据库文件，备份或删除数据库文件前调用"""
+    conn = get_db_connection(db_path)
+    try:
+        conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    finally:
+        conn.close()
+
+
+def init_database(app):
+    """检查数据库配置，并注册请求结束时的连接清理"""
+    check_database_settings()
+    app.teardown_appcontext(close_db)
+
+
 def init_db():
     """初始化数据库"""
     logger.info("初始化数据库")
-    conn = sqlite3.connect('students.db')
-    conn.row_factory = sqlite3.Row
-    conn.execute('PRAGMA foreign_keys = ON')  # 启用外键约束
+    conn = get_db_connection()
     cursor = conn.cursor()
-    
+
     # 创建学生表 - 移除了birth_date、phone、address和notes字段
     cursor.execute('''
     CREATE TABLE IF NOT EXISTS students (
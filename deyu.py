@@ -15,6 +15,9 @@ from werkzeug.utils import secure_filename
 from flask_login import login_required, current_user
 from utils.class_filter import class_filter, user_can_access
 from utils.grades_manager import GradesManager
+from database import get_db_connection
+from utils.class_version import class_version_etag
+from logger_config import Payload
 import logging
 import pandas as pd
 import numpy as np
@@ -33,7 +36,6 @@ deyu_bp = Blueprint('deyu', __name__)
 
 # 配置
 UPLOAD_FOLDER = 'uploads'
-DATABASE = 'students.db'
 TEMPLATE_FOLDER = 'templates'  # 模板文件夹
 
 # 初始化德育模块
@@ -41,7 +43,7 @@ def init_deyu(app):
     """初始化德育维度模块"""
     logger.info("初始化德育维度模块")
     # 确保students表包含德育维度相关字段
-    conn = sqlite3.connect(DATABASE)
+    conn = get_db_connection()
     cursor = conn.cursor()
     
     # 检查是否所有必要的列都存在，如果不存在则添加
@@ -92,16 +94,10 @@ except Exception as e:
 def serve_template(filename):
     return send_from_directory(TEMPLATE_FOLDER, filename)
 
-# 获取数据库连接
-def get_db_connection():
-    conn = sqlite3.connect(DATABASE)
-    conn.row_factory = sqlite3.Row
-    conn.execute('PRAGMA foreign_keys = ON')  # 启用外键约束
-    return conn
-
 # 获取所有学生成绩
 @deyu_bp.route('/api/deyu', methods=['GET'])
 @login_required
+@class_version_etag('class_id')
 def get_all_deyu():
     try:
         class_id = request.args.get('class_id', '')
@@ -294,6 +290,7 @@ def get_all_deyu():
 # 获取单个学生成绩
 @deyu_bp.route('/api/deyu/<student_id>', methods=['GET'])
 @login_required
+@class_version_etag('class_id')
 def get_student_deyu(student_id):
     try:
         semester = request.args.get('semester', None)
@@ -354,8 +351,8 @@ def save_student_deyu(student_id):
     try:
         data = request.get_json()
         logger.info(f"收到保存德育维度请求，学生ID: {student_id}")
-        logger.info(f"请求数据: {data}")
-        logger.info(f"当前用户: {current_user.username}, ID: {current_user.id}, 角色: {'管理员' if current_user.is_admin else '普通用户'}, 关联班级: {current_user.class_id}")
+        logger.debug("请求数据: %s", Payload(data))
+        logger.debug(f"当前用户: {current_user.username}, ID: {current_user.id}, 角色: {'管理员' if current_user.is_admin else '普通用户'}, 关联班级: {current_user.class_id}")
         
         semester = data.get('semester', '上学期')
         class_id = data.get('class_id')
@@ -469,8 +466,8 @@ def save_student_deyu(student_id):
         
         # 执行更新 - 修改WHERE条件，同时使用id和class_id
         sql = f"UPDATE students SET {', '.join(update_fields)} WHERE id = ? AND class_id = ?"
-        logger.info(f"执行更新SQL: {sql}")
-        logger.info(f"更新参数: {update_params}")
+        logger.debug("执行更新SQL: %s", sql)
+        logger.debug("更新参数: %s", Payload(update_params))
         cursor.execute(sql, update_params)
         
         affected_rows = cursor.rowcount
@@ -15,6 +15,9 @@ from werkzeug.utils import secure_filename
 from flask_login import login_required, current_user
 from utils.class_filter import class_filter, user_can_access
 from utils.grades_manager import GradesManager
+from database import get_db_connection
+from utils.class_version import class_version_etag
+from utils.json_stream import stream_json_list
 import logging
 import pandas as pd
 import numpy as np
@@ -31,7 +34,6 @@ grades_bp = Blueprint('grades', __name__)
 
 # 配置
 UPLOAD_FOLDER = 'uploads'
-DATABASE = 'students.db'
 TEMPLATE_FOLDER = 'templates'  # 模板文件夹
 
 # 初始化成绩模块
@@ -57,16 +59,10 @@ except Exception as e:
 def serve_template(filename):
     return send_from_directory(TEMPLATE_FOLDER, filename)
 
-# 获取数据库连接
-def get_db_connection():
-    conn = sqlite3.connect(DATABASE)
-    conn.row_factory = sqlite3.Row
-    conn.execute('PRAGMA foreign_keys = ON')  # 启用外键约束
-    return conn
-
 # 获取所有学生成绩
 @grades_bp.route('/api/grades', methods=['GET'])
 @login_required
+@class_version_etag('class_id')
 def get_all_grades():
     try:
         semester = request.args.get('semester', '')
@@ -85,8 +81,9 @@ def get_all_grades():
                 })
             class_id = current_user.class_id
             
-        grades = grades_manager.get_all_grades(semester, class_id)
-        return jsonify({'status': 'ok', 'grades': grades})
+        # 边查询边输出，全校成绩也不会一次性载入内存
+        grades = grades_manager.iter_all_grades(semester, class_id)
+        return stream_json_list('grades', grades, {'status': 'ok'}, count_key=None)
     except Exception as e:
         logger.error(f'获取学生成绩时出错: {str(e)}')
         return jsonify({'status': 'error', 'message': f'获取学生成绩失败: {str(e)}'})
@@ -94,6 +91,7 @@ def get_all_grades():
 # 获取单个学生成绩
 @grades_bp.route('/api/grades/<student_id>', methods=['GET'])
 @login_required
+@class_version_etag('class_id')
 def get_student_grades(student_id):
     try:
         semester = request.args.get('semester', None)
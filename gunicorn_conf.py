@@ -34,4 +34,9 @@ loglevel = 'info'
 # 自定义设置项请写到该处
 # 最好以上面相同的格式 <注释 + 换行 + key = value> 进行书写， 
 # PS: gunicorn 的配置文件是python扩展形式，即".py"文件，需要注意遵从python语法，
-# 如：loglevel的等级是字符串作为配置的，需要用引号包裹起来
\ No newline at end of file
+# 如：loglevel的等级是字符串作为配置的，需要用引号包裹起来
+
+# 工作进程刚创建、还没有启动处理请求的线程时，创建报告渲染进程池（见 utils/report_pool.py）
+def post_fork(server, worker):
+    from utils.report_pool import start_render_pool
+    start_render_pool()
@@ -71,7 +71,8 @@ function initCommentList() {
     `;
     
     // 从服务器获取学生数据
-    fetch('/api/students')
+    // 评语页需要comments字段，列表接口默认不返回
+    fetch('/api/students?fields=id,name,gender,class,class_id,comments,updated_at')
         .then(response => {
             if (!response.ok) {
                 throw new Error(`服务器响应错误: ${response.status}`);
@@ -1362,7 +1363,7 @@ function showAICommentAssistant(studentId, studentName, classId) {
             const currentId = document.getElementById('currentStudentId').value;
             const currentClassId = document.getElementById('currentClassId').value;
             console.log('重新生成按钮点击，当前学生ID:', currentId, '班级ID:', currentClassId);
-            generateAIComment(currentId, currentClassId);
+            generateAIComment(currentId, currentClassId, true);
         });
     }
     
@@ -1381,7 +1382,8 @@ function showAICommentAssistant(studentId, studentName, classId) {
 }
 
 // 生成AI评语
-async function generateAIComment(studentId, classId) {
+// regenerate为true时（点击"重新生成"）跳过服务器端的评语缓存
+async function generateAIComment(studentId, classId, regenerate = false) {
     try {
         // 获取当前模态框
         const modal = document.getElementById('aiCommentAssistantModal');
@@ -1422,8 +1424,9 @@ async function generateAIComment(studentId, classId) {
         // 使用传入的classId参数，而不是当前用户的班级ID
         console.log('使用传入的班级ID进行AI生成:', classId);
 
-        // 发送请求
-        const response = await fetch('/api/generate-comment', {
+        // 流式请求：模型每生成一段文字就显示出来
+        // save为false：生成的评语先预览，点击"使用此评语"确认后再保存
+        const response = await fetch('/api/generate-comment/stream', {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json'
@@ -1438,28 +1441,33 @@ async function generateAIComment(studentId, classId) {
                 study_performance: studyPerformance,
                 hobbies: hobbies,
                 improvement: improvement,
-                additional_instructions: additionalInstructions
+                additional_instructions: additionalInstructions,
+                regenerate: regenerate,
+                save: false
             })
         });
 
         if (!response.ok) {
-            throw new Error(`HTTP错误! 状态: ${response.status}`);
+            let message = `HTTP错误! 状态: ${response.status}`;
+            try {
+                message = (await response.json()).message || message;
+            } catch (e) {
+                // 响应不是JSON，使用状态码提示
+            }
+            throw new Error(message);
         }
 
-        const data = await response.json();
-        console.log('评语生成结果:', data);
-
-        if (data.status === 'ok') {
-            // 显示生成的评语
-            const aiCommentContent = modal.querySelector('#aiCommentContent');
-            const aiCommentLength = modal.querySelector('#aiCommentLength');
-            
+        const aiCommentContent = modal.querySelector('#aiCommentContent');
+        const aiCommentLength = modal.querySelector('#aiCommentLength');
+        
+        // 显示（已生成部分的）评语
+        const showComment = (text) => {
             if (aiCommentContent) {
-                aiCommentContent.textContent = data.comment;
+                aiCommentContent.textContent = text;
             }
             
             if (aiCommentLength) {
-                aiCommentLength.textContent = `${data.comment.length}/${maxLength}`;
+                aiCommentLength.textContent = `${text.length}/${maxLength}`;
             }
             
             if (aiCommentPreview) {
@@ -1469,11 +1477,17 @@ async function generateAIComment(studentId, classId) {
             if (aiGeneratingIndicator) {
                 aiGeneratingIndicator.style.display = 'none';
             }
+        };
 
-            showNotification('评语生成成功', 'success');
-        } else {
-            throw new Error(data.message || '生成评语失败');
-        }
+        let partial = '';
+        const result = await readCommentStream(response, (text) => {
+            partial += text;
+            showComment(partial);
+        });
+        console.log('评语生成结果:', result);
+        
+        showComment(result.comment);
+        showNotification('评语生成成功', 'success');
     } catch (error) {
         console.error('生成AI评语时出错:', error);
         
@@ -1499,6 +1513,53 @@ async function generateAIComment(studentId, classId) {
     }
 }
 
+// 读取流式评语生成接口的SSE响应
+// 每收到一段文字调用onDelta(text)，生成完成时返回done事件的数据，生成失败时抛出错误
+async function readCommentStream(response, onDelta) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder('utf-8');
+    let buffer = '';
+
+    while (true) {
+        const { value, done } = await reader.read();
+        if (value) {
+            buffer += decoder.decode(value, { stream: true });
+        }
+
+        // 事件之间以空行分隔，最后一段可能不完整，留到下次处理
+        const events = buffer.split('\n\n');
+        buffer = done ? '' : events.pop();
+
+        for (const block of events) {
+            let event = 'message';
+            let dataText = '';
+            for (const line of block.split('\n')) {
+                if (line.startsWith('event:')) {
+                    event = line.slice(6).trim();
+                } else if (line.startsWith('data:')) {
+                    dataText += line.slice(5).trim();
+                }
+            }
+            if (!dataText) {
+                continue;
+            }
+
+            const payload = JSON.parse(dataText);
+            if (event === 'delta') {
+                onDelta(payload.text);
+            } else if (event === 'error') {
+                throw new Error(payload.message || '生成评语失败');
+            } else if (event === 'done') {
+                return payload;
+            }
+        }
+
+        if (done) {
+            throw new Error('评语生成中断，请重试');
+        }
+    }
+}
+
 // 使用AI生成的评语
 function useAIComment(studentId, classId) {
     console.log('使用AI评语:', studentId, classId);
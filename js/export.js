@@ -897,8 +897,7 @@ async function exportReports(exportType = 'word') {
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json',
-                    'Accept': 'application/json, application/zip', // 接受JSON或ZIP文件
-                    'X-Export-Request-ID': currentExportRequestId // 添加请求ID到头部
+                    'Accept': 'application/json'
                 },
                 body: JSON.stringify({
                     studentIds: selectedStudentIds,
@@ -914,219 +913,79 @@ async function exportReports(exportType = 'word') {
             // 请求完成，重置标志
             window.isExporting = false;
             
-            // 更新进度
-            updateProgress(60, exportType === 'pdf' ? '正在将Word转换为PDF...' : '正在处理响应...');
             console.log('服务器响应状态:', response.status);
-            console.log('服务器响应类型:', response.headers.get('Content-Type'));
             
-            // 检查响应是否成功
-            if (!response.ok) {
-                // 尝试读取错误信息
-                let errorMessage = '服务器返回错误状态: ' + response.status;
-                try {
-                    const errorData = await response.text();
-                    errorMessage = errorData || errorMessage;
-                } catch (e) {
-                    console.error('读取错误响应失败:', e);
-                }
-                
-                throw new Error(errorMessage);
+            // 服务器创建导出任务后立即返回任务ID，报告在后台生成
+            let result;
+            try {
+                result = await response.json();
+            } catch (jsonError) {
+                throw new Error('服务器返回错误状态: ' + response.status);
             }
+            console.log('服务器JSON响应:', result);
             
-            // 检查是否是直接文件下载
-            const contentType = response.headers.get('Content-Type');
-            if (contentType && contentType.includes('application/zip')) {
-                console.log('检测到ZIP文件响应，直接下载');
-                updateProgress(80, exportType === 'pdf' ? '正在准备下载PDF文件...' : '准备下载文件...');
-                
-                // 下载文件
-                const blob = await response.blob();
-                updateProgress(90, exportType === 'pdf' ? '正在下载PDF文件...' : '正在下载文件...');
-                const url = window.URL.createObjectURL(blob);
-                const a = document.createElement('a');
-                a.href = url;
-                a.download = `student_reports_${exportType}_` + new Date().toISOString().slice(0,10) + '.zip';
-                document.body.appendChild(a);
-                a.click();
-                
-                // 清理
-                setTimeout(() => {
-                    document.body.removeChild(a);
-                    window.URL.revokeObjectURL(url);
-                    window.isExporting = false; // 确保导出状态被重置
-                }, 100);
-                
-                updateProgress(100, '导出完成!', 'success');
+            if (!response.ok || result.status !== 'ok' || !result.jobId) {
+                throw new Error(result.message || '导出报告失败');
+            }
+            
+            // 之后的取消操作针对该导出任务
+            currentExportRequestId = result.jobId;
+            
+            // 轮询任务进度直到完成
+            const job = await waitForExportJob(result.jobId, exportType);
+            
+            if (job.status === 'cancelled') {
+                throw new DOMException('导出已取消', 'AbortError');
+            }
+            if (job.status !== 'done' || !job.downloadUrl) {
+                throw new Error(job.message || '导出报告失败');
+            }
+            
+            // 下载生成的文件
+            updateProgress(95, job.exportType === 'pdf' ? '正在下载PDF文件...' : '正在下载文件...');
+            console.log('正在下载文件:', job.filename);
+            const a = document.createElement('a');
+            a.href = job.downloadUrl;
+            a.download = job.filename;
+            document.body.appendChild(a);
+            a.click();
+            
+            // 等待一段时间后再移除元素
+            setTimeout(() => {
+                a.remove();
+            }, 1000);
+            
+            updateProgress(100, '导出完成!', 'success');
+            
+            // 延迟一秒后关闭进度条，让用户看到100%完成状态
+            setTimeout(() => {
+                // 隐藏进度模态框
+                hideProgressModal();
                 
-                // 延迟一秒后关闭进度条，让用户看到100%完成状态
-                setTimeout(() => {
-                    // 隐藏进度模态框
-                    hideProgressModal();
-                    
+                if (exportType === 'pdf' && job.exportType !== 'pdf') {
+                    // PDF转换失败，服务器回退为Word版本
+                    showNotification(job.message || 'PDF转换失败，但已成功导出Word版本报告', 'warning');
+                } else {
                     // 显示完成模态框
                     showExportCompleteModal(
                         `${exportType === 'pdf' ? 'PDF' : 'Word'}导出成功`, 
-                        `已成功导出${selectedStudentIds.length}份学生报告！`, 
+                        `已成功导出${job.done}份学生报告！${job.failed ? `（${job.failed}份失败）` : ''}`, 
                         'success'
                     );
-                    
-                    // 重置导出按钮
-                    resetExportButton(exportType);
-                }, 1000);
-                
-                return;
-            }
-            
-            // 如果不是文件下载，尝试解析JSON响应
-            try {
-                updateProgress(80, '处理服务器响应...');
-                
-                // 先检查响应内容是否为空
-                const clonedResponse = response.clone(); // 克隆响应以便多次读取
-                const responseText = await clonedResponse.text();
-                
-                // 如果响应为空但响应状态码是200，可能是成功的二进制文件下载
-                if ((!responseText || responseText.trim() === '') && response.ok) {
-                    console.log('服务器返回了空响应但状态码为200，可能是文件已经成功下载');
-                    updateProgress(100, '导出完成!');
-                    
-                    // 检查PDF转换失败的特殊头信息
-                    const pdfConversionFailed = response.headers.get('X-PDF-Conversion-Failed');
-                    if (pdfConversionFailed === 'true' && exportType === 'pdf') {
-                        // 延迟关闭进度条
-                        setTimeout(() => {
-                            if (progressModal) {
-                                progressModal.hide();
-                            }
-                            showNotification('PDF转换失败，但已成功导出Word版本报告', 'warning');
-                        }, 1000);
-                    } else {
-                        // 延迟关闭进度条
-                        setTimeout(() => {
-                            if (progressModal) {
-                                progressModal.hide();
-                            }
-                            showNotification('报告导出成功', 'success');
-                        }, 1000);
-                    }
-                    
-                    resetExportButton(exportType);
-                    return;
-                } else if (!responseText || responseText.trim() === '') {
-                    // 真正的空响应错误
-                    throw new Error('服务器返回了空响应');
-                }
-                
-                // 尝试解析JSON
-                let result;
-                try {
-                    result = JSON.parse(responseText);
-                } catch (jsonError) {
-                    // 如果无法解析为JSON但响应状态码是200，可能是文件已经成功下载
-                    if (response.ok) {
-                        console.log('JSON解析错误，但状态码为200，可能是文件已经成功下载');
-                        updateProgress(100, '导出完成!');
-                        
-                        setTimeout(() => {
-                            if (progressModal) {
-                                progressModal.hide();
-                            }
-                            showNotification('报告导出成功', 'success');
-                        }, 1000);
-                        
-                        resetExportButton(exportType);
-                        return;
-                    }
-                    
-                    console.error('JSON解析错误:', jsonError, '响应内容:', responseText);
-                    throw new Error('解析服务器响应失败: ' + jsonError.message);
                 }
                 
-                console.log('服务器JSON响应:', result);
-                
-                if (result.status === 'error') {
-                    throw new Error(result.message || '导出报告失败');
-                }
-                
-                // 处理警告状态 - 当PDF转换失败但提供了Word版本时
-                if (result.status === 'warning') {
-                    // 从服务器下载生成的文件
-                    updateProgress(90, '正在下载文件...');
-                    console.log('正在下载文件:', result.filename);
-                    const downloadUrl = `https://${window.location.host}/download/exports/${result.filename}`;
-                    
-                    // 创建下载链接并触发下载
-                    const a = document.createElement('a');
-                    a.href = downloadUrl;
-                    a.download = result.filename; 
-                    a.target = '_blank';
-                    document.body.appendChild(a);
-                    a.click();
-                    
-                    // 等待一段时间后再移除元素
-                    setTimeout(() => {
-                        a.remove();
-                    }, 1000);
-                    
-                    updateProgress(100, '导出完成!');
-                    
-                    // 延迟一秒后关闭进度条，让用户看到100%完成状态
-                    setTimeout(() => {
-                        if (progressModal) {
-                            progressModal.hide();
-                        }
-                        showNotification(result.message || 'PDF转换失败，但已成功导出Word版本报告', 'warning');
-                    }, 1000);
-                    
-                    resetExportButton(exportType);
-                    return;
-                }
-                
-                if (result.status === 'ok' && result.filename) {
-                    // 从服务器下载生成的文件
-                    updateProgress(90, '正在下载文件...');
-                    console.log('正在下载文件:', result.filename);
-                    const downloadUrl = `https://${window.location.host}/download/exports/${result.filename}`;
-                    
-                    // 创建下载链接并触发下载
-                    const a = document.createElement('a');
-                    a.href = downloadUrl;
-                    a.download = result.filename; 
-                    a.target = '_blank'; // 在新标签页中打开
-                    document.body.appendChild(a);
-                    a.click();
-                    
-                    // 等待一段时间后再移除元素
-                    setTimeout(() => {
-                        a.remove();
-                    }, 1000);
-                    
-                    updateProgress(100, '导出完成!');
-                    
-                    // 延迟一秒后关闭进度条，让用户看到100%完成状态
-                    setTimeout(() => {
-                        if (progressModal) {
-                            progressModal.hide();
-                        }
-                        showNotification(result.message || '报告导出成功', 'success');
-                    }, 1000);
-                } else {
-                    throw new Error('服务器未返回有效的下载信息');
-                }
-            } catch (jsonError) {
-                console.error('处理JSON响应时出错:', jsonError);
-                updateProgress(100, '导出失败: ' + jsonError.message, 'error');
-                
-                // 延迟一秒后关闭进度条，让用户看到错误状态
-                setTimeout(() => {
-                    if (progressModal) {
-                        progressModal.hide();
-                    }
-                }, 1500);
-                
-                throw new Error('导出处理失败: ' + jsonError.message);
-            }
+                // 重置导出按钮
+                resetExportButton(exportType);
+            }, 1000);
+            
+            currentExportRequestId = null;
+            return;
         } catch (fetchError) {
+            // 用户取消，交给外层按取消处理
+            if (fetchError.name === 'AbortError') {
+                throw fetchError;
+            }
+            
             console.error('请求或处理响应时出错:', fetchError);
             updateProgress(100, '导出失败: ' + fetchError.message, 'error');
                 
@@ -1176,6 +1035,42 @@ async function exportReports(exportType = 'word') {
     }
 }
 
+// 轮询导出任务进度，任务结束（完成、失败或取消）时返回任务信息
+async function waitForExportJob(jobId, exportType) {
+    while (true) {
+        // 已在前端取消
+        if (!abortController || abortController.signal.aborted) {
+            throw new DOMException('导出已取消', 'AbortError');
+        }
+        
+        const response = await fetch(`/api/export-jobs/${jobId}`, {
+            headers: { 'Accept': 'application/json' },
+            signal: abortController.signal
+        });
+        const result = await response.json();
+        if (!response.ok || result.status !== 'ok') {
+            throw new Error(result.message || '查询导出进度失败');
+        }
+        
+        const job = result.job;
+        if (!['pending', 'running'].includes(job.status)) {
+            return job;
+        }
+        
+        // 生成报告占 30%~80%，PDF转换占 80%~95%
+        const processed = job.done + job.failed;
+        let percent = 30 + Math.round(50 * (job.total ? processed / job.total : 0));
+        let message = `正在生成报告 (${processed}/${job.total})...`;
+        if (exportType === 'pdf' && job.message && job.message.startsWith('正在将Word转换为PDF')) {
+            percent = 85;
+            message = job.message + '...';
+        }
+        updateProgress(percent, message);
+        
+        await new Promise(resolve => setTimeout(resolve, 1000));
+    }
+}
+
 // 取消导出函数
 function cancelExport(requestId) {
     if (!requestId || requestId !== currentExportRequestId) {
@@ -1,13 +1,89 @@
+import os
+import atexit
 import logging
+import logging.handlers
+import queue
+from config import LOG_FILE, LOG_LEVEL, LOG_LEVELS, LOG_PAYLOAD_LIMIT
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# 后台写日志的监听器，setup_logger() 只启动一次
+_listener = None
+
+
+class Payload:
+    """
+    请求数据等大对象的日志包装，只有日志真正输出时才格式化，并截断到指定长度
+
+    用法: logger.debug("请求数据: %s", Payload(data))
+    """
+
+    __slots__ = ('value', 'limit')
+
+    def __init__(self, value, limit=None):
+        self.value = value
+        self.limit = LOG_PAYLOAD_LIMIT if limit is None else limit
+
+    def __str__(self):
+        text = str(self.value)
+        if self.limit and len(text) > self.limit:
+            return f"{text[:self.limit]}...(共{len(text)}字符，已截断)"
+        return text
+
+
+def _parse_level(level):
+    """'DEBUG' / 'info' / 10 等写法转换为日志级别，无法识别时使用INFO"""
+    if isinstance(level, int):
+        return level
+    value = logging.getLevelName(str(level).strip().upper())
+    return value if isinstance(value, int) else logging.INFO
+
 
 def setup_logger():
-    """配置日志"""
-    logging.basicConfig(
-        level=logging.DEBUG,
-        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-        handlers=[
-            logging.FileHandler("logs/root_server.log"),
-            logging.StreamHandler()
-        ]
-    )
+    """
+    配置日志
+
+    请求线程只把日志记录放进队列（QueueHandler），写文件和控制台由后台线程（QueueListener）完成；
+    全局级别由 LOG_LEVEL 控制，各模块级别可通过 LOG_LEVELS 单独设置。
+    """
+    global _listener
+    if _listener is not None:
+        return logging.getLogger(__name__)
+
+    log_dir = os.path.dirname(LOG_FILE)
+    if log_dir:
+        os.makedirs(log_dir, exist_ok=True)
+
+    formatter = logging.Formatter(LOG_FORMAT)
+    file_handler = logging.FileHandler(LOG_FILE, encoding='utf-8')
+    file_handler.setFormatter(formatter)
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    _listener = logging.handlers.QueueListener(log_queue, file_handler, stream_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+    root = logging.getLogger()
+    # 替换已有的处理器，避免同一条日志在请求线程里重复写文件
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    root.setLevel(_parse_level(LOG_LEVEL))
+
+    for name, level in LOG_LEVELS.items():
+        logging.getLogger(name).setLevel(_parse_level(level))
+
     return logging.getLogger(__name__)
+
+
+def setup_process_logger():
+    """
+    在 fork 出的子进程（如报告渲染进程）中重新配置日志
+
+    子进程继承了父进程的 QueueHandler，但后台监听线程不会随 fork 复制，需要重新启动。
+    """
+    global _listener
+    _listener = None
+    return setup_logger()
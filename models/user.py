@@ -1,7 +1,32 @@
+import time
 import sqlite3
+import logging
+import threading
+from collections import OrderedDict
 from flask_login import UserMixin
+from database import get_db_connection
+from config import USER_CACHE_SIZE, USER_CACHE_TTL
+
+logger = logging.getLogger(__name__)
+
+# 已登录用户缓存：用户ID -> (过期时间, User)，按最近使用顺序淘汰
+_user_cache = OrderedDict()
+_user_cache_lock = threading.Lock()
+
+
+def invalidate_user_cache(user_id=None):
+    """
+    修改用户信息后清除缓存
+    
+    Args:
+        user_id: 用户ID，为None时清空全部缓存（按班级批量修改用户时使用）
+    """
+    with _user_cache_lock:
+        if user_id is None:
+            _user_cache.clear()
+        else:
+            _user_cache.pop(str(user_id), None)
 
-DATABASE = 'students.db'
 
 class User(UserMixin):
     """用户模型，实现了Flask-Login需要的接口"""
@@ -17,21 +42,17 @@ class User(UserMixin):
             try:
                 # 尝试转换为整数，因为数据库中class_id是INTEGER
                 self.class_id = int(class_id)
-                print(f"用户{username}的class_id已转换为整数: {self.class_id}")
             except (ValueError, TypeError):
                 # 如果转换失败，保留原始值
                 self.class_id = class_id
-                print(f"用户{username}的class_id无法转换为整数，保留原值: {self.class_id}，类型: {type(self.class_id).__name__}")
+                logger.debug(f"用户{username}的class_id无法转换为整数，保留原值: {self.class_id}，类型: {type(self.class_id).__name__}")
         else:
             self.class_id = None
     
     @staticmethod
     def get_db_connection():
         """获取数据库连接"""
-        conn = sqlite3.connect(DATABASE)
-        conn.row_factory = sqlite3.Row
-        conn.execute('PRAGMA foreign_keys = ON')  # 启用外键约束
-        return conn
+        return get_db_connection()
     
     @classmethod
     def get_by_id(cls, user_id):
@@ -46,7 +67,6 @@ class User(UserMixin):
             if user_data:
                 # 记录从数据库获取的原始class_id值和类型
                 class_id = user_data['class_id']
-                print(f"从数据库获取到用户ID={user_id}的class_id={class_id}, 类型={type(class_id).__name__}")
                 
                 return cls(
                     id=user_data['id'],
@@ -59,6 +79,36 @@ class User(UserMixin):
         finally:
             conn.close()
     
+    @classmethod
+    def get_cached(cls, user_id):
+        """
+        通过用户ID获取用户（带缓存），供Flask-Login的user_loader使用
+        
+        缓存在本进程内有效，过期时间 USER_CACHE_TTL 秒，最多 USER_CACHE_SIZE 个用户；
+        修改用户的接口会调用 invalidate_user_cache() 立即清除本进程的缓存。
+        """
+        key = str(user_id)
+        now = time.monotonic()
+        
+        with _user_cache_lock:
+            entry = _user_cache.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    _user_cache.move_to_end(key)
+                    return entry[1]
+                del _user_cache[key]
+        
+        user = cls.get_by_id(user_id)
+        if user is None:
+            return None
+        
+        with _user_cache_lock:
+            _user_cache[key] = (now + USER_CACHE_TTL, user)
+            _user_cache.move_to_end(key)
+            while len(_user_cache) > USER_CACHE_SIZE:
+                _user_cache.popitem(last=False)
+        return user
+    
     @classmethod
     def get_by_username(cls, username):
         """通过用户名获取用户"""
@@ -106,6 +156,7 @@ class User(UserMixin):
                 ''', (self.id, self.username, self.password_hash, int(self.is_admin), self.class_id))
             
             conn.commit()
+            invalidate_user_cache(self.id)
             return True
         except Exception as e:
             print(f"保存用户时出错: {e}")
@@ -58,7 +58,7 @@ for package, version in REQUIRED_PACKAGES:
 print("依赖检查完成，开始导入模块...\n")
 
 # 原始的导入语句
-from flask import Flask, request, jsonify, send_from_directory, render_template, url_for, send_file, make_response, redirect, flash
+from flask import Flask, request, jsonify, send_from_directory, render_template, url_for, send_file, make_response, redirect, flash, current_app
 from flask_cors import CORS
 # 导入Flask-Login相关模块
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user, UserMixin
@@ -76,6 +76,22 @@ import time
 import logging
 import traceback
 from utils.excel_processor import ExcelProcessor
+from logger_config import setup_logger, Payload
+from utils.student_list import parse_list_args, query_students, stream_students, count_students, ensure_student_counters
+from utils.class_version import ensure_class_versions, class_version_etag
+from utils.export_jobs import ensure_export_jobs, check_exports_folder
+from utils.export_cache import ensure_export_cache
+from utils.comment_cache import ensure_comment_cache
+from utils.rate_limiter import ensure_rate_limits
+from utils.report_data import check_grades_table
+from utils.class_filter import user_can_access, student_access_filter
+from config import DATABASE
+from database import get_db_connection, init_database, close_db, checkpoint_database, read_database_settings, ensure_indexes, ensure_student_id_num, student_id_num, DATABASE_SETTINGS_CHECK
+
+# 成绩、德育模块导入时就按学号排序键 id_num 查询学生，旧数据库需要先完成迁移
+_conn = get_db_connection()
+ensure_student_id_num(_conn)
+_conn.close()
 try:
     from utils.pdf_exporter_fixed import export_comments_to_pdf  # 导入修复后的PDF导出函数
 except ImportError:
@@ -89,6 +105,7 @@ except ImportError:
     
 from utils.comment_generator import CommentGenerator
 from utils.report_exporter import ReportExporter
+from utils.report_pool import start_render_pool
 # 导入学生模块
 from students import students_bp, create_student_template
 
@@ -139,15 +156,8 @@ SYSTEM_SETTINGS = {
     "deepseek_api_enabled": bool(DEEPSEEK_API_KEY)
 }
 
-# 配置日志
-logging.basicConfig(
-    level=logging.DEBUG,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("logs/root_server.log"),
-        logging.StreamHandler()
-    ]
-)
+# 配置日志（后台线程写文件，级别见 config.LOG_LEVEL / LOG_LEVELS）
+setup_logger()
 
 logger = logging.getLogger(__name__)
 logger.info("服务器启动")
@@ -174,11 +184,15 @@ login_manager.login_view = 'users.login'  # 设置登录视图
 @login_manager.user_loader
 def load_user(user_id):
     from models.user import User
-    return User.get_by_id(user_id)
+    # 每个请求都会调用，使用缓存避免重复查询users表
+    return User.get_cached(user_id)
 
 # 将deepseek_api添加到应用配置中
 app.config['deepseek_api'] = deepseek_api
 
+# 注册数据库连接管理（请求结束时关闭共享连接）
+init_database(app)
+
 # 注册学生蓝图
 app.register_blueprint(students_bp)
 
@@ -238,6 +252,7 @@ def unified_reset_password(user_id):
         import string
         import datetime
         import sqlite3
+        from models.user import invalidate_user_cache
         
         # 生成随机密码
         new_password = ''.join(random.choices(string.ascii_letters + string.digits, k=6))
@@ -246,7 +261,7 @@ def unified_reset_password(user_id):
         password_hash = generate_password_hash(new_password)
         
         # 更新数据库
-        conn = sqlite3.connect('students.db')
+        conn = get_db_connection(row_factory=None)
         cursor = conn.cursor()
         
         now = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
@@ -260,6 +275,7 @@ def unified_reset_password(user_id):
         
         conn.commit()
         conn.close()
+        invalidate_user_cache(user_id)
         
         # 返回新密码
         return jsonify({
@@ -275,7 +291,6 @@ def unified_reset_password(user_id):
 UPLOAD_FOLDER = 'uploads'
 TEMPLATE_FOLDER = 'templates'
 EXPORTS_FOLDER = 'exports'
-DATABASE = 'students.db'
 
 # 将UPLOAD_FOLDER添加到app.config中
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
@@ -284,25 +299,20 @@ app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 os.makedirs(TEMPLATE_FOLDER, exist_ok=True)
 os.makedirs(EXPORTS_FOLDER, exist_ok=True)
-
-# 创建数据库连接
-def get_db_connection():
-    """获取数据库连接"""
-    conn = sqlite3.connect('students.db')
-    conn.row_factory = sqlite3.Row
-    conn.execute('PRAGMA foreign_keys = ON')  # 启用外键约束
-    return conn
+# 导出目录写入权限只在启动时检查一次，PDF导出时直接使用检查结果
+check_exports_folder()
 
 # 初始化数据库
 def init_db():
     logger.info("初始化数据库")
-    conn = sqlite3.connect(DATABASE)
+    conn = get_db_connection(row_factory=None)
     cursor = conn.cursor()
     
     # 创建学生表
     cursor.execute('''
     CREATE TABLE IF NOT EXISTS students (
         id TEXT PRIMARY KEY,
+        id_num INTEGER,
         name TEXT NOT NULL,
         gender TEXT NOT NULL,
         class TEXT,
@@ -361,8 +371,25 @@ def init_db():
             except sqlite3.Error as e:
                 logger.error(f"添加列 {column} 时出错: {e}")
     
-    # 提交并关闭连接
+    # 学号排序键列和回填（启动时在导入业务模块前已执行过一次，这里覆盖重置数据库后的情况）
     conn.commit()
+    ensure_student_id_num(conn)
+    
+    # 创建查询所需的索引
+    ensure_indexes(conn)
+    
+    # 学生计数表，列表接口的总数直接从这里读取
+    ensure_student_counters(conn)
+    # 班级数据版本表，读接口据此生成ETag
+    ensure_class_versions(conn)
+    # 后台导出任务表，导出进度和取消标记在各进程间共享
+    ensure_export_jobs(conn)
+    # 导出文件缓存表，数据未变化时直接返回上次生成的文件
+    ensure_export_cache(conn)
+    ensure_comment_cache(conn)
+    ensure_rate_limits(conn)
+    # 导出报告时是否需要查询旧版本的grades成绩表
+    check_grades_table(conn)
     conn.close()
     
     logger.info("数据库初始化完成")
@@ -371,14 +398,21 @@ def init_db():
 def reset_db():
     """重置数据库，备份旧数据库并创建新的"""
     try:
+        # 先释放当前请求持有的连接，避免删除文件后仍指向旧数据库
+        close_db()
+        
         # 如果数据库存在，创建备份
         if os.path.exists(DATABASE):
+            # WAL模式下先把日志内容写回主文件，保证备份完整
+            checkpoint_database()
             backup_path = f"{DATABASE}.backup_{int(time.time())}"
             shutil.copy2(DATABASE, backup_path)
             logger.info(f"创建数据库备份: {backup_path}")
             
-            # 删除旧数据库
-            os.remove(DATABASE)
+            # 删除旧数据库及WAL附属文件
+            for path in (DATABASE, f"{DATABASE}-wal", f"{DATABASE}-shm"):
+                if os.path.exists(path):
+                    os.remove(path)
             logger.info(f"删除旧数据库: {DATABASE}")
         
         # 初始化新数据库
@@ -405,7 +439,7 @@ init_users()
 init_classes()
 
 # 全局变量
-DATABASE_FILE = os.environ.get('CLASS_MASTER_DB', 'classmaster.db')
+DATABASE_FILE = DATABASE
 LOG_FILE = os.environ.get('CLASS_MASTER_LOG', 'classmaster.log')
 
 # 主页路由
@@ -537,18 +571,31 @@ def serve_template(filename):
 # 获取所有学生API
 @app.route('/api/students', methods=['GET'], strict_slashes=False)
 @login_required
+@class_version_etag(all_classes=True)
 def get_all_students():
     conn = get_db_connection()
-    cursor = conn.cursor()
     
-    cursor.execute('SELECT * FROM students ORDER BY CAST(id AS INTEGER)')
-    students = [dict(row) for row in cursor.fetchall()]
+    try:
+        list_args = parse_list_args(conn, request.args)
+    except ValueError as e:
+        conn.close()
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    
+    total = count_students(conn)
+    
+    # 不分页时边查询边输出
+    if list_args['limit'] is None:
+        conn.close()
+        return stream_students(list_args, extra={'status': 'ok', 'total': total, 'next_after': None})
     
+    students, next_after = query_students(conn, list_args)
     conn.close()
     
     return jsonify({
         'status': 'ok',
         'count': len(students),
+        'total': total,
+        'next_after': next_after,
         'students': students
     })
 
@@ -567,26 +614,14 @@ def check_student_access(student_id):
     if current_user.is_admin:
         return True
     
-    # 获取学生的班级ID
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('SELECT class_id FROM students WHERE id = ?', (student_id,))
-    student = cursor.fetchone()
-    conn.close()
-    
-    if not student:
-        return False
-    
     # 班主任只能访问自己班级的学生
-    student_class_id = student[0]  # 使用索引0访问第一列的值
-    teacher_class_id = current_user.class_id
+    allowed = user_can_access(student_id)
     
     # 记录详细的权限检查日志
     logger.info(f"权限检查: 用户={current_user.username}, 学生ID={student_id}, "
-               f"学生班级ID={student_class_id}, 班主任班级ID={teacher_class_id}")
+               f"班主任班级ID={current_user.class_id}, 结果={allowed}")
     
-    # 检查班级ID是否匹配
-    return student_class_id == teacher_class_id
+    return allowed
 
 # 获取单个学生API
 @app.route('/api/students/<student_id>', methods=['GET'], strict_slashes=False)
@@ -596,18 +631,18 @@ def get_student(student_id):
     conn = get_db_connection()
     cursor = conn.cursor()
     
-    # 查询学生信息
-    cursor.execute('SELECT * FROM students WHERE id = ?', (student_id,))
+    # 查询学生信息，查询条件中已包含权限范围，不再单独检查
+    where, params = student_access_filter()
+    cursor.execute(f'SELECT * FROM students WHERE id = ? AND {where}', (student_id,) + params)
     student = cursor.fetchone()
     
-    # 如果学生不存在，直接返回404
     if not student:
+        # 区分学生不存在（404）和无权访问（403）
+        cursor.execute('SELECT 1 FROM students WHERE id = ? LIMIT 1', (student_id,))
+        exists = cursor.fetchone()
         conn.close()
-        return jsonify({'status': 'error', 'message': '未找到学生'}), 404
-    
-    # 使用权限检查函数
-    if not check_student_access(student_id):
-        conn.close()
+        if not exists:
+            return jsonify({'status': 'error', 'message': '未找到学生'}), 404
         logger.warning(f"用户 {current_user.username} (ID: {current_user.id}) 尝试访问非本班学生 {student_id}，权限不足")
         return jsonify({'status': 'error', 'message': '权限不足，无法访问非本班学生'}), 403
     
@@ -656,12 +691,12 @@ def add_student():
     try:
         cursor.execute('''
         INSERT INTO students (
-            id, name, gender, class, height, weight,
+            id, id_num, name, gender, class, height, weight,
             chest_circumference, vital_capacity, dental_caries,
             vision_left, vision_right, physical_test_status, created_at, updated_at
-        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
         ''', (
-            data['id'], data['name'], data['gender'], data.get('class', ''),
+            data['id'], student_id_num(data['id']), data['name'], data['gender'], data.get('class', ''),
             height, weight, 
             chest_circumference, vital_capacity, data.get('dental_caries', ''),
             vision_left, vision_right, data.get('physical_test_status', ''),
@@ -692,7 +727,7 @@ def update_student(student_id):
     
     try:
         data = request.json
-        logger.info(f"请求数据: {data}")
+        logger.debug("请求数据: %s", Payload(data))
         
         if not data:
             logger.error("无效的请求数据")
@@ -734,24 +769,24 @@ def update_student(student_id):
         # 处理数值字段
         for field, db_field in numeric_fields.items():
             raw_value = data.get(field, None)
-            logger.info(f"字段 {field} 原始值: {raw_value}, 类型: {type(raw_value).__name__}")
+            logger.debug("字段 %s 原始值: %s, 类型: %s", field, raw_value, type(raw_value).__name__)
             
             try:
                 if raw_value is None or raw_value == '' or raw_value == 'null' or raw_value == 'undefined':
                     processed_values[db_field] = None
-                    logger.info(f"字段 {field} 设为None")
+                    logger.debug("字段 %s 设为None", field)
                 else:
                     # 如果是字符串，处理逗号等
                     if isinstance(raw_value, str):
                         # 替换逗号为点
                         raw_value = raw_value.replace(',', '.')
-                        logger.info(f"字段 {field} 预处理后: {raw_value}")
+                        logger.debug("字段 %s 预处理后: %s", field, raw_value)
                     
                     # 转换为浮点数
                     value = float(raw_value)
                     # 处理0值
                     processed_values[db_field] = 0.0 if value == 0 else value
-                    logger.info(f"字段 {field} 成功转换为: {processed_values[db_field]}")
+                    logger.debug("字段 %s 成功转换为: %s", field, processed_values[db_field])
             except (ValueError, TypeError) as e:
                 logger.warning(f"字段 {field} 值 '{raw_value}' 转换错误: {str(e)}")
                 processed_values[db_field] = None
@@ -759,7 +794,7 @@ def update_student(student_id):
         # 检查表结构
         cursor.execute("PRAGMA table_info(students)")
         existing_columns = [row[1] for row in cursor.fetchall()]
-        logger.info(f"数据库表列: {existing_columns}")
+        logger.debug("数据库表列: %s", existing_columns)
         
         # 检查所需列是否存在，如不存在则添加
         required_columns = list(numeric_fields.values()) + ['dental_caries', 'physical_test_status']
@@ -816,8 +851,8 @@ def update_student(student_id):
         
         # 构建完整的SQL语句
         update_sql = f"UPDATE students SET {', '.join(update_fields)} WHERE id = ?"
-        logger.info(f"更新SQL: {update_sql}")
-        logger.info(f"参数: {params}")
+        logger.debug("更新SQL: %s", update_sql)
+        logger.debug("参数: %s", Payload(params))
         
         # 执行更新
         cursor.execute(update_sql, params)
@@ -919,24 +954,28 @@ def database_info():
         # 获取数据库文件路径
         db_path = os.path.abspath(DATABASE)
         
-        # 获取文件修改时间
+        # 获取文件修改时间（WAL模式下最新的写入可能还在-wal文件中）
         if os.path.exists(db_path):
-            last_modified = datetime.datetime.fromtimestamp(os.path.getmtime(db_path)).strftime('%Y-%m-%d %H:%M:%S')
+            mtimes = [os.path.getmtime(path) for path in (db_path, f"{db_path}-wal") if os.path.exists(path)]
+            last_modified = datetime.datetime.fromtimestamp(max(mtimes)).strftime('%Y-%m-%d %H:%M:%S')
         else:
             last_modified = '数据库文件不存在'
         
-        # 获取学生数量
+        # 获取学生数量和当前生效的数据库配置
         conn = get_db_connection()
         cursor = conn.cursor()
         cursor.execute('SELECT COUNT(*) FROM students')
         student_count = cursor.fetchone()[0]
+        settings = read_database_settings(conn)
         conn.close()
         
         return jsonify({
             'status': 'ok',
             'path': db_path,
             'last_modified': last_modified,
-            'student_count': student_count
+            'student_count': student_count,
+            'settings': settings,
+            'startup_check': DATABASE_SETTINGS_CHECK
         })
     except Exception as e:
         print(f"获取数据库信息时出错: {e}")
@@ -1012,6 +1051,17 @@ def test_deepseek_api():
         logger.error(f"测试DeepSeek API时出错: {str(e)}")
         return jsonify({'status': 'error', 'message': f'测试API出错: {str(e)}'})
 
+# DeepSeek API请求统计（耗时、重试和失败次数）
+@app.route('/api/deepseek/stats', methods=['GET'])
+@login_required
+def get_deepseek_api_stats():
+    if not current_user.is_admin:
+        return jsonify({'status': 'error', 'message': '只有管理员可以查看'}), 403
+    api = current_app.config.get('deepseek_api')
+    if api is None:
+        return jsonify({'status': 'error', 'message': 'DeepSeek API不可用'})
+    return jsonify({'status': 'ok', 'stats': api.get_stats()})
+
 # 保存DeepSeek API设置
 @app.route('/api/settings/deepseek', methods=['POST'])
 @login_required
@@ -1153,6 +1203,9 @@ if __name__ == '__main__':
     print(f"模板文件夹: {os.path.abspath(TEMPLATE_FOLDER)}")
     print(f"服务器地址: http://{args.host if args.host != '0.0.0.0' else 'localhost'}:{args.port}")
     
+    # 报告渲染进程需要在开始处理请求之前创建
+    start_render_pool()
+    
     # 设置Flask应用程序
     is_production = os.environ.get('FLASK_ENV') == 'production'
     if is_production:
@@ -15,6 +15,10 @@ from openpyxl.styles import Alignment, Font
 from openpyxl.utils import get_column_letter
 from flask_login import login_required, current_user
 from utils.class_filter import class_filter, user_can_access
+from database import get_db_connection, student_id_num
+from utils.student_list import parse_list_args, query_students, stream_students, count_students
+from utils.class_version import class_version_etag
+from logger_config import Payload
 import logging
 import openpyxl
 
@@ -27,14 +31,6 @@ students_bp = Blueprint('students', __name__)
 # 配置
 UPLOAD_FOLDER = 'uploads'
 TEMPLATE_FOLDER = 'templates'
-DATABASE = 'students.db'
-
-# 创建数据库连接
-def get_db_connection():
-    conn = sqlite3.connect(DATABASE)
-    conn.row_factory = sqlite3.Row
-    conn.execute('PRAGMA foreign_keys = ON')  # 启用外键约束
-    return conn
 
 # 创建学生导入模板
 def create_student_template():
@@ -90,6 +86,7 @@ def create_student_template():
 # 获取所有学生API
 @students_bp.route('/api/students', methods=['GET'], strict_slashes=False)
 @login_required
+@class_version_etag()
 def get_all_students():
     class_id = None
     
@@ -107,21 +104,35 @@ def get_all_students():
         class_id = current_user.class_id
     
     conn = get_db_connection()
-    cursor = conn.cursor()
     
     try:
+        try:
+            list_args = parse_list_args(conn, request.args)
+        except ValueError as e:
+            return jsonify({'status': 'error', 'message': str(e)}), 400
+        
         if class_id:
             logger.info(f"仅获取班级 {class_id} 的学生")
-            cursor.execute('SELECT * FROM students WHERE class_id = ? ORDER BY CAST(id AS INTEGER)', (class_id,))
+            where, params = 'class_id = ?', (class_id,)
         else:
             logger.info(f"获取所有学生")
-            cursor.execute('SELECT * FROM students ORDER BY CAST(id AS INTEGER)')
-            
-        students = [dict(row) for row in cursor.fetchall()]
+            where, params = None, ()
+        total = count_students(conn, class_id)
         
+        # 不分页时边查询边输出
+        if list_args['limit'] is None:
+            return stream_students(list_args, where, params, extra={
+                'status': 'ok',
+                'total': total,
+                'next_after': None
+            })
+        
+        students, next_after = query_students(conn, list_args, where, params)
         return jsonify({
             'status': 'ok',
             'count': len(students),
+            'total': total,
+            'next_after': next_after,
             'students': students
         })
     except Exception as e:
@@ -133,13 +144,20 @@ def get_all_students():
 # 获取单个学生API
 @students_bp.route('/api/student/<student_id>', methods=['GET'])
 @login_required
+@class_version_etag('class_id')
 def get_student(student_id):
     """获取学生详情"""
+    # 参数和权限检查不通过时提前返回，此时还没有打开连接
+    conn = None
     try:
         # 获取班级ID
         class_id = request.args.get('class_id')
         if not class_id:
             return jsonify({'error': '缺少班级ID'}), 400
+        
+        # 班主任只能查看本班学生，学号在班级内唯一，比较班级ID即可，无需再查询学生
+        if not current_user.is_admin and str(current_user.class_id) != str(class_id):
+            return jsonify({'error': '权限不足，无法访问非本班学生'}), 403
             
         # 获取数据库连接
         conn = get_db_connection()
@@ -173,7 +191,8 @@ def get_student(student_id):
         logger.error(f"获取学生详情时出错: {str(e)}")
         return jsonify({'error': f'获取学生详情失败: {str(e)}'}), 500
     finally:
-        conn.close()
+        if conn:
+            conn.close()
 
 # 添加新学生API
 @students_bp.route('/api/students', methods=['POST'], strict_slashes=False)
@@ -224,12 +243,12 @@ def add_student():
     try:
         cursor.execute('''
         INSERT INTO students (
-            id, name, gender, class, class_id, height, weight,
+            id, id_num, name, gender, class, class_id, height, weight,
             chest_circumference, vital_capacity, dental_caries,
             vision_left, vision_right, physical_test_status, created_at, updated_at
-        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
         ''', (
-            data['id'], data['name'], data['gender'], data.get('class', ''),
+            data['id'], student_id_num(data['id']), data['name'], data['gender'], data.get('class', ''),
             data.get('class_id'), height, weight, 
             chest_circumference, vital_capacity, data.get('dental_caries', ''),
             vision_left, vision_right, data.get('physical_test_status', ''),
@@ -301,10 +320,15 @@ def update_student(student_id):
         
         # 处理其他字段
         for field, value in data.items():
-            if field not in numeric_fields and field != 'class_id':
+            if field not in numeric_fields and field not in ('class_id', 'id_num'):
                 update_fields.append(f"{field} = ?")
                 update_values.append(value)
         
+        # 学号变更时同步排序键
+        if 'id' in data:
+            update_fields.append("id_num = ?")
+            update_values.append(student_id_num(data['id']))
+        
         # 添加更新时间
         update_fields.append("updated_at = ?")
         update_values.append(datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
@@ -648,11 +672,17 @@ def confirm_import():
                 update_pairs = []
                 
                 for key, value in student.items():
-                    if key in db_columns:
+                    if key in db_columns and key != 'id_num':
                         db_fields.append(key)
                         db_values.append(value)
                         update_pairs.append(f"{key} = ?")
                 
+                # 学号排序键
+                if 'id_num' in db_columns:
+                    db_fields.append('id_num')
+                    db_values.append(student_id_num(student_id))
+                    update_pairs.append("id_num = ?")
+                
                 # 添加创建和更新时间
                 if 'created_at' in db_columns and not existing_student:
                     db_fields.append('created_at')
@@ -735,7 +765,8 @@ def update_student_subject(student_id):
         if not data:
             return jsonify({'status': 'error', 'message': '无效的数据格式'})
         
-        logger.info(f"正在更新学生ID={student_id}的学科成绩: {data}")
+        logger.info(f"正在更新学生ID={student_id}的学科成绩")
+        logger.debug("学科成绩数据: %s", Payload(data))
         
         # 获取当前用户班级ID
         user_class_id = current_user.class_id if not current_user.is_admin else None
@@ -864,12 +895,21 @@ def get_students():
             })
         
         conn = get_db_connection()
-        cursor = conn.cursor()
+        
+        try:
+            list_args = parse_list_args(conn, request.args)
+        except ValueError as e:
+            conn.close()
+            return jsonify({'status': 'error', 'message': str(e)}), 400
+        
+        # 按班级ID筛选时总数从计数表读取，按班级名称筛选时另行统计
+        where, params, count_class_id = None, (), None
         
         # 非管理员只能查看自己负责班级的学生
         if not is_admin and current_user_class_id:
             logger.info(f"班主任查询自己班级 {current_user_class_id} 的学生")
-            cursor.execute('SELECT * FROM students WHERE class_id = ? ORDER BY CAST(id AS INTEGER)', (current_user_class_id,))
+            where, params, count_class_id = 'class_id = ?', (current_user_class_id,), current_user_class_id
+            students, next_after = query_students(conn, list_args, where, params)
         # 如果指定了班级ID，则按班级筛选
         elif class_id:
             # 尝试处理整数或字符串的班级ID
@@ -877,35 +917,37 @@ def get_students():
                 # 尝试转为整数
                 int_class_id = int(class_id)
                 logger.info(f"以数字形式查询班级ID: {int_class_id}")
-                cursor.execute('SELECT * FROM students WHERE class_id = ? ORDER BY CAST(id AS INTEGER)', (int_class_id,))
+                where, params, count_class_id = 'class_id = ?', (int_class_id,), int_class_id
             except (ValueError, TypeError):
                 # 如果无法转为整数，尝试按班级名称查询
                 logger.info(f"尝试以班级名称查询: {class_id}")
-                cursor.execute('SELECT * FROM students WHERE class = ? ORDER BY CAST(id AS INTEGER)', (class_id,))
+                where, params = 'class = ?', (class_id,)
+            students, next_after = query_students(conn, list_args, where, params)
             
-            # 检查结果数量
-            students = cursor.fetchall()
-            if not students:
-                # 尝试模糊匹配
+            # 第一页没有结果时尝试模糊匹配
+            if not students and list_args['after'] is None:
                 logger.info(f"未找到精确匹配班级，尝试模糊匹配: {class_id}")
-                cursor.execute('SELECT * FROM students WHERE class LIKE ? ORDER BY CAST(id AS INTEGER)', (f'%{class_id}%',))
-                students = cursor.fetchall()
-            else:
-                # 重置游标位置
-                cursor.execute('SELECT * FROM students WHERE class_id = ? ORDER BY CAST(id AS INTEGER)', (int_class_id,))
+                where, params, count_class_id = 'class LIKE ?', (f'%{class_id}%',), None
+                students, next_after = query_students(conn, list_args, where, params)
         else:
             logger.info("管理员查询所有学生")
-            cursor.execute('SELECT * FROM students ORDER BY CAST(id AS INTEGER)')
+            students, next_after = query_students(conn, list_args)
         
-        students = [dict(row) for row in cursor.fetchall()]
-        logger.info(f"查询结果: 找到 {len(students)} 名学生")
+        if count_class_id is not None or where is None:
+            total = count_students(conn, count_class_id)
+        elif list_args['limit'] is None and list_args['after'] is None:
+            total = len(students)
+        else:
+            total = conn.execute(f'SELECT COUNT(*) FROM students WHERE {where}', params).fetchone()[0]
+        logger.info(f"查询结果: 返回 {len(students)} 名学生，共 {total} 名")
         
         conn.close()
         
         return jsonify({
             'status': 'ok',
             'students': students,
-            'total': len(students)
+            'total': total,
+            'next_after': next_after
         })
         
     except Exception as e:
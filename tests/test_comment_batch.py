@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""
+批量生成AI评语接口 /api/generate-comments
+
+用本地的 http.server 模拟 DeepSeek 接口（CLASS_MASTER_DEEPSEEK_URL 指向它），检查：
+同时进行的请求数不超过 AI_COMMENT_CONCURRENCY、结果按完成顺序逐行以NDJSON返回、找不到的学生返回错误行。
+"""
+
+import os
+import re
+import json
+import time
+import sqlite3
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+CONCURRENCY = 2
+# 各学生的模拟生成耗时（秒）
+DELAYS = {'慢学生': 0.6, '学生乙': 0.1, '学生丙': 0.1, '学生丁': 0.1}
+
+
+class _StubState:
+    lock = threading.Lock()
+    in_flight = 0
+    max_in_flight = 0
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    """模拟 DeepSeek 的 chat/completions 接口，按提示语中的学生姓名延迟返回"""
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        name = re.search(r'姓名: (\S+)', payload['messages'][-1]['content']).group(1)
+        with _StubState.lock:
+            _StubState.in_flight += 1
+            _StubState.max_in_flight = max(_StubState.max_in_flight, _StubState.in_flight)
+        try:
+            time.sleep(DELAYS.get(name, 0.1))
+        finally:
+            with _StubState.lock:
+                _StubState.in_flight -= 1
+        body = json.dumps({'choices': [{'message': {'content': f'{name}的评语'}}]}).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+# 配置在导入时读取环境变量，需要在导入应用模块之前设置
+_server = ThreadingHTTPServer(('127.0.0.1', 0), _StubHandler)
+threading.Thread(target=_server.serve_forever, daemon=True).start()
+_db_dir = tempfile.mkdtemp()
+os.environ.update({
+    'CLASS_MASTER_DEEPSEEK_URL': f'http://127.0.0.1:{_server.server_port}/v1/chat/completions',
+    'CLASS_MASTER_DB': os.path.join(_db_dir, 'test.db'),
+    'CLASS_MASTER_AI_CONCURRENCY': str(CONCURRENCY),
+    'CLASS_MASTER_AI_CACHE': '0',
+    'CLASS_MASTER_AI_RATE_LIMIT': '0',
+})
+
+from flask import Flask  # noqa: E402
+from flask_login import LoginManager, login_user  # noqa: E402
+
+from comments import comments_bp  # noqa: E402
+from models.user import User  # noqa: E402
+
+
+@pytest.fixture
+def client():
+    conn = sqlite3.connect(os.environ['CLASS_MASTER_DB'])
+    conn.execute('DROP TABLE IF EXISTS students')
+    conn.execute('CREATE TABLE students (id TEXT PRIMARY KEY, name TEXT, gender TEXT, class_id INTEGER)')
+    conn.executemany('INSERT INTO students VALUES (?, ?, ?, ?)',
+                     [('1', '慢学生', '男', 1), ('2', '学生乙', '女', 1), ('3', '学生丙', '男', 1),
+                      ('4', '学生丁', '女', 1), ('5', '别班学生', '男', 2)])
+    conn.commit()
+    conn.close()
+
+    teacher = User(1, 'teacher', '', is_admin=False, class_id=1)
+    app = Flask(__name__)
+    app.secret_key = 'test'
+    login_manager = LoginManager(app)
+    login_manager.user_loader(lambda user_id: teacher)
+    app.register_blueprint(comments_bp)
+
+    @app.route('/test-login')
+    def test_login():
+        login_user(teacher)
+        return 'ok'
+
+    test_client = app.test_client()
+    test_client.get('/test-login')
+    _StubState.max_in_flight = 0
+    return test_client
+
+
+def test_generate_comments_streams_ndjson_in_completion_order(client):
+    response = client.post('/api/generate-comments', json={
+        'students': [{'student_id': student_id} for student_id in ('1', '2', '3', '4', '5', '99')],
+        'class_id': 1,
+    })
+    assert response.status_code == 200
+    assert response.mimetype == 'application/x-ndjson'
+
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+    # 找不到的学生（不存在或不在本班）各返回一行错误
+    errors = [line for line in lines if line['status'] == 'error']
+    assert sorted(line['student_id'] for line in errors) == ['5', '99']
+
+    # 慢学生最先提交、最后完成：结果按完成顺序返回
+    results = [line for line in lines if line['status'] == 'ok']
+    assert [line['student_id'] for line in results] == ['2', '3', '4', '1']
+    assert results[-1]['comment'] == '慢学生的评语'
+
+    assert lines[-1] == {'status': 'done', 'total': 6, 'succeeded': 4, 'failed': 2}
+    assert _StubState.max_in_flight == CONCURRENCY
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+"""
+load_report_data 的查询次数与学生人数无关
+
+用 set_trace_callback 记录执行的SQL语句，比较导出1个和40个学生时的语句数，
+分别在有、没有旧版 grades 成绩表的数据库上检查。
+"""
+
+import sqlite3
+
+import pytest
+
+from utils.report_data import GRADE_FIELDS, check_grades_table, load_report_data
+
+
+def make_db(student_count, with_grades_table):
+    conn = sqlite3.connect(':memory:')
+    conn.row_factory = sqlite3.Row
+    grade_columns = ', '.join(f'{field} TEXT' for field in GRADE_FIELDS)
+    conn.execute(f'CREATE TABLE students (id TEXT PRIMARY KEY, name TEXT, gender TEXT, class TEXT, '
+                 f'comments TEXT, {grade_columns})')
+    conn.executemany('INSERT INTO students (id, name, gender, class, comments, yuwen) VALUES (?, ?, ?, ?, ?, ?)',
+                     [(str(i), f'学生{i}', '男', '1班', f'评语{i}', '优') for i in range(1, student_count + 1)])
+    if with_grades_table:
+        conn.execute('CREATE TABLE grades (id INTEGER PRIMARY KEY, student_id TEXT, yuwen TEXT)')
+        conn.executemany('INSERT INTO grades (student_id, yuwen) VALUES (?, ?)',
+                         [(str(i), '良') for i in range(1, student_count + 1, 2)])
+    conn.commit()
+    check_grades_table(conn)
+    return conn
+
+
+def count_statements(student_count, with_grades_table):
+    conn = make_db(student_count, with_grades_table)
+    statements = []
+    conn.set_trace_callback(statements.append)
+    try:
+        students, comments, grades = load_report_data(conn, [str(i) for i in range(1, student_count + 1)])
+    finally:
+        conn.set_trace_callback(None)
+        conn.close()
+    assert len(students) == len(comments) == len(grades) == student_count
+    if with_grades_table:
+        # grades 表中有记录的学生以该表为准
+        assert grades['1']['grades'] == {'yuwen': '良'}
+    return len(statements)
+
+
+@pytest.mark.parametrize('with_grades_table', [False, True])
+def test_statement_count_independent_of_students(with_grades_table):
+    single = count_statements(1, with_grades_table)
+    many = count_statements(40, with_grades_table)
+    assert single == many
+    assert many == (2 if with_grades_table else 1)
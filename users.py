@@ -16,7 +16,8 @@ from flask import Blueprint, request, jsonify, render_template, redirect, url_fo
 from werkzeug.security import generate_password_hash, check_password_hash
 from flask_login import login_user, logout_user, login_required, current_user
 import logging
-from models.user import User
+from models.user import User, invalidate_user_cache
+from database import get_db_connection
 from werkzeug.utils import secure_filename
 
 # 配置日志
@@ -25,16 +26,6 @@ logger = logging.getLogger(__name__)
 # 用户蓝图
 users_bp = Blueprint('users', __name__)
 
-# 配置
-DATABASE = 'students.db'
-
-# 获取数据库连接
-def get_db_connection():
-    conn = sqlite3.connect(DATABASE)
-    conn.row_factory = sqlite3.Row
-    conn.execute('PRAGMA foreign_keys = ON')  # 启用外键约束
-    return conn
-
 # 初始化用户表
 def init_users():
     """初始化用户表，如果不存在则创建，必要时添加新列"""
@@ -224,6 +215,7 @@ def change_password():
                 
                 conn.commit()
                 conn.close()
+                invalidate_user_cache(user.id)
                 
                 if request.is_json:
                     return jsonify({'status': 'ok', 'message': '密码已成功更新'})
@@ -672,6 +664,7 @@ def update_user(user_id):
         ''', params)
         
         conn.commit()
+        invalidate_user_cache(user_id)
         
         logger.info(f"成功更新用户 ID={user_id}")
         
@@ -713,6 +706,7 @@ def delete_user(user_id):
         # 删除用户
         cursor.execute('DELETE FROM users WHERE id = ?', (user_id,))
         conn.commit()
+        invalidate_user_cache(user_id)
         
         logger.info(f"成功删除用户: ID={user_id}, 用户名={user[1]}")
         
@@ -992,6 +986,7 @@ def api_reset_user_password(user_id):
         
         conn.commit()
         conn.close()
+        invalidate_user_cache(user_id)
         
         # 返回新密码
         return jsonify({
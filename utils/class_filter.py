@@ -2,6 +2,7 @@
 from flask_login import current_user
 from functools import wraps
 import logging
+from database import get_db_connection
 
 logger = logging.getLogger(__name__)
 
@@ -60,41 +61,75 @@ def class_filter(func):
     
     return wrapper
 
-def user_can_access(student_id):
+# 单次IN查询的最大参数个数，低于SQLite默认的变量数限制
+_ACCESS_CHUNK_SIZE = 500
+
+def student_access_filter():
     """
-    检查当前用户是否有权限访问指定学生的数据
+    返回当前用户可访问学生的WHERE条件
     
-    用法示例:
-    if user_can_access(student_id):
-        # 执行访问操作
-    else:
-        # 返回权限不足错误
+    Returns:
+        tuple: (条件SQL, 参数)，管理员为不限制，班主任为本班，未分配班级为全部拒绝
     """
-    # 如果是管理员，可以访问所有学生
     if hasattr(current_user, 'is_admin') and current_user.is_admin:
-        return True
+        return '1 = 1', ()
+    if not hasattr(current_user, 'class_id') or not current_user.class_id:
+        return '1 = 0', ()
+    return 'class_id = ?', (current_user.class_id,)
+
+def accessible_student_ids(student_ids, conn=None):
+    """
+    批量检查权限，一次查询返回当前用户有权访问的学生ID集合
+    
+    Args:
+        student_ids: 学生ID列表
+        conn: 可选，复用调用方的数据库连接
+        
+    Returns:
+        set: 有权访问的学生ID（字符串）
+    """
+    ids = list(dict.fromkeys(str(student_id) for student_id in student_ids))
+    if not ids:
+        return set()
+    
+    # 管理员可以访问所有学生
+    if hasattr(current_user, 'is_admin') and current_user.is_admin:
+        return set(ids)
     
     # 如果没有班级ID，不允许访问
     if not hasattr(current_user, 'class_id') or not current_user.class_id:
-        return False
-    
-    # 查询学生所属班级
-    import sqlite3
+        return set()
     
+    where, params = student_access_filter()
+    own_conn = conn is None
+    allowed = set()
     try:
-        # 避免循环导入问题
-        DATABASE = 'students.db'
-        conn = sqlite3.connect(DATABASE)
-        cursor = conn.cursor()
-        cursor.execute('SELECT class_id FROM students WHERE id = ?', (student_id,))
-        student = cursor.fetchone()
-        conn.close()
-        
-        if not student:
-            return False
-        
-        # 检查学生班级是否与用户负责的班级匹配
-        return student[0] == current_user.class_id
+        if own_conn:
+            conn = get_db_connection(row_factory=None)
+        # 学号只在班级内唯一，按 (class_id, id) 索引查询本班是否存在这些学号
+        for i in range(0, len(ids), _ACCESS_CHUNK_SIZE):
+            chunk = ids[i:i + _ACCESS_CHUNK_SIZE]
+            placeholders = ','.join('?' * len(chunk))
+            cursor = conn.execute(f'SELECT DISTINCT id FROM students WHERE {where} AND id IN ({placeholders})',
+                                  list(params) + chunk)
+            allowed.update(str(row[0]) for row in cursor.fetchall())
     except Exception as e:
         logger.error(f"检查学生访问权限时出错: {str(e)}")
-        return False 
\ No newline at end of file
+        return set()
+    finally:
+        if own_conn and conn is not None:
+            conn.close()
+    
+    return allowed
+
+def user_can_access(student_id, conn=None):
+    """
+    检查当前用户是否有权限访问指定学生的数据
+    
+    用法示例:
+    if user_can_access(student_id):
+        # 执行访问操作
+    else:
+        # 返回权限不足错误
+    """
+    return str(student_id) in accessible_student_ids([student_id], conn)
@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+"""
+班级数据版本与条件请求（ETag / Last-Modified）
+
+students 表上的触发器在每次写入（新增、修改、删除、导入、成绩和德育保存等）时
+递增对应班级的版本号，读接口据此生成弱 ETag：
+浏览器轮询时携带 If-None-Match / If-Modified-Since，班级数据未变化则直接返回 304，
+不再执行列表查询和 JSON 序列化。
+"""
+
+import hashlib
+import logging
+import datetime
+from functools import wraps
+
+from flask import request, current_app
+from flask_login import current_user
+
+from database import get_db_connection
+
+logger = logging.getLogger(__name__)
+
+# 版本表和触发器，class_id 为空的学生计入 class_key = 0
+# changed_at 为 Unix 时间戳（秒，带小数）
+_VERSION_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS class_versions (
+    class_key INTEGER PRIMARY KEY,
+    version INTEGER NOT NULL DEFAULT 0,
+    changed_at REAL
+);
+
+CREATE TRIGGER IF NOT EXISTS trg_class_versions_insert AFTER INSERT ON students
+BEGIN
+    INSERT INTO class_versions (class_key, version, changed_at)
+    VALUES (COALESCE(NEW.class_id, 0), 1, (julianday('now') - 2440587.5) * 86400.0)
+    ON CONFLICT(class_key) DO UPDATE SET version = version + 1, changed_at = excluded.changed_at;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_class_versions_update AFTER UPDATE ON students
+BEGIN
+    INSERT INTO class_versions (class_key, version, changed_at)
+    VALUES (COALESCE(NEW.class_id, 0), 1, (julianday('now') - 2440587.5) * 86400.0)
+    ON CONFLICT(class_key) DO UPDATE SET version = version + 1, changed_at = excluded.changed_at;
+    INSERT INTO class_versions (class_key, version, changed_at)
+    SELECT COALESCE(OLD.class_id, 0), 1, (julianday('now') - 2440587.5) * 86400.0
+    WHERE COALESCE(OLD.class_id, 0) IS NOT COALESCE(NEW.class_id, 0)
+    ON CONFLICT(class_key) DO UPDATE SET version = version + 1, changed_at = excluded.changed_at;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_class_versions_delete AFTER DELETE ON students
+BEGIN
+    INSERT INTO class_versions (class_key, version, changed_at)
+    VALUES (COALESCE(OLD.class_id, 0), 1, (julianday('now') - 2440587.5) * 86400.0)
+    ON CONFLICT(class_key) DO UPDATE SET version = version + 1, changed_at = excluded.changed_at;
+END;
+'''
+
+
+def ensure_class_versions(conn):
+    """创建版本表和触发器（启动时调用，可重复执行）"""
+    conn.executescript(_VERSION_SCHEMA)
+    conn.commit()
+
+
+def get_class_version(conn, class_id=None):
+    """
+    获取班级数据版本
+
+    Args:
+        class_id: 班级ID，为None时返回全校版本（各班版本之和只增不减）
+
+    Returns:
+        tuple: (版本号, 最后修改时间戳或None)
+    """
+    if class_id is None:
+        row = conn.execute('SELECT COALESCE(SUM(version), 0), MAX(changed_at) FROM class_versions').fetchone()
+    else:
+        row = conn.execute('SELECT version, changed_at FROM class_versions WHERE class_key = ?', (class_id,)).fetchone()
+    return (row[0], row[1]) if row else (0, None)
+
+
+def _request_class_id(class_arg, all_classes=False):
+    """确定本次请求返回的数据范围：班主任为自己的班级，管理员为请求参数中的班级，否则为全校"""
+    if all_classes:
+        return None
+    if not current_user.is_admin:
+        class_id = current_user.class_id
+    elif class_arg:
+        class_id = request.values.get(class_arg)
+    else:
+        class_id = None
+
+    try:
+        return int(class_id) if class_id not in (None, '') else None
+    except (TypeError, ValueError):
+        # 按班级名称查询时无法确定班级，使用全校版本
+        return None
+
+
+def _is_cacheable(response):
+    """只有成功的响应才附加验证信息"""
+    if response.status_code != 200 or response.direct_passthrough:
+        return False
+    if response.is_streamed:
+        # 流式JSON列表：输出中途出错时连接中断，浏览器不会缓存不完整的响应
+        return True
+    if response.is_json:
+        data = response.get_json(silent=True)
+        if isinstance(data, dict) and data.get('status') == 'error':
+            return False
+    return True
+
+
+def class_version_etag(class_arg=None, all_classes=False):
+    """
+    为按班级读取数据的接口添加 ETag / Last-Modified 条件请求支持
+
+    需放在 @login_required 之后。ETag 由班级版本、当前用户和完整查询参数共同决定，
+    班级数据没有变化时直接返回 304，不调用视图函数。
+
+    Args:
+        class_arg: 管理员请求中表示班级的参数名；为None时管理员请求按全校版本处理
+        all_classes: 接口不按用户班级过滤、总是返回全校数据时为True，所有用户都按全校版本处理
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            try:
+                class_id = _request_class_id(class_arg, all_classes)
+                conn = get_db_connection()
+                try:
+                    # 班级从未写入过学生时，接口可能回退为返回全校数据，此时使用全校版本
+                    if class_id is not None and get_class_version(conn, class_id)[0] == 0:
+                        class_id = None
+                    version, changed_at = get_class_version(conn, class_id)
+                finally:
+                    conn.close()
+            except Exception as e:
+                logger.error(f"获取班级数据版本失败: {str(e)}")
+                return view(*args, **kwargs)
+
+            scope = 'all' if class_id is None else class_id
+            variant = hashlib.md5(f'{current_user.id}|{request.full_path}'.encode('utf-8')).hexdigest()[:12]
+            etag = f'{scope}-{version}-{variant}'
+            last_modified = None
+            if changed_at is not None:
+                last_modified = datetime.datetime.fromtimestamp(int(changed_at), tz=datetime.timezone.utc)
+
+            # 按HTTP规范，携带 If-None-Match 时忽略 If-Modified-Since
+            if request.if_none_match:
+                not_modified = request.if_none_match.contains_weak(etag)
+            else:
+                not_modified = (last_modified is not None and request.if_modified_since is not None
+                                and last_modified <= request.if_modified_since)
+
+            if not_modified:
+                response = current_app.response_class(status=304)
+            else:
+                response = current_app.make_response(view(*args, **kwargs))
+                if not _is_cacheable(response):
+                    return response
+
+            response.set_etag(etag, weak=True)
+            if last_modified is not None:
+                response.last_modified = last_modified
+            # 允许浏览器缓存，但每次使用前都要重新验证
+            response.cache_control.private = True
+            response.cache_control.no_cache = True
+            return response
+        return wrapper
+    return decorator
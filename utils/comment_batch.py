@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+"""
+批量生成AI评语
+
+逐个学生请求模型接口时，每份评语都要等上一份返回（每次数秒到数十秒），整班生成很慢。
+这里把一批学生同时交给线程池，最多 AI_COMMENT_CONCURRENCY 个请求同时进行，
+哪个学生的评语先生成就先返回哪个，调用方可以边生成边输出给浏览器。
+"""
+
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from config import AI_COMMENT_CONCURRENCY
+
+logger = logging.getLogger(__name__)
+
+
+def generate_comments(generator, jobs, style, tone, max_length, regenerate=False, concurrency=AI_COMMENT_CONCURRENCY):
+    """
+    为一批学生生成评语，按完成顺序逐个返回结果
+
+    Args:
+        generator: CommentGenerator
+        jobs: [(学生ID, 学生信息), ...]，学生信息格式同 CommentGenerator.generate_comment
+        style / tone / max_length: 评语风格、语气和最大字数
+        regenerate: 为True时跳过评语缓存重新生成
+        concurrency: 同时进行的请求数
+
+    Yields:
+        dict: {"student_id", "status", "comment", "message", "cached"}
+    """
+    if not jobs:
+        return
+    executor = ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(jobs))), thread_name_prefix='ai-comment')
+    futures = {
+        executor.submit(generator.generate_comment, student_info=student_info, style=style, tone=tone,
+                        max_length=max_length, regenerate=regenerate): student_id
+        for student_id, student_info in jobs
+    }
+    try:
+        for future in as_completed(futures):
+            student_id = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                logger.error(f"为学生 {student_id} 生成评语时出错: {str(e)}")
+                result = {"status": "error", "comment": "", "message": f"评语生成失败: {str(e)}"}
+            yield dict(result, student_id=student_id)
+    finally:
+        # 客户端断开时不再发起尚未开始的请求
+        executor.shutdown(wait=False, cancel_futures=True)
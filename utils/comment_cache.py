@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+"""
+AI评语结果缓存
+
+老师调整页面时经常用完全相同的输入（学生特点、风格、语气、字数）重复生成评语，
+每次都要等待模型并消耗接口额度。这里把生成成功的评语按请求内容缓存在 SQLite 的 ai_comment_cache 表中：
+缓存键是模型参数和提示语（空白规范化后）的哈希，相同请求在有效期（AI_COMMENT_CACHE_TTL_HOURS）内直接返回缓存的评语。
+
+缓存条目数超过 AI_COMMENT_CACHE_MAX 时删除最久未用的条目；请求中带 regenerate 时跳过缓存重新生成，
+新结果覆盖旧的缓存。
+"""
+
+import json
+import time
+import hashlib
+import logging
+
+from database import get_db_connection
+from config import AI_COMMENT_CACHE_ENABLED, AI_COMMENT_CACHE_TTL_HOURS, AI_COMMENT_CACHE_MAX
+
+logger = logging.getLogger(__name__)
+
+_CACHE_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS ai_comment_cache (
+    cache_key TEXT PRIMARY KEY,
+    comment TEXT NOT NULL,
+    created_at REAL,
+    last_used REAL
+);
+
+CREATE INDEX IF NOT EXISTS idx_ai_comment_cache_last_used ON ai_comment_cache (last_used);
+'''
+
+
+def ensure_comment_cache(conn):
+    """创建缓存表（启动时调用，可重复执行）"""
+    conn.executescript(_CACHE_SCHEMA)
+    conn.commit()
+
+
+def make_cache_key(payload):
+    """
+    计算评语请求的缓存键
+
+    Args:
+        payload: 发送给模型接口的请求体（model、messages、temperature、max_tokens 等）
+
+    Returns:
+        str: 缓存键（SHA-256），消息内容中的空白差异（换行、缩进、多余空格）不影响结果
+    """
+    normalized = dict(payload)
+    normalized['messages'] = [
+        {'role': message.get('role'), 'content': ' '.join(str(message.get('content', '')).split())}
+        for message in payload.get('messages', [])
+    ]
+    data = json.dumps(normalized, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+
+def lookup(cache_key):
+    """
+    查找缓存的评语
+
+    Returns:
+        Optional[str]: 评语内容，没有缓存或已过期时返回None
+    """
+    if not AI_COMMENT_CACHE_ENABLED:
+        return None
+    now = time.time()
+    conn = get_db_connection()
+    try:
+        row = conn.execute('SELECT comment, created_at FROM ai_comment_cache WHERE cache_key = ?',
+                           (cache_key,)).fetchone()
+        if row is None:
+            return None
+        if now - (row['created_at'] or 0) > AI_COMMENT_CACHE_TTL_HOURS * 3600:
+            conn.execute('DELETE FROM ai_comment_cache WHERE cache_key = ?', (cache_key,))
+            conn.commit()
+            return None
+        conn.execute('UPDATE ai_comment_cache SET last_used = ? WHERE cache_key = ?', (now, cache_key))
+        conn.commit()
+        return row['comment']
+    finally:
+        conn.close()
+
+
+def store(cache_key, comment):
+    """保存生成的评语，然后清理过期和超出条目上限的缓存"""
+    if not AI_COMMENT_CACHE_ENABLED or not comment:
+        return
+    now = time.time()
+    conn = get_db_connection()
+    try:
+        conn.execute('''
+            INSERT OR REPLACE INTO ai_comment_cache (cache_key, comment, created_at, last_used)
+            VALUES (?, ?, ?, ?)
+        ''', (cache_key, comment, now, now))
+        evict(conn, now)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def evict(conn, now=None):
+    """
+    删除过期的缓存，条目数超过 AI_COMMENT_CACHE_MAX 时按最近使用时间删除最久未用的条目
+
+    Returns:
+        int: 删除的条目数
+    """
+    if now is None:
+        now = time.time()
+    removed = conn.execute('DELETE FROM ai_comment_cache WHERE created_at < ?',
+                           (now - AI_COMMENT_CACHE_TTL_HOURS * 3600,)).rowcount
+    removed += conn.execute('''
+        DELETE FROM ai_comment_cache WHERE cache_key IN (
+            SELECT cache_key FROM ai_comment_cache ORDER BY last_used DESC LIMIT -1 OFFSET ?
+        )
+    ''', (AI_COMMENT_CACHE_MAX,)).rowcount
+    if removed:
+        logger.info(f"已清理 {removed} 条AI评语缓存")
+    return removed
@@ -1,8 +1,9 @@
 # -*- coding: utf-8 -*-
 import json
 import logging
+import threading
 import traceback
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Iterator, Optional
 from .deepseek_api import DeepSeekAPI
 
 # 配置日志
@@ -12,19 +13,21 @@ logger = logging.getLogger(__name__)
 class CommentGenerator:
     """评语生成器类，负责处理评语生成的所有相关逻辑"""
     
-    def __init__(self, api_key: Optional[str] = None):
+    def __init__(self, api_key: Optional[str] = None, deepseek_api: Optional[DeepSeekAPI] = None):
         """初始化评语生成器
         
         Args:
             api_key: DeepSeek API密钥
+            deepseek_api: 已有的DeepSeek API客户端，提供时复用该客户端（及其连接池），忽略api_key
         """
-        self.deepseek_api = DeepSeekAPI(api_key)
+        self.deepseek_api = deepseek_api or DeepSeekAPI(api_key)
     
     def generate_comment(self, 
                         student_info: Dict[str, Any],
                         style: str = "鼓励性的",
                         tone: str = "正式的",
-                        max_length: int = 260) -> Dict[str, Any]:
+                        max_length: int = 260,
+                        regenerate: bool = False) -> Dict[str, Any]:
         """生成学生评语
         
         Args:
@@ -38,13 +41,15 @@ class CommentGenerator:
             style: 评语风格
             tone: 评语语气
             max_length: 评语最大字数
+            regenerate: 为True时跳过缓存重新生成
             
         Returns:
             Dict[str, Any]: 包含生成结果的字典
                 {
                     "status": "ok" | "error",
                     "comment": "生成的评语内容",
-                    "message": "状态信息"
+                    "message": "状态信息",
+                    "cached": 是否为缓存的评语（仅成功时）
                 }
         """
         try:
@@ -56,7 +61,8 @@ class CommentGenerator:
                 student_info=student_info,
                 style=style,
                 tone=tone,
-                max_length=max_length
+                max_length=max_length,
+                regenerate=regenerate
             )
             
             # 检查API返回结果
@@ -65,7 +71,8 @@ class CommentGenerator:
                 return {
                     "status": "ok",
                     "comment": result["comment"],
-                    "message": "评语生成成功"
+                    "message": "评语生成成功",
+                    "cached": result.get("cached", False)
                 }
             else:
                 logger.error(f"API返回错误: {result}")
@@ -84,6 +91,31 @@ class CommentGenerator:
                 "message": f"评语生成失败: {str(e)}"
             }
     
+    def generate_comment_stream(self,
+                                student_info: Dict[str, Any],
+                                style: str = "鼓励性的",
+                                tone: str = "正式的",
+                                max_length: int = 260,
+                                regenerate: bool = False) -> Iterator[Dict[str, Any]]:
+        """流式生成学生评语
+        
+        参数同 generate_comment，返回的事件格式见 DeepSeekAPI.generate_comment_stream
+        """
+        logger.info(f"开始为学生 {student_info.get('name')} 流式生成评语")
+        logger.info(f"生成参数: style={style}, tone={tone}, max_length={max_length}")
+        try:
+            yield from self.deepseek_api.generate_comment_stream(
+                student_info=student_info,
+                style=style,
+                tone=tone,
+                max_length=max_length,
+                regenerate=regenerate
+            )
+        except Exception as e:
+            logger.error(f"流式生成评语时发生错误: {str(e)}")
+            logger.error(f"错误堆栈: {traceback.format_exc()}")
+            yield {"type": "error", "message": f"评语生成失败: {str(e)}"}
+    
     def format_student_info(self, student_data: Dict[str, Any]) -> Dict[str, Any]:
         """格式化学生信息，确保所有必要字段都存在
         
@@ -126,4 +158,22 @@ class CommentGenerator:
             except ValueError:
                 return False, "最大字数必须是有效的数字"
         
-        return True, "" 
\ No newline at end of file
+        return True, ""
+
+
+_shared_generator = None
+_shared_lock = threading.Lock()
+
+
+def get_comment_generator(deepseek_api: Optional[DeepSeekAPI] = None) -> CommentGenerator:
+    """返回进程内共用的评语生成器
+    
+    Args:
+        deepseek_api: 应用配置中的DeepSeek API客户端；与上次不同（如重新设置了密钥）时重新创建生成器
+    """
+    global _shared_generator
+    with _shared_lock:
+        generator = _shared_generator
+        if generator is None or (deepseek_api is not None and generator.deepseek_api is not deepseek_api):
+            generator = _shared_generator = CommentGenerator(deepseek_api=deepseek_api)
+        return generator
@@ -11,6 +11,9 @@ import logging
 import sqlite3
 import traceback
 from datetime import datetime
+from database import get_db_connection
+from utils.pdf_fonts import find_font
+from utils.export_jobs import check_exports_folder
 
 # 配置日志
 logger = logging.getLogger(__name__)
@@ -31,9 +34,6 @@ except ImportError:
     logger.error("无法导入ReportLab库，PDF生成功能将不可用")
     logger.error("请使用以下命令安装ReportLab: pip install reportlab")
 
-# 数据库连接
-DATABASE = 'students.db'
-
 # PDF导出目录
 EXPORTS_FOLDER = 'exports'
 os.makedirs(EXPORTS_FOLDER, exist_ok=True)
@@ -42,56 +42,30 @@ os.makedirs(EXPORTS_FOLDER, exist_ok=True)
 FONTS_FOLDER = 'utils/fonts'
 os.makedirs(FONTS_FOLDER, exist_ok=True)
 
+# 中文字体候选列表，按顺序使用第一个可用的字体（统一注册为SimSun）
+FONT_CANDIDATES = [
+    # 使用思源宋体作为默认字体
+    (f'{FONTS_FOLDER}/SimSun.ttf', 'SimSun'),
+    (f'{FONTS_FOLDER}/SourceHanSerifCN-Regular.otf', 'SimSun'),
+    # Windows系统字体
+    ('C:/Windows/Fonts/simsun.ttc', 'SimSun'),
+    # macOS系统字体
+    ('/System/Library/Fonts/PingFang.ttc', 'SimSun'),
+]
+
 # 注册中文字体
 def register_fonts():
-    """注册中文字体，确保PDF可以正确显示中文"""
+    """注册中文字体，确保PDF可以正确显示中文（每个进程只注册一次）"""
     if not REPORTLAB_AVAILABLE:
         logger.error("ReportLab库未安装，无法注册字体")
         return False
         
-    try:
-        # 使用思源宋体作为默认字体
-        if os.path.exists(f'{FONTS_FOLDER}/SimSun.ttf'):
-            pdfmetrics.registerFont(TTFont('SimSun', f'{FONTS_FOLDER}/SimSun.ttf'))
-            logger.info("成功注册中文字体(SimSun.ttf)")
-            return True
-        elif os.path.exists(f'{FONTS_FOLDER}/SourceHanSerifCN-Regular.otf'):
-            # 尝试使用思源宋体
-            pdfmetrics.registerFont(TTFont('SimSun', f'{FONTS_FOLDER}/SourceHanSerifCN-Regular.otf'))
-            logger.info("成功注册思源宋体")
-            return True
-        else:
-            # 尝试找一个系统默认字体作为备用
-            logger.warning("在字体目录中未找到字体文件，尝试使用系统字体...")
-            
-            # 尝试Windows系统字体
-            if os.path.exists('C:/Windows/Fonts/simsun.ttc'):
-                pdfmetrics.registerFont(TTFont('SimSun', 'C:/Windows/Fonts/simsun.ttc'))
-                logger.info("成功注册Windows系统字体(simsun.ttc)")
-                return True
-                
-            # 尝试macOS系统字体
-            elif os.path.exists('/System/Library/Fonts/PingFang.ttc'):
-                pdfmetrics.registerFont(TTFont('SimSun', '/System/Library/Fonts/PingFang.ttc'))
-                logger.info("成功注册macOS系统字体(PingFang.ttc)")
-                return True
-                
-            # 尝试使用Helvetica作为备用（不支持中文，但至少能生成PDF）
-            else:
-                logger.error("无法找到合适的中文字体，将使用默认字体")
-                # 使用内置字体，不需要注册
-                return True
-    except Exception as e:
-        logger.error(f"注册字体时出错: {e}")
-        logger.error("PDF中可能无法正确显示中文，但将尝试使用默认字体")
-        return False
-
-# 获取数据库连接
-def get_db_connection():
-    """获取SQLite数据库连接"""
-    conn = sqlite3.connect(DATABASE)
-    conn.row_factory = sqlite3.Row
-    return conn
+    if find_font(FONT_CANDIDATES):
+        return True
+    
+    # 使用Helvetica作为备用（不支持中文，但至少能生成PDF）
+    logger.error("无法找到合适的中文字体，将使用默认字体")
+    return False
 
 # 批量编辑评语
 def batch_update_comments(comment_content, append_mode=True):
@@ -177,16 +151,12 @@ def generate_comments_pdf(class_name=None):
         }
     
     try:
-        # 检查exports目录是否存在且可写
-        if not os.path.exists(EXPORTS_FOLDER):
-            os.makedirs(EXPORTS_FOLDER, exist_ok=True)
-            logger.info(f"创建导出目录: {EXPORTS_FOLDER}")
-        
-        if not os.access(EXPORTS_FOLDER, os.W_OK):
-            logger.error(f"导出目录无写入权限: {EXPORTS_FOLDER}")
+        # 导出目录的写入权限在启动时检查一次
+        exports_error = check_exports_folder()
+        if exports_error:
             return {
                 'status': 'error',
-                'message': f'无法写入导出目录，请检查权限: {EXPORTS_FOLDER}'
+                'message': exports_error
             }
             
         # 确保注册了中文字体
@@ -202,9 +172,9 @@ def generate_comments_pdf(class_name=None):
             
             # 使用与打印预览相同的查询
             if class_name:
-                cursor.execute('SELECT id, name, gender, class, comments, updated_at FROM students WHERE class = ? ORDER BY CAST(id AS INTEGER)', (class_name,))
+                cursor.execute('SELECT id, name, gender, class, comments, updated_at FROM students WHERE class = ? ORDER BY id_num', (class_name,))
             else:
-                cursor.execute('SELECT id, name, gender, class, comments, updated_at FROM students ORDER BY class, CAST(id AS INTEGER)')
+                cursor.execute('SELECT id, name, gender, class, comments, updated_at FROM students ORDER BY class, id_num')
                 
             students = cursor.fetchall()
             if not students:
@@ -483,13 +453,13 @@ def generate_preview_html(class_name=None, current_user=None):
         # 根据用户权限和班级参数构建查询
         if current_user and not current_user.is_admin and current_user.class_id:
             # 如果是班主任，只获取其班级的学生
-            cursor.execute('SELECT id, name, gender, class, comments, updated_at FROM students WHERE class_id = ? ORDER BY CAST(id AS INTEGER)', (current_user.class_id,))
+            cursor.execute('SELECT id, name, gender, class, comments, updated_at FROM students WHERE class_id = ? ORDER BY id_num', (current_user.class_id,))
         elif class_name:
             # 如果指定了班级，获取该班级的学生
-            cursor.execute('SELECT id, name, gender, class, comments, updated_at FROM students WHERE class = ? ORDER BY CAST(id AS INTEGER)', (class_name,))
+            cursor.execute('SELECT id, name, gender, class, comments, updated_at FROM students WHERE class = ? ORDER BY id_num', (class_name,))
         else:
             # 否则获取所有学生
-            cursor.execute('SELECT id, name, gender, class, comments, updated_at FROM students ORDER BY class, CAST(id AS INTEGER)')
+            cursor.execute('SELECT id, name, gender, class, comments, updated_at FROM students ORDER BY class, id_num')
             
         students = cursor.fetchall()
         conn.close()
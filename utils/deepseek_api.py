@@ -1,20 +1,49 @@
 # -*- coding: utf-8 -*-
 import os
 import json
+import time
+import random
 import requests
 import logging
-from typing import Dict, Any, Optional
+import threading
+from email.utils import parsedate_to_datetime
+from typing import Dict, Any, Iterator, Optional
 import traceback
 
+from requests.adapters import HTTPAdapter
+
+from utils import comment_cache
+from utils import rate_limiter
+from config import DEEPSEEK_API_URL, AI_COMMENT_CONCURRENCY, AI_API_RETRIES, AI_API_BACKOFF, AI_API_BACKOFF_MAX
+
 # 配置日志
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# 需要重试的HTTP状态码：请求过于频繁和服务端临时错误
+RETRY_STATUS_CODES = frozenset([429, 500, 502, 503, 504])
+
+
+def _retry_after_seconds(response) -> Optional[float]:
+    """解析 Retry-After 响应头（秒数或HTTP日期），没有或无法解析时返回None"""
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
 class DeepSeekAPI:
     """DeepSeek API封装类，用于调用DeepSeek AI大模型生成学生评语"""
 
     # API端点
-    API_URL = "https://api.deepseek.com/v1/chat/completions"
+    API_URL = DEEPSEEK_API_URL
     
     def __init__(self, api_key: Optional[str] = None):
         """初始化DeepSeek API客户端
@@ -34,6 +63,117 @@ class DeepSeekAPI:
             logger.info("使用自定义DeepSeek API密钥")
         elif os.environ.get("DEEPSEEK_API_KEY"):
             logger.info("使用环境变量中的DeepSeek API密钥")
+        
+        # 复用连接的会话：连接池大小与批量生成的并发数一致，避免每次请求重新建立TCP和TLS连接
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(1, AI_COMMENT_CONCURRENCY))
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        
+        # 请求统计（每次HTTP请求的耗时、重试和失败次数）
+        self._stats_lock = threading.Lock()
+        self._stats = {"requests": 0, "retries": 0, "failures": 0, "total_ms": 0.0, "max_ms": 0.0, "last_ms": 0.0,
+                       "throttled": 0, "throttle_wait_ms": 0.0}
+    
+    def update_api_key(self, api_key: Optional[str]):
+        """更新API密钥（保留已建立的连接）"""
+        self.api_key = api_key
+        logger.info("DeepSeek API密钥已更新")
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """返回请求统计：请求数、重试数、失败数、平均/最长/最近一次耗时（毫秒）、限速排队次数和总等待时间"""
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats["avg_ms"] = round(stats["total_ms"] / stats["requests"], 1) if stats["requests"] else 0.0
+        for key in ("total_ms", "max_ms", "last_ms", "throttle_wait_ms"):
+            stats[key] = round(stats[key], 1)
+        return stats
+    
+    def _record(self, elapsed_ms: float, retried: bool = False, failed: bool = False):
+        with self._stats_lock:
+            self._stats["requests"] += 1
+            self._stats["total_ms"] += elapsed_ms
+            self._stats["last_ms"] = elapsed_ms
+            self._stats["max_ms"] = max(self._stats["max_ms"], elapsed_ms)
+            if retried:
+                self._stats["retries"] += 1
+            if failed:
+                self._stats["failures"] += 1
+    
+    @staticmethod
+    def _cached_comment(cache_key: str) -> Optional[str]:
+        """读取缓存的评语，缓存不可用时返回None（照常调用API）"""
+        try:
+            return comment_cache.lookup(cache_key)
+        except Exception as e:
+            logger.warning(f"读取评语缓存失败: {str(e)}")
+            return None
+    
+    @staticmethod
+    def _store_comment(cache_key: str, comment: str):
+        """保存生成的评语到缓存，失败时只记录日志"""
+        try:
+            comment_cache.store(cache_key, comment)
+        except Exception as e:
+            logger.warning(f"保存评语缓存失败: {str(e)}")
+    
+    def _post(self, payload: Dict[str, Any], timeout: float, retries: int = AI_API_RETRIES,
+              stream: bool = False) -> requests.Response:
+        """发送请求；返回429/5xx或连接失败时按指数退避（带随机抖动）重试，有 Retry-After 时按其等待
+        
+        读取超时不重试（模型已经在生成，重试只会让等待时间翻倍）。
+        每次发送前（包括重试）先从多进程共享的令牌桶取得许可，排队超时抛出 RateLimitTimeout。
+        
+        Args:
+            stream: 为True时收到响应头即返回，响应体由调用方逐行读取（耗时统计为首字节时间）
+        
+        Returns:
+            最后一次请求的响应（可能仍是错误状态，由调用方 raise_for_status）
+        """
+        headers = {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {self.api_key}"
+        }
+        attempt = 0
+        while True:
+            waited = rate_limiter.acquire()
+            if waited:
+                with self._stats_lock:
+                    self._stats["throttled"] += 1
+                    self._stats["throttle_wait_ms"] += waited * 1000
+            start = time.perf_counter()
+            try:
+                response = self.session.post(self.API_URL, headers=headers, json=payload, timeout=timeout,
+                                             stream=stream)
+                error = None
+            except requests.exceptions.ConnectionError as e:
+                response, error = None, e
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            status = response.status_code if response is not None else None
+            
+            if error is None and status not in RETRY_STATUS_CODES:
+                self._record(elapsed_ms, failed=status >= 400)
+                logger.info(f"DeepSeek API请求耗时 {elapsed_ms:.0f}ms，状态码 {status}")
+                return response
+            
+            # 计算下次重试前的等待时间
+            delay = _retry_after_seconds(response) if response is not None else None
+            if delay is None:
+                delay = random.uniform(0, min(AI_API_BACKOFF_MAX, AI_API_BACKOFF * (2 ** attempt)))
+            if attempt >= retries or delay > AI_API_BACKOFF_MAX:
+                self._record(elapsed_ms, failed=True)
+                logger.warning(f"DeepSeek API请求失败（{error or status}），耗时 {elapsed_ms:.0f}ms，已重试 {attempt} 次")
+                if error is not None:
+                    raise error
+                return response
+            
+            self._record(elapsed_ms, retried=True)
+            attempt += 1
+            logger.warning(f"DeepSeek API请求失败（{error or status}），{delay:.1f}秒后第 {attempt} 次重试")
+            # 流式请求的响应体没有读取，不关闭时连接要等垃圾回收才会还给连接池
+            if response is not None:
+                response.close()
+            time.sleep(delay)
     
     def test_connection(self) -> Dict[str, Any]:
         """测试API连接是否正常
@@ -47,12 +187,6 @@ class DeepSeekAPI:
                 "message": "未设置API密钥，无法测试连接"
             }
             
-        # 构建请求头
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {self.api_key}"
-        }
-        
         # 构建一个简单的请求体
         payload = {
             "model": "deepseek-chat",
@@ -67,7 +201,8 @@ class DeepSeekAPI:
         try:
             # 发送请求
             logger.info("正在测试DeepSeek API连接...")
-            response = requests.post(self.API_URL, headers=headers, json=payload, timeout=10)
+            # 测试连接时不重试，尽快给出结果
+            response = self._post(payload, timeout=10, retries=0)
             response.raise_for_status()  # 检查HTTP错误
             
             # 解析响应
@@ -106,38 +241,8 @@ class DeepSeekAPI:
                 "message": f"API连接测试失败: {str(e)}"
             }
     
-    def generate_comment(self, 
-                        student_info: Dict[str, Any], 
-                        style: str = "鼓励性的", 
-                        tone: str = "正式的", 
-                        max_length: int = 260) -> Dict[str, Any]:
-        """生成学生评语
-        
-        Args:
-            student_info: 学生信息，包含姓名、性别、特点、爱好等
-            style: 评语风格，如"鼓励性的"、"严肃的"、"中肯的"等
-            tone: 评语语气，如"正式的"、"亲切的"、"严厉的"等
-            max_length: 评语最大字数
-            
-        Returns:
-            包含生成评语的字典，格式为 {"status": "ok|error", "comment": "...", "message": "..."}
-        """
-        logger.info(f"开始为学生 {student_info.get('name')} 生成评语")
-        
-        if not self.api_key:
-            logger.error("API密钥未设置，无法调用API")
-            return {
-                "status": "error", 
-                "message": "未设置DeepSeek API密钥，无法调用API",
-                "comment": ""
-            }
-
-        # 构建请求头
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {self.api_key}"
-        }
-        
+    def _build_payload(self, student_info: Dict[str, Any], style: str, tone: str, max_length: int) -> Dict[str, Any]:
+        """构建生成评语的请求体（提示语和模型参数），流式和非流式请求共用，缓存键也据此计算"""
         # 构建提示语
         gender = "他" if student_info.get("gender") == "男" else "她"
         
@@ -178,12 +283,56 @@ class DeepSeekAPI:
             "temperature": 0.7,
             "max_tokens": max_length * 2  # 确保有足够的token来生成评语
         }
+        return payload
+    
+    def generate_comment(self, 
+                        student_info: Dict[str, Any], 
+                        style: str = "鼓励性的", 
+                        tone: str = "正式的", 
+                        max_length: int = 260,
+                        regenerate: bool = False) -> Dict[str, Any]:
+        """生成学生评语
+        
+        Args:
+            student_info: 学生信息，包含姓名、性别、特点、爱好等
+            style: 评语风格，如"鼓励性的"、"严肃的"、"中肯的"等
+            tone: 评语语气，如"正式的"、"亲切的"、"严厉的"等
+            max_length: 评语最大字数
+            regenerate: 为True时不使用缓存，重新调用API生成
+            
+        Returns:
+            包含生成评语的字典，格式为 {"status": "ok|error", "comment": "...", "message": "...", "cached": bool}
+        """
+        logger.info(f"开始为学生 {student_info.get('name')} 生成评语")
+        
+        if not self.api_key:
+            logger.error("API密钥未设置，无法调用API")
+            return {
+                "status": "error", 
+                "message": "未设置DeepSeek API密钥，无法调用API",
+                "comment": ""
+            }
+
+        payload = self._build_payload(student_info, style, tone, max_length)
+        
+        # 相同的请求直接返回缓存的评语（缓存不可用时照常调用API）
+        cache_key = comment_cache.make_cache_key(payload)
+        if not regenerate:
+            cached = self._cached_comment(cache_key)
+            if cached:
+                logger.info(f"学生 {student_info.get('name')} 的评语命中缓存")
+                return {
+                    "status": "ok",
+                    "comment": cached,
+                    "message": "评语生成成功",
+                    "cached": True
+                }
         
         try:
             # 发送请求
             logger.info(f"正在为学生 {student_info.get('name')} 发送API请求...")
             
-            response = requests.post(self.API_URL, headers=headers, json=payload, timeout=30)
+            response = self._post(payload, timeout=30)
             logger.info(f"API响应状态码: {response.status_code}")
             
             # 检查HTTP错误
@@ -206,10 +355,13 @@ class DeepSeekAPI:
                 if len(comment) > max_length:
                     logger.warning(f"生成的评语超过{max_length}字，长度为{len(comment)}字。这表明API没有严格遵循字数限制要求。")
                 
+                self._store_comment(cache_key, comment)
+                
                 return {
                     "status": "ok",
                     "comment": comment,
-                    "message": "评语生成成功"
+                    "message": "评语生成成功",
+                    "cached": False
                 }
             else:
                 logger.error(f"API返回格式异常，无choices字段: {result}")
@@ -241,4 +393,83 @@ class DeepSeekAPI:
                 "status": "error",
                 "message": f"评语生成失败: {str(e)}",
                 "comment": ""
-            } 
\ No newline at end of file
+            }
+    
+    def generate_comment_stream(self,
+                                student_info: Dict[str, Any],
+                                style: str = "鼓励性的",
+                                tone: str = "正式的",
+                                max_length: int = 260,
+                                regenerate: bool = False) -> Iterator[Dict[str, Any]]:
+        """流式生成学生评语，模型每生成一段文字就返回一段
+        
+        参数与 generate_comment 相同，两者共用评语缓存（命中缓存时整段评语作为一段返回）。
+        
+        Yields:
+            {"type": "delta", "text": "..."}：新生成的文字
+            {"type": "done", "comment": "...", "cached": bool}：生成完成，comment为完整评语
+            {"type": "error", "message": "..."}：生成失败，之后不再返回其他内容
+        """
+        logger.info(f"开始为学生 {student_info.get('name')} 流式生成评语")
+        
+        if not self.api_key:
+            logger.error("API密钥未设置，无法调用API")
+            yield {"type": "error", "message": "未设置DeepSeek API密钥，无法调用API"}
+            return
+        
+        payload = self._build_payload(student_info, style, tone, max_length)
+        cache_key = comment_cache.make_cache_key(payload)
+        if not regenerate:
+            cached = self._cached_comment(cache_key)
+            if cached:
+                logger.info(f"学生 {student_info.get('name')} 的评语命中缓存")
+                yield {"type": "delta", "text": cached}
+                yield {"type": "done", "comment": cached, "cached": True}
+                return
+        
+        parts = []
+        try:
+            response = self._post(dict(payload, stream=True), timeout=30, stream=True)
+            try:
+                response.raise_for_status()
+                # 响应为SSE格式：每行 "data: {...}"，以 "data: [DONE]" 结束
+                # chunk_size=None：收到一个数据块就处理，不等凑满固定字节数
+                for line in response.iter_lines(chunk_size=None):
+                    if not line.startswith(b"data:"):
+                        continue
+                    chunk = line[5:].strip()
+                    if chunk == b"[DONE]":
+                        break
+                    choices = json.loads(chunk).get("choices") or []
+                    text = (choices[0].get("delta") or {}).get("content") if choices else None
+                    if text:
+                        parts.append(text)
+                        yield {"type": "delta", "text": text}
+            finally:
+                # 客户端中途断开时也要关闭连接，停止接收模型输出
+                response.close()
+        except requests.exceptions.RequestException as e:
+            logger.error(f"API请求错误: {str(e)}")
+            yield {"type": "error", "message": f"评语生成失败: API请求错误: {str(e)}"}
+            return
+        except json.JSONDecodeError as e:
+            logger.error(f"API返回的数据块不是有效的JSON格式: {str(e)}")
+            yield {"type": "error", "message": "评语生成失败: API返回格式错误，无法解析为JSON"}
+            return
+        except Exception as e:
+            logger.error(f"流式生成评语时发生未知错误: {str(e)}")
+            logger.error(f"错误堆栈: {traceback.format_exc()}")
+            yield {"type": "error", "message": f"评语生成失败: {str(e)}"}
+            return
+        
+        comment = "".join(parts).strip()
+        if not comment:
+            logger.error("API流式响应中没有评语内容")
+            yield {"type": "error", "message": "评语生成失败: API返回格式异常，无法提取评语内容"}
+            return
+        if len(comment) > max_length:
+            logger.warning(f"生成的评语超过{max_length}字，长度为{len(comment)}字。这表明API没有严格遵循字数限制要求。")
+        
+        logger.info(f"流式生成评语完成: {comment[:50]}...")
+        self._store_comment(cache_key, comment)
+        yield {"type": "done", "comment": comment, "cached": False}
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+"""
+报告模板编译缓存
+
+DocxTemplate 每个学生都要重新读取模板文件、预处理模板XML并编译成Jinja模板。
+批量导出时同一模板要渲染几十上百次，这里按 模板路径 + 修改时间 缓存：
+- 模板文件内容（不再每个学生读一次磁盘）
+- 正文、页眉、页脚预处理（patch_xml）后的XML
+- 编译好的Jinja模板
+
+渲染和保存仍使用 DocxTemplate 公开的 render() / save()，图片、子文档等都按 docxtpl 的完整流程处理。
+"""
+
+import io
+import os
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+from docxtpl import DocxTemplate
+from jinja2 import Environment
+
+logger = logging.getLogger(__name__)
+
+# 最多缓存的模板数量
+MAX_CACHED_TEMPLATES = 8
+
+_templates = OrderedDict()
+_templates_lock = threading.Lock()
+
+
+class _CachingEnvironment(Environment):
+    """编译结果按模板源码缓存的Jinja环境，配置与 DocxTemplate 默认使用的 Template() 相同"""
+
+    def __init__(self):
+        super().__init__()
+        self._compiled = {}
+        self._compiled_lock = threading.Lock()
+
+    def from_string(self, source, globals=None, template_class=None):
+        if globals or template_class:
+            return super().from_string(source, globals, template_class)
+        with self._compiled_lock:
+            template = self._compiled.get(source)
+        if template is None:
+            template = super().from_string(source)
+            with self._compiled_lock:
+                self._compiled[source] = template
+        return template
+
+
+class _CachedDocxTemplate(DocxTemplate):
+    """patch_xml 结果从所属 CompiledTemplate 中复用的 DocxTemplate"""
+
+    def __init__(self, template_file, compiled):
+        super().__init__(template_file)
+        self._compiled_template = compiled
+
+    def patch_xml(self, src_xml):
+        return self._compiled_template.patch_xml(src_xml, super().patch_xml)
+
+
+class CompiledTemplate:
+    """一个模板文件的缓存"""
+
+    def __init__(self, name, data):
+        self.name = name
+        self.data = data
+        self.jinja_env = _CachingEnvironment()
+        self._patched = {}
+        self._patched_lock = threading.Lock()
+
+    def patch_xml(self, src_xml, patch):
+        with self._patched_lock:
+            patched = self._patched.get(src_xml)
+        if patched is None:
+            patched = patch(src_xml)
+            with self._patched_lock:
+                self._patched[src_xml] = patched
+        return patched
+
+    def new_document(self):
+        """从缓存的模板内容打开一个新的、未渲染的文档"""
+        return _CachedDocxTemplate(io.BytesIO(self.data), self)
+
+    def render(self, context):
+        """
+        渲染一份报告
+
+        Returns:
+            bytes: 生成的docx文件内容
+        """
+        doc = self.new_document()
+        doc.render(context, jinja_env=self.jinja_env)
+        output = io.BytesIO()
+        doc.save(output)
+        return output.getvalue()
+
+
+def _get_or_create(key, name, load):
+    with _templates_lock:
+        compiled = _templates.get(key)
+        if compiled is not None:
+            _templates.move_to_end(key)
+            return compiled
+
+    compiled = CompiledTemplate(name, load())
+    with _templates_lock:
+        # 同一文件的旧版本（修改时间不同）直接淘汰
+        for old_key in [k for k in _templates if k[0] == key[0]]:
+            del _templates[old_key]
+        _templates[key] = compiled
+        while len(_templates) > MAX_CACHED_TEMPLATES:
+            _templates.popitem(last=False)
+    logger.info(f"已缓存报告模板: {name}")
+    return compiled
+
+
+def load_template(template_path):
+    """获取模板文件的编译缓存，文件被修改（修改时间或大小变化）后自动重新加载"""
+    path = os.path.abspath(template_path)
+    stat = os.stat(path)
+
+    def load():
+        with open(path, 'rb') as f:
+            return f.read()
+
+    return _get_or_create((path, stat.st_mtime_ns, stat.st_size), template_path, load)
+
+
+def template_from_bytes(name, data):
+    """获取内存中模板（如内置默认模板）的编译缓存"""
+    digest = hashlib.md5(data).hexdigest()
+    return _get_or_create((f'<{name}>', digest, len(data)), name, lambda: data)
+
+
+def clear_template_cache():
+    """清空模板缓存"""
+    with _templates_lock:
+        _templates.clear()
@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+"""
+导出文件缓存
+
+同一个班级的数据没有变化时，反复导出得到的文件内容完全相同，没有必要重新生成。
+每次导出按（导出类型、模板及其版本、导出设置、参与导出的学生数据）计算缓存键，
+生成的文件记录在 SQLite 的 export_cache 表中；下次导出时缓存键相同且文件仍在，直接返回该文件。
+
+exports/ 目录按总大小（EXPORT_CACHE_MAX_MB）清理：超出时按最近使用时间删除最久未用的导出文件，
+缓存中的文件以最近一次命中为准，其他文件以修改时间为准；导出任务刚生成、可能还没下载的文件不删除。
+"""
+
+import os
+import json
+import time
+import hashlib
+import logging
+
+from database import get_db_connection
+from utils.export_jobs import pending_download_files
+from config import EXPORTS_FOLDER, EXPORT_CACHE_ENABLED, EXPORT_CACHE_MAX_MB
+
+logger = logging.getLogger(__name__)
+
+_CACHE_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS export_cache (
+    cache_key TEXT PRIMARY KEY,
+    filename TEXT NOT NULL,
+    size INTEGER NOT NULL DEFAULT 0,
+    created_at REAL,
+    last_used REAL
+);
+
+CREATE INDEX IF NOT EXISTS idx_export_cache_filename ON export_cache (filename);
+'''
+
+
+def ensure_export_cache(conn):
+    """创建缓存表（启动时调用，可重复执行）"""
+    conn.executescript(_CACHE_SCHEMA)
+    conn.commit()
+
+
+def file_version(path):
+    """模板等输入文件的版本（修改时间和大小），文件不存在时返回空字符串"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return ''
+    return f'{stat.st_mtime_ns}:{stat.st_size}'
+
+
+def make_cache_key(export_type, template_id, template_version, settings, rows):
+    """
+    计算导出文件的缓存键
+
+    Args:
+        export_type: 导出类型（如 comments_pdf、word、pdf）
+        template_id: 模板ID，没有模板时为None
+        template_version: 模板版本，见 file_version()
+        settings: 影响导出内容的设置（可JSON序列化）
+        rows: 参与导出的数据（学生记录、评语、成绩等），顺序即导出顺序
+
+    Returns:
+        str: 缓存键（SHA-256）
+    """
+    payload = json.dumps([export_type, template_id, template_version, settings, rows],
+                         sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def lookup(cache_key):
+    """
+    查找缓存的导出文件
+
+    Returns:
+        Optional[str]: exports目录下的文件名，没有缓存或文件已被删除时返回None
+    """
+    if not EXPORT_CACHE_ENABLED or not cache_key:
+        return None
+    conn = get_db_connection()
+    try:
+        row = conn.execute('SELECT filename, size FROM export_cache WHERE cache_key = ?', (cache_key,)).fetchone()
+        if row is None:
+            return None
+        filename = row['filename']
+        path = os.path.join(EXPORTS_FOLDER, filename)
+        if not os.path.isfile(path) or os.path.getsize(path) != row['size']:
+            conn.execute('DELETE FROM export_cache WHERE cache_key = ?', (cache_key,))
+            conn.commit()
+            return None
+        conn.execute('UPDATE export_cache SET last_used = ? WHERE cache_key = ?', (time.time(), cache_key))
+        conn.commit()
+    finally:
+        conn.close()
+    logger.info(f"导出缓存命中: {filename}")
+    return filename
+
+
+def store(cache_key, filename):
+    """记录新生成的导出文件，然后按目录大小清理旧文件"""
+    if not EXPORT_CACHE_ENABLED or not cache_key:
+        return
+    path = os.path.join(EXPORTS_FOLDER, filename)
+    if not os.path.isfile(path):
+        return
+    now = time.time()
+    conn = get_db_connection()
+    try:
+        conn.execute('''
+            INSERT OR REPLACE INTO export_cache (cache_key, filename, size, created_at, last_used)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (cache_key, filename, os.path.getsize(path), now, now))
+        conn.commit()
+    finally:
+        conn.close()
+    evict(keep=filename)
+
+
+def evict(max_bytes=None, keep=None):
+    """
+    exports目录超过大小上限时，按最近使用时间删除最久未用的文件
+
+    Args:
+        max_bytes: 目录大小上限，默认为 EXPORT_CACHE_MAX_MB
+        keep: 不删除的文件名（刚生成、即将下载的文件）；导出任务最近生成的文件也不删除（见 pending_download_files）
+
+    Returns:
+        int: 删除的文件数
+    """
+    if max_bytes is None:
+        max_bytes = EXPORT_CACHE_MAX_MB * 1024 * 1024
+
+    files = []
+    total = 0
+    try:
+        with os.scandir(EXPORTS_FOLDER) as entries:
+            for entry in entries:
+                # 正在写入的 .part 文件不计入也不删除
+                if not entry.is_file() or entry.name.endswith('.part'):
+                    continue
+                stat = entry.stat()
+                files.append([entry.name, stat.st_size, stat.st_mtime])
+                total += stat.st_size
+    except OSError as e:
+        logger.warning(f"读取导出目录失败: {str(e)}")
+        return 0
+    if total <= max_bytes:
+        return 0
+
+    conn = get_db_connection()
+    try:
+        last_used = dict(conn.execute('SELECT filename, MAX(last_used) FROM export_cache GROUP BY filename').fetchall())
+        for item in files:
+            item[2] = max(item[2], last_used.get(item[0]) or 0)
+        files.sort(key=lambda item: item[2])
+        protected = pending_download_files(conn)
+        if keep:
+            protected.add(keep)
+
+        removed = []
+        for name, size, _ in files:
+            if total <= max_bytes:
+                break
+            if name in protected:
+                continue
+            try:
+                os.remove(os.path.join(EXPORTS_FOLDER, name))
+            except OSError as e:
+                logger.warning(f"删除导出文件 {name} 失败: {str(e)}")
+                continue
+            total -= size
+            removed.append(name)
+
+        if removed:
+            conn.executemany('DELETE FROM export_cache WHERE filename = ?', [(name,) for name in removed])
+            conn.commit()
+            logger.info(f"导出目录超过 {max_bytes // (1024 * 1024)}MB，已删除 {len(removed)} 个最久未用的文件")
+        return len(removed)
+    finally:
+        conn.close()
@@ -0,0 +1,272 @@
+# -*- coding: utf-8 -*-
+"""
+后台导出任务
+
+导出请求只负责校验参数和读取数据，然后创建任务、交给后台线程生成报告，立即返回任务ID。
+任务状态、进度和取消标记保存在 SQLite 的 export_jobs 表中：
+多进程部署（gunicorn 多个 worker）时，查询进度和取消请求无论落到哪个进程都能看到同一份状态，
+生成的压缩包保存在 exports/ 目录，完成后通过 /api/export-jobs/<任务ID>/download 下载（校验任务所属用户）。
+"""
+
+import os
+import time
+import uuid
+import logging
+import tempfile
+import threading
+
+from database import get_db_connection
+from config import EXPORTS_FOLDER
+
+logger = logging.getLogger(__name__)
+
+# 任务状态
+STATUS_PENDING = 'pending'
+STATUS_RUNNING = 'running'
+STATUS_DONE = 'done'
+STATUS_FAILED = 'failed'
+STATUS_CANCELLED = 'cancelled'
+
+ACTIVE_STATUSES = (STATUS_PENDING, STATUS_RUNNING)
+
+# 进行中的任务超过该秒数没有更新进度，视为所在进程已退出
+# （耗时的步骤需定期刷新 updated_at，见 LibreOfficePool.convert；本进程中线程仍在运行的任务不受此限制）
+JOB_STALE_SECONDS = 600
+# 任务记录保留天数
+JOB_RETENTION_DAYS = 7
+# 任务完成后该秒数内，结果文件留给用户下载，导出目录按大小清理时不删除
+JOB_RESULT_KEEP_SECONDS = 24 * 3600
+# 两次写入进度之间的最小间隔（秒），避免每个学生都写一次数据库
+PROGRESS_INTERVAL = 0.5
+
+_JOBS_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS export_jobs (
+    id TEXT PRIMARY KEY,
+    user_id TEXT,
+    export_type TEXT,
+    status TEXT NOT NULL,
+    total INTEGER NOT NULL DEFAULT 0,
+    done INTEGER NOT NULL DEFAULT 0,
+    failed INTEGER NOT NULL DEFAULT 0,
+    current TEXT,
+    message TEXT,
+    filename TEXT,
+    cancel_requested INTEGER NOT NULL DEFAULT 0,
+    created_at REAL,
+    updated_at REAL
+);
+
+CREATE INDEX IF NOT EXISTS idx_export_jobs_created_at ON export_jobs (created_at);
+'''
+
+
+# 导出目录检查结果，由 check_exports_folder() 填充
+EXPORTS_FOLDER_CHECK = {}
+
+# 本进程中后台线程仍在执行的任务ID
+_running_jobs = set()
+_running_lock = threading.Lock()
+
+
+def check_exports_folder():
+    """
+    检查导出目录是否存在且可写（启动时调用一次，之后直接返回结果）
+
+    Returns:
+        Optional[str]: 错误信息，目录可用时返回None
+    """
+    if EXPORTS_FOLDER_CHECK:
+        return EXPORTS_FOLDER_CHECK['error']
+
+    error = None
+    try:
+        os.makedirs(EXPORTS_FOLDER, exist_ok=True)
+        with tempfile.TemporaryFile(dir=EXPORTS_FOLDER):
+            pass
+        logger.info(f"导出目录可写: {os.path.abspath(EXPORTS_FOLDER)}")
+    except OSError as e:
+        error = f'导出目录没有写入权限: {str(e)}'
+        logger.error(error)
+    EXPORTS_FOLDER_CHECK['error'] = error
+    return error
+
+
+class ExportCancelled(Exception):
+    """导出任务已被用户取消"""
+
+
+def ensure_export_jobs(conn):
+    """创建任务表（启动时调用，可重复执行）"""
+    conn.executescript(_JOBS_SCHEMA)
+    conn.commit()
+
+
+def create_job(user_id, export_type, total):
+    """
+    创建导出任务，同时清理过期的任务记录
+
+    Returns:
+        str: 任务ID
+    """
+    job_id = uuid.uuid4().hex
+    now = time.time()
+    conn = get_db_connection()
+    try:
+        conn.execute('DELETE FROM export_jobs WHERE created_at < ?', (now - JOB_RETENTION_DAYS * 86400,))
+        conn.execute('''
+            INSERT INTO export_jobs (id, user_id, export_type, status, total, created_at, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', (job_id, str(user_id) if user_id is not None else None, export_type, STATUS_PENDING, total, now, now))
+        conn.commit()
+    finally:
+        conn.close()
+    return job_id
+
+
+def pending_download_files(conn, now=None):
+    """进行中和最近完成（JOB_RESULT_KEEP_SECONDS 内）的任务的结果文件名，这些文件可能还没有被下载"""
+    if now is None:
+        now = time.time()
+    rows = conn.execute(f'''
+        SELECT filename FROM export_jobs
+        WHERE filename IS NOT NULL
+          AND (status IN ({', '.join('?' * len(ACTIVE_STATUSES))}) OR updated_at >= ?)
+    ''', ACTIVE_STATUSES + (now - JOB_RESULT_KEEP_SECONDS,)).fetchall()
+    return {row['filename'] for row in rows}
+
+
+def get_job(job_id):
+    """
+    获取任务状态
+
+    Returns:
+        dict: 任务信息，不存在时返回None
+    """
+    conn = get_db_connection()
+    try:
+        row = conn.execute('SELECT * FROM export_jobs WHERE id = ?', (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+
+        # 处理任务的进程已退出（重启、超时被杀等），任务不会再有进展；
+        # 任务在本进程中执行且线程仍在运行时，只是某一步耗时较长，不判定为中断
+        with _running_lock:
+            running_here = job_id in _running_jobs
+        if (job['status'] in ACTIVE_STATUSES and not running_here
+                and time.time() - (job['updated_at'] or 0) > JOB_STALE_SECONDS):
+            job['status'] = STATUS_FAILED
+            job['message'] = '导出任务长时间没有进展，可能已中断，请重新导出'
+            conn.execute('UPDATE export_jobs SET status = ?, message = ? WHERE id = ? AND status IN (?, ?)',
+                         (job['status'], job['message'], job_id) + ACTIVE_STATUSES)
+            conn.commit()
+        return job
+    finally:
+        conn.close()
+
+
+def request_cancel(job_id):
+    """
+    标记任务为取消，处理任务的线程在下一个学生之前停止
+
+    Returns:
+        bool: 任务存在且尚未结束时返回True
+    """
+    conn = get_db_connection()
+    try:
+        cursor = conn.execute(
+            'UPDATE export_jobs SET cancel_requested = 1 WHERE id = ? AND status IN (?, ?)',
+            (job_id,) + ACTIVE_STATUSES)
+        conn.commit()
+        return cursor.rowcount > 0
+    finally:
+        conn.close()
+
+
+def is_cancelled(job_id):
+    """检查任务是否已被请求取消"""
+    if not job_id:
+        return False
+    conn = get_db_connection()
+    try:
+        row = conn.execute('SELECT cancel_requested FROM export_jobs WHERE id = ?', (job_id,)).fetchone()
+        return bool(row and row[0])
+    finally:
+        conn.close()
+
+
+class JobProgress:
+    """后台线程中更新任务进度的句柄"""
+
+    def __init__(self, job_id):
+        self.job_id = job_id
+        self.finished = False
+        self._last_write = 0.0
+
+    def _update(self, **fields):
+        fields['updated_at'] = time.time()
+        assignments = ', '.join(f'{name} = ?' for name in fields)
+        conn = get_db_connection()
+        try:
+            conn.execute(f'UPDATE export_jobs SET {assignments} WHERE id = ?', list(fields.values()) + [self.job_id])
+            conn.commit()
+        finally:
+            conn.close()
+
+    def update(self, force=False, **fields):
+        """
+        更新进度字段（done、failed、current、message 等），按 PROGRESS_INTERVAL 节流
+
+        Args:
+            force: 为True时忽略节流立即写入
+        """
+        now = time.time()
+        if not force and now - self._last_write < PROGRESS_INTERVAL:
+            return
+        self._last_write = now
+        self._update(**fields)
+
+    def check_cancelled(self):
+        """任务已被取消时抛出 ExportCancelled"""
+        if is_cancelled(self.job_id):
+            raise ExportCancelled(f'导出任务 {self.job_id} 已被取消')
+
+    def finish(self, status, message, filename=None, **fields):
+        """记录任务结果"""
+        self.finished = True
+        self._update(status=status, message=message, filename=filename, current=None, **fields)
+
+
+def start_job(job_id, target, *args):
+    """
+    在后台线程中执行导出任务
+
+    Args:
+        target: 任务函数，调用方式为 target(progress, *args)，需自行调用 progress.finish() 记录结果；
+                抛出 ExportCancelled 或其他异常时由这里记录为已取消或失败
+    """
+    def run():
+        progress = JobProgress(job_id)
+        with _running_lock:
+            _running_jobs.add(job_id)
+        try:
+            progress.update(force=True, status=STATUS_RUNNING)
+            target(progress, *args)
+            if not progress.finished:
+                progress.finish(STATUS_DONE, '导出完成')
+        except ExportCancelled:
+            logger.info(f"导出任务 {job_id} 已取消")
+            progress.finish(STATUS_CANCELLED, '导出操作已被用户取消')
+        except Exception as e:
+            logger.exception(f"导出任务 {job_id} 失败: {str(e)}")
+            try:
+                progress.finish(STATUS_FAILED, f'导出报告失败: {str(e)}')
+            except Exception:
+                logger.exception(f"记录导出任务 {job_id} 的失败状态时出错")
+        finally:
+            with _running_lock:
+                _running_jobs.discard(job_id)
+
+    thread = threading.Thread(target=run, name=f'export-job-{job_id[:8]}', daemon=True)
+    thread.start()
+    return thread
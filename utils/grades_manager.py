@@ -1,18 +1,20 @@
 # -*- coding: utf-8 -*-
 import sqlite3
 import os
+from database import get_db_connection
+from utils.json_stream import iter_query
 import pandas as pd
 from datetime import datetime
 import traceback
 
 class GradesManager:
-    def __init__(self, db_path="students.db"):
+    def __init__(self, db_path=None):
         self.db_path = db_path
         self._ensure_table_exists()
     
     def _ensure_table_exists(self):
         """确保学生表存在并包含必要的成绩字段"""
-        conn = sqlite3.connect(self.db_path)
+        conn = get_db_connection(self.db_path, row_factory=None)
         cursor = conn.cursor()
         
         # 检查学生表结构
@@ -39,35 +41,49 @@ class GradesManager:
         conn.commit()
         conn.close()
     
+    def _all_grades_query(self, class_id=None):
+        """构建获取所有学生成绩的SQL查询"""
+        sql = '''
+            SELECT 
+                id AS student_id, 
+                class_id,
+                name AS student_name, 
+                class, 
+                daof, yuwen, shuxue, yingyu, laodong, 
+                tiyu, yinyue, meishu, kexue, zonghe, 
+                xinxi, shufa
+            FROM students
+        '''
+        
+        params = []
+        
+        # 添加班级ID筛选
+        if class_id:
+            sql += " WHERE class_id = ?"
+            params.append(class_id)
+        
+        # 添加排序
+        sql += " ORDER BY class, id_num"
+        return sql, params
+    
+    def iter_all_grades(self, semester="上学期", class_id=None):
+        """逐条生成所有学生的成绩，用于流式输出"""
+        sql, params = self._all_grades_query(class_id)
+        
+        def add_semester(student):
+            student['semester'] = semester
+            return student
+        
+        return iter_query(sql, params, row_hook=add_semester, db_path=self.db_path)
+    
     def get_all_grades(self, semester="上学期", class_id=None):
         """获取所有学生的成绩"""
         print(f"获取所有学生成绩，学期: {semester}, 班级ID: {class_id}")
-        conn = sqlite3.connect(self.db_path)
+        conn = get_db_connection(self.db_path, row_factory=None)
         cursor = conn.cursor()
         
         try:
-            # 构建SQL查询
-            sql = '''
-                SELECT 
-                    id AS student_id, 
-                    class_id,
-                    name AS student_name, 
-                    class, 
-                    daof, yuwen, shuxue, yingyu, laodong, 
-                    tiyu, yinyue, meishu, kexue, zonghe, 
-                    xinxi, shufa
-                FROM students
-            '''
-            
-            params = []
-            
-            # 添加班级ID筛选
-            if class_id:
-                sql += " WHERE class_id = ?"
-                params.append(class_id)
-            
-            # 添加排序
-            sql += " ORDER BY class, CAST(id AS INTEGER)"
+            sql, params = self._all_grades_query(class_id)
             
             # 执行查询
             cursor.execute(sql, params)
@@ -94,7 +110,7 @@ class GradesManager:
     
     def get_student_grade(self, student_id, class_id, semester="上学期"):
         """获取单个学生的成绩记录"""
-        conn = sqlite3.connect(self.db_path)
+        conn = get_db_connection(self.db_path, row_factory=None)
         cursor = conn.cursor()
         
         # 查询学生信息和成绩
@@ -161,7 +177,7 @@ class GradesManager:
     
     def get_student_grades(self, student_id, class_id, semester="上学期"):
         """获取单个学生的成绩记录"""
-        conn = sqlite3.connect(self.db_path)
+        conn = get_db_connection(self.db_path, row_factory=None)
         cursor = conn.cursor()
         
         # 查询学生信息和成绩
@@ -231,7 +247,7 @@ class GradesManager:
         print(f"准备保存学生 {student_id} (班级ID: {class_id}) 的成绩，学期: {semester}")
         print(f"成绩数据: {grade_data}")
         
-        conn = sqlite3.connect(self.db_path)
+        conn = get_db_connection(self.db_path, row_factory=None)
         cursor = conn.cursor()
         
         now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
@@ -297,7 +313,7 @@ class GradesManager:
     
     def delete_grade(self, student_id, class_id, semester="上学期"):
         """清空学生的成绩记录"""
-        conn = sqlite3.connect(self.db_path)
+        conn = get_db_connection(self.db_path, row_factory=None)
         cursor = conn.cursor()
         
         try:
@@ -349,7 +365,7 @@ class GradesManager:
                 if col not in df.columns:
                     return False, f"Excel文件缺少必要的列: {col}"
             
-            conn = sqlite3.connect(self.db_path)
+            conn = get_db_connection(self.db_path, row_factory=None)
             cursor = conn.cursor()
             
             # 获取列名映射
@@ -552,7 +568,7 @@ class GradesManager:
             }
             
             # 从数据库获取学生信息
-            conn = sqlite3.connect(self.db_path)
+            conn = get_db_connection(self.db_path, row_factory=None)
             cursor = conn.cursor()
             
             # 根据班级ID筛选学生
@@ -947,7 +963,7 @@ class GradesManager:
         from openpyxl.utils import get_column_letter
         
         # 获取所有学生
-        conn = sqlite3.connect(self.db_path)
+        conn = get_db_connection(self.db_path, row_factory=None)
         cursor = conn.cursor()
         
         # 根据班级ID筛选学生
@@ -955,12 +971,12 @@ class GradesManager:
             cursor.execute('''
             SELECT id, name, class, class_id FROM students
             WHERE class_id = ?
-            ORDER BY class, CAST(id AS INTEGER)
+            ORDER BY class, id_num
             ''', (class_id,))
         else:
             cursor.execute('''
             SELECT id, name, class, class_id FROM students
-            ORDER BY class, CAST(id AS INTEGER)
+            ORDER BY class, id_num
             ''')
         
         students = []
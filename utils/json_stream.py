@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+"""
+流式JSON响应
+
+列表接口不再先把全部记录放进列表再整体 jsonify，而是边用 fetchmany 读取游标边输出：
+每个请求的内存占用与记录总数无关，查询尚未结束时第一批数据已经发往浏览器。
+"""
+
+import logging
+
+from flask import json, stream_with_context, current_app
+
+from database import get_db_connection
+
+logger = logging.getLogger(__name__)
+
+# 每次从游标读取的行数
+FETCH_SIZE = 500
+
+
+def iter_query(sql, params=(), row_hook=None, fetch_size=FETCH_SIZE, db_path=None):
+    """
+    逐批读取查询结果，逐行生成字典
+
+    需在 stream_json_list() 的生成器中使用，连接在迭代结束时释放。
+
+    Args:
+        row_hook: 对每行字典的处理函数，返回处理后的字典
+    """
+    conn = get_db_connection(db_path)
+    try:
+        cursor = conn.execute(sql, params)
+        while True:
+            rows = cursor.fetchmany(fetch_size)
+            if not rows:
+                break
+            for row in rows:
+                item = dict(row)
+                yield row_hook(item) if row_hook else item
+    finally:
+        conn.close()
+
+
+def stream_json_list(key, items, extra=None, count_key='count'):
+    """
+    以流式方式输出 {...extra, key: [items...], count_key: 条数}
+
+    Args:
+        key: 列表字段名，如 'students'
+        items: 可迭代的字典序列，通常为 iter_query() 的返回值
+        extra: 列表之前输出的其他字段，如 status、total
+        count_key: 列表之后输出的条数字段名，为None时不输出
+
+    Returns:
+        Response: 流式响应
+    """
+    head = dict(extra or {})
+
+    def generate():
+        prefix = json.dumps(head)[:-1]
+        yield (prefix + ', ' if head else '{') + json.dumps(key) + ': ['
+
+        count = 0
+        try:
+            for item in items:
+                yield (', ' if count else '') + json.dumps(item)
+                count += 1
+        except Exception as e:
+            # 响应头已发出，无法再返回错误状态；中断输出让客户端解析失败，而不是收到不完整的列表
+            logger.error(f"流式输出 {key} 时出错（已输出 {count} 条）: {str(e)}")
+            raise
+
+        tail = ']'
+        if count_key:
+            tail += ', ' + json.dumps(count_key) + ': ' + json.dumps(count)
+        yield tail + '}'
+
+    return current_app.response_class(stream_with_context(generate()), mimetype='application/json')
@@ -0,0 +1,340 @@
+# -*- coding: utf-8 -*-
+"""
+LibreOffice 转换进程池（Linux 上的 DOCX → PDF 转换）
+
+服务器上没有 Word，PDF 导出改用无界面的 LibreOffice（soffice --headless）：
+- 进程池中每个实例使用自己的用户配置目录，多个转换可以同时进行，互不抢占配置锁；
+- 能导入 uno 模块（python3-uno）时，实例以监听模式常驻，转换通过 UNO 接口发送给已启动的 soffice，
+  不再为每份文档启动一次 LibreOffice；
+- 否则每批文件调用一次 soffice --convert-to，一次命令转换一小批文档（配置目录保留，后续启动更快）。
+
+每份文档都有超时，超时的实例会被结束并在下次使用时重新启动；转换失败的文件逐个重试。
+每份文档（命令行方式为每批）转换前检查取消标记并报告进度。
+"""
+
+import os
+import time
+import queue
+import shutil
+import signal
+import socket
+import atexit
+import logging
+import tempfile
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from config import SOFFICE_PATH, PDF_CONVERT_WORKERS, PDF_CONVERT_TIMEOUT, PDF_CONVERT_RETRIES
+
+logger = logging.getLogger(__name__)
+
+# soffice 启动并开始监听的最长等待秒数
+STARTUP_TIMEOUT = 30
+# 等待转换完成时调用 check_cancelled 的间隔（秒），导出任务借此刷新进度时间，不会因转换耗时长被判定为中断
+HEARTBEAT_INTERVAL = 10
+# 命令行方式每次 soffice 命令最多转换的文档数，批次小一些取消和进度更及时
+CLI_BATCH_SIZE = 10
+
+try:
+    import uno
+    from com.sun.star.beans import PropertyValue
+    UNO_AVAILABLE = True
+except ImportError:
+    UNO_AVAILABLE = False
+
+
+def find_soffice():
+    """查找 LibreOffice 可执行文件，未安装时返回None"""
+    if SOFFICE_PATH:
+        return SOFFICE_PATH if os.path.exists(SOFFICE_PATH) else None
+    for name in ('soffice', 'libreoffice'):
+        path = shutil.which(name)
+        if path:
+            return path
+    return None
+
+
+def libreoffice_available():
+    """是否可以使用 LibreOffice 转换PDF"""
+    return find_soffice() is not None
+
+
+def _prop(name, value):
+    prop = PropertyValue()
+    prop.Name = name
+    prop.Value = value
+    return prop
+
+
+def _pdf_path(docx_path, output_dir):
+    return os.path.join(output_dir, os.path.splitext(os.path.basename(docx_path))[0] + '.pdf')
+
+
+def _converted(pdf_path):
+    return os.path.exists(pdf_path) and os.path.getsize(pdf_path) > 0
+
+
+class _OfficeInstance:
+    """进程池中的一个 LibreOffice 实例"""
+
+    def __init__(self, slot, soffice):
+        self.slot = slot
+        self.soffice = soffice
+        self.profile_dir = os.path.join(tempfile.gettempdir(), f'classmaster_lo_{os.getpid()}_{slot}')
+        self.process = None
+        self.desktop = None
+
+    def _base_args(self):
+        return [self.soffice, '--headless', '--invisible', '--nologo', '--norestore', '--nolockcheck',
+                '--nodefault', f'-env:UserInstallation=file://{self.profile_dir}']
+
+    def _start(self):
+        """启动监听模式的 soffice 并通过 UNO 连接"""
+        with socket.socket() as s:
+            s.bind(('127.0.0.1', 0))
+            port = s.getsockname()[1]
+        connection = f'socket,host=127.0.0.1,port={port};urp;StarOffice.ComponentContext'
+        self.process = subprocess.Popen(self._base_args() + [f'--accept={connection}'],
+                                        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True)
+
+        local = uno.getComponentContext()
+        resolver = local.ServiceManager.createInstanceWithContext('com.sun.star.bridge.UnoUrlResolver', local)
+        deadline = time.monotonic() + STARTUP_TIMEOUT
+        while True:
+            try:
+                context = resolver.resolve(f'uno:{connection}')
+                break
+            except Exception:
+                if self.process.poll() is not None or time.monotonic() > deadline:
+                    self.stop()
+                    raise RuntimeError(f'LibreOffice 实例 {self.slot} 启动失败')
+                time.sleep(0.5)
+        self.desktop = context.ServiceManager.createInstanceWithContext('com.sun.star.frame.Desktop', context)
+        logger.info(f"LibreOffice 实例 {self.slot} 已启动，端口: {port}")
+
+    def stop(self):
+        """结束 soffice 进程"""
+        self.desktop = None
+        process, self.process = self.process, None
+        if process is None or process.poll() is not None:
+            return
+        # 连同 soffice.bin 子进程一起结束
+        os.killpg(process.pid, signal.SIGTERM)
+        try:
+            process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            os.killpg(process.pid, signal.SIGKILL)
+            process.wait()
+
+    def convert(self, docx_paths, output_dir, timeout, before_document=None):
+        """
+        转换一批文档
+
+        Args:
+            before_document: 每份文档（命令行方式为整批）转换前调用，返回False时不再转换剩余的文档
+
+        Returns:
+            dict: {docx路径: pdf路径或None}
+        """
+        if UNO_AVAILABLE:
+            return self._convert_uno(docx_paths, output_dir, timeout, before_document)
+        return self._convert_cli(docx_paths, output_dir, timeout, before_document)
+
+    def _convert_uno(self, docx_paths, output_dir, timeout, before_document=None):
+        results = {docx_path: None for docx_path in docx_paths}
+        for docx_path in docx_paths:
+            if before_document and not before_document():
+                break
+            pdf_path = _pdf_path(docx_path, output_dir)
+            if self.process is None or self.process.poll() is not None:
+                # 启动失败时返回已转换的部分，剩余的文档由调用方重试
+                try:
+                    self._start()
+                except Exception as e:
+                    logger.error(f"LibreOffice 实例 {self.slot} 启动失败，本批剩余文档未转换: {str(e)}")
+                    self.stop()
+                    break
+
+            # 超时后结束进程，阻塞中的 UNO 调用随之抛出异常
+            watchdog = threading.Timer(timeout, self.stop)
+            watchdog.start()
+            try:
+                document = self.desktop.loadComponentFromURL(
+                    uno.systemPathToFileUrl(os.path.abspath(docx_path)), '_blank', 0, (_prop('Hidden', True),))
+                try:
+                    document.storeToURL(uno.systemPathToFileUrl(os.path.abspath(pdf_path)),
+                                        (_prop('FilterName', 'writer_pdf_Export'),))
+                finally:
+                    document.close(True)
+            except Exception as e:
+                if watchdog.is_alive():
+                    logger.warning(f"LibreOffice 转换 {os.path.basename(docx_path)} 失败: {str(e)}")
+                else:
+                    logger.warning(f"LibreOffice 转换 {os.path.basename(docx_path)} 超时（{timeout}秒），实例已重启")
+            finally:
+                watchdog.cancel()
+            results[docx_path] = pdf_path if _converted(pdf_path) else None
+        return results
+
+    def _convert_cli(self, docx_paths, output_dir, timeout, before_document=None):
+        if before_document and not before_document():
+            return {docx_path: None for docx_path in docx_paths}
+        # 一次命令转换整批文件，总超时按文档数计算（含启动时间）
+        args = self._base_args() + ['--convert-to', 'pdf', '--outdir', output_dir] + list(docx_paths)
+        try:
+            # soffice 是启动脚本，实际进程（soffice.bin）是它的子进程，超时时结束整个进程组
+            process = subprocess.Popen(args, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, start_new_session=True)
+            try:
+                _, stderr = process.communicate(timeout=STARTUP_TIMEOUT + timeout * len(docx_paths))
+                if process.returncode != 0:
+                    logger.warning(f"soffice 返回 {process.returncode}: {stderr.decode(errors='replace')[:200]}")
+            except subprocess.TimeoutExpired:
+                logger.warning(f"LibreOffice 转换 {len(docx_paths)} 个文件超时")
+                os.killpg(process.pid, signal.SIGKILL)
+                process.communicate()
+        except OSError as e:
+            logger.error(f"无法启动 LibreOffice: {str(e)}")
+
+        results = {}
+        for docx_path in docx_paths:
+            pdf_path = _pdf_path(docx_path, output_dir)
+            results[docx_path] = pdf_path if _converted(pdf_path) else None
+        return results
+
+
+class LibreOfficePool:
+    """LibreOffice 实例池，实例在第一次使用时启动，之后常驻复用"""
+
+    def __init__(self, size, soffice):
+        self.size = size
+        self._instances = queue.Queue()
+        self._all = []
+        for slot in range(size):
+            instance = _OfficeInstance(slot, soffice)
+            self._instances.put(instance)
+            self._all.append(instance)
+
+    def _convert_batch(self, docx_paths, output_dir, timeout, before_document=None):
+        instance = self._instances.get()
+        try:
+            return instance.convert(docx_paths, output_dir, timeout, before_document)
+        except Exception as e:
+            logger.error(f"LibreOffice 实例 {instance.slot} 转换出错: {str(e)}")
+            instance.stop()
+            return {docx_path: None for docx_path in docx_paths}
+        finally:
+            self._instances.put(instance)
+
+    def convert(self, docx_paths, output_dir, timeout=PDF_CONVERT_TIMEOUT, retries=PDF_CONVERT_RETRIES,
+                check_cancelled=None):
+        """
+        把一组文档转换为PDF，文件平均分给各实例同时转换，失败的文件逐个重试
+
+        Args:
+            docx_paths: 待转换的文档路径列表
+            output_dir: PDF输出目录
+            timeout: 每份文档的超时秒数
+            retries: 失败文件的重试次数
+            check_cancelled: 每份文档（命令行方式为每批）转换前及等待转换期间每 HEARTBEAT_INTERVAL 秒调用，
+                可抛出异常中止转换
+
+        Returns:
+            dict: {docx路径: pdf路径或None}
+        """
+        results = {}
+        pending = list(docx_paths)
+        for attempt in range(retries + 1):
+            if not pending:
+                break
+            if attempt > 0:
+                logger.info(f"重试第{attempt}次转换 {len(pending)} 个文件")
+
+            # 第一次按实例数分批（命令行方式每批不超过 CLI_BATCH_SIZE 个），
+            # 重试时每个文件单独转换，避免再次被同批的问题文件拖累
+            if attempt > 0:
+                batch_count = len(pending)
+            elif UNO_AVAILABLE:
+                batch_count = min(self.size, len(pending))
+            else:
+                batch_count = max(min(self.size, len(pending)), -(-len(pending) // CLI_BATCH_SIZE))
+            batches = [pending[i::batch_count] for i in range(batch_count)]
+
+            # 转换线程中 check_cancelled 抛出的异常先记下来，通知其他实例停止，再在这里重新抛出
+            stop = threading.Event()
+            errors = []
+
+            def before_document():
+                if stop.is_set():
+                    return False
+                if check_cancelled:
+                    try:
+                        check_cancelled()
+                    except Exception as e:
+                        errors.append(e)
+                        stop.set()
+                        return False
+                return True
+
+            with ThreadPoolExecutor(max_workers=self.size) as executor:
+                futures = [executor.submit(self._convert_batch, batch, output_dir, timeout, before_document)
+                           for batch in batches]
+                try:
+                    not_done = futures
+                    while not_done and not stop.is_set():
+                        _, not_done = wait(not_done, timeout=HEARTBEAT_INTERVAL)
+                        if not_done and check_cancelled:
+                            check_cancelled()
+                    if errors:
+                        raise errors[0]
+                except BaseException:
+                    # 中止时不再开始尚未执行的批次，执行中的批次在下一份文档前停止
+                    stop.set()
+                    for future in futures:
+                        future.cancel()
+                    raise
+                for future in futures:
+                    results.update(future.result())
+            pending = [docx_path for docx_path in pending if results.get(docx_path) is None]
+
+        if pending:
+            logger.warning(f"LibreOffice 未能转换 {len(pending)} 个文件")
+        return results
+
+    def shutdown(self):
+        """结束所有实例并删除配置目录"""
+        for instance in self._all:
+            instance.stop()
+            shutil.rmtree(instance.profile_dir, ignore_errors=True)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """获取进程内共享的 LibreOffice 实例池，未安装 LibreOffice 时返回None"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            soffice = find_soffice()
+            if soffice is None:
+                return None
+            _pool = LibreOfficePool(max(1, PDF_CONVERT_WORKERS), soffice)
+            atexit.register(_pool.shutdown)
+            logger.info(f"已创建 LibreOffice 转换池: {soffice}，实例数: {_pool.size}，UNO: {UNO_AVAILABLE}")
+        return _pool
+
+
+def convert_with_libreoffice(docx_paths, output_dir, check_cancelled=None, retries=PDF_CONVERT_RETRIES):
+    """
+    使用 LibreOffice 实例池把文档转换为PDF
+
+    Returns:
+        dict: {docx路径: pdf路径或None}；未安装 LibreOffice 时全部为None
+    """
+    pool = get_pool()
+    if pool is None:
+        logger.error("未找到 LibreOffice（soffice），无法转换PDF")
+        return {docx_path: None for docx_path in docx_paths}
+    return pool.convert(docx_paths, output_dir, retries=retries, check_cancelled=check_cancelled)
@@ -13,6 +13,10 @@ import traceback
 import time
 from datetime import datetime
 from flask_login import current_user
+from database import get_db_connection
+from utils.pdf_fonts import find_font
+from utils.export_jobs import check_exports_folder
+from utils import export_cache
 
 # 配置日志
 logger = logging.getLogger(__name__)
@@ -32,8 +36,7 @@ except ImportError:
     REPORTLAB_AVAILABLE = False
     logger.error("PDF导出模块: 无法导入ReportLab库，PDF生成功能将不可用")
 
-# 数据库连接和导出目录配置
-DATABASE = 'students.db'
+# 导出目录配置
 EXPORTS_FOLDER = 'exports'
 
 # 确保导出目录存在
@@ -48,58 +51,33 @@ if not os.path.exists(EXPORTS_FOLDER):
 FONTS_FOLDER = 'utils/fonts'
 os.makedirs(FONTS_FOLDER, exist_ok=True)
 
-# 获取数据库连接
-def get_db_connection():
-    """获取SQLite数据库连接"""
-    conn = sqlite3.connect(DATABASE)
-    conn.row_factory = sqlite3.Row
-    return conn
+# 中文字体候选列表，按顺序使用第一个可用的字体 - 优先使用macOS系统字体
+FONT_CANDIDATES = [
+    # macOS系统字体
+    ('/System/Library/Fonts/PingFang.ttc', 'PingFang'),
+    ('/System/Library/Fonts/STHeiti Light.ttc', 'STHeiti'),
+    ('/System/Library/Fonts/STHeiti Medium.ttc', 'STHeiti-Medium'),
+    ('/System/Library/Fonts/Hiragino Sans GB.ttc', 'Hiragino'),
+    ('/Library/Fonts/Microsoft/SimSun.ttf', 'SimSun'),
+    ('/Library/Fonts/Arial Unicode.ttf', 'Arial-Unicode'),
+    # 项目字体目录
+    (f'{FONTS_FOLDER}/SimSun.ttf', 'SimSun'),
+    (f'{FONTS_FOLDER}/SourceHanSerifCN-Regular.otf', 'SourceHan'),
+    # Windows系统字体
+    ('C:/Windows/Fonts/simsun.ttc', 'SimSun-Win'),
+    ('C:/Windows/Fonts/simhei.ttf', 'SimHei-Win')
+]
 
 # 注册中文字体
 def register_fonts():
-    """注册中文字体，确保PDF可以正确显示中文"""
+    """注册中文字体，确保PDF可以正确显示中文（每个进程只注册一次），返回字体名"""
     if not REPORTLAB_AVAILABLE:
         logger.error("ReportLab库不可用，无法注册字体")
         return False
     
-    # 检查字体目录
-    if not os.path.exists(FONTS_FOLDER):
-        try:
-            os.makedirs(FONTS_FOLDER, exist_ok=True)
-            logger.info(f"创建字体目录: {FONTS_FOLDER}")
-        except Exception as e:
-            logger.error(f"创建字体目录失败: {str(e)}")
-    
-    # 尝试注册常见中文字体 - 优先使用macOS系统字体
-    font_files = [
-        # macOS系统字体
-        ('/System/Library/Fonts/PingFang.ttc', 'PingFang'),
-        ('/System/Library/Fonts/STHeiti Light.ttc', 'STHeiti'),
-        ('/System/Library/Fonts/STHeiti Medium.ttc', 'STHeiti-Medium'),
-        ('/System/Library/Fonts/Hiragino Sans GB.ttc', 'Hiragino'),
-        ('/Library/Fonts/Microsoft/SimSun.ttf', 'SimSun'),
-        ('/Library/Fonts/Arial Unicode.ttf', 'Arial-Unicode'),
-        # 项目字体目录
-        (f'{FONTS_FOLDER}/SimSun.ttf', 'SimSun'),
-        (f'{FONTS_FOLDER}/SourceHanSerifCN-Regular.otf', 'SourceHan'),
-        # Windows系统字体
-        ('C:/Windows/Fonts/simsun.ttc', 'SimSun-Win'),
-        ('C:/Windows/Fonts/simhei.ttf', 'SimHei-Win')
-    ]
-    
-    # 尝试所有可能的字体，直到成功注册一个
-    for font_path, font_name in font_files:
-        try:
-            if os.path.exists(font_path):
-                logger.info(f"找到字体文件: {font_path}")
-                pdfmetrics.registerFont(TTFont(font_name, font_path))
-                logger.info(f"成功注册中文字体: {font_path} 作为 {font_name}")
-                return font_name
-            else:
-                logger.info(f"字体文件不存在: {font_path}")
-        except Exception as e:
-            logger.warning(f"注册字体 {font_path} 失败: {str(e)}")
-            logger.warning(traceback.format_exc())
+    font_name = find_font(FONT_CANDIDATES)
+    if font_name:
+        return font_name
     
     # 如果无法找到中文字体，尝试使用默认字体
     logger.warning("无法注册中文字体，将使用默认字体")
@@ -130,28 +108,10 @@ def export_comments_to_pdf(class_name=None, output_file=None, school_name=None,
             'message': 'PDF生成库(ReportLab)未安装，无法生成PDF文件。请安装库: pip install reportlab'
         }
     
-    # 确保导出目录存在且可写
-    try:
-        if not os.path.exists(EXPORTS_FOLDER):
-            os.makedirs(EXPORTS_FOLDER, exist_ok=True)
-            logger.info(f"创建导出目录: {EXPORTS_FOLDER}")
-            
-        # 尝试创建测试文件验证写入权限
-        test_file = os.path.join(EXPORTS_FOLDER, "test_write.txt")
-        try:
-            with open(test_file, 'w') as f:
-                f.write("测试写入权限")
-            if os.path.exists(test_file):
-                os.remove(test_file)
-            logger.info("导出目录写入权限测试成功")
-        except Exception as e:
-            logger.error(f"导出目录写入权限测试失败: {str(e)}")
-            return {'status': 'error', 'message': f'导出目录没有写入权限: {str(e)}'}
-            
-    except Exception as e:
-        logger.error(f"创建导出目录时出错: {str(e)}")
-        logger.error(traceback.format_exc())
-        return {'status': 'error', 'message': f'创建导出目录时出错: {str(e)}'}
+    # 导出目录的写入权限在启动时检查一次
+    exports_error = check_exports_folder()
+    if exports_error:
+        return {'status': 'error', 'message': exports_error}
     
     # 生成导出文件名
     timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
@@ -180,21 +140,21 @@ def export_comments_to_pdf(class_name=None, output_file=None, school_name=None,
         if hasattr(current_user, 'is_admin') and not current_user.is_admin and hasattr(current_user, 'class_id') and current_user.class_id:
             # 班主任只能导出本班级学生
             if class_name:
-                query = 'SELECT id, name, gender, class, comments, updated_at FROM students WHERE class = ? AND class_id = ? ORDER BY CAST(id AS INTEGER)'
+                query = 'SELECT id, name, gender, class, comments, updated_at FROM students WHERE class = ? AND class_id = ? ORDER BY id_num'
                 logger.info(f"班主任模式: 执行查询: {query} 参数: {class_name}, {current_user.class_id}")
                 cursor.execute(query, (class_name, current_user.class_id))
             else:
-                query = 'SELECT id, name, gender, class, comments, updated_at FROM students WHERE class_id = ? ORDER BY CAST(id AS INTEGER)'
+                query = 'SELECT id, name, gender, class, comments, updated_at FROM students WHERE class_id = ? ORDER BY id_num'
                 logger.info(f"班主任模式: 执行查询: {query} 参数: {current_user.class_id}")
                 cursor.execute(query, (current_user.class_id,))
         else:
             # 管理员可以导出所有班级
             if class_name:
-                query = 'SELECT id, name, gender, class, comments, updated_at FROM students WHERE class = ? ORDER BY CAST(id AS INTEGER)'
+                query = 'SELECT id, name, gender, class, comments, updated_at FROM students WHERE class = ? ORDER BY id_num'
                 logger.info(f"管理员模式: 执行查询: {query} 参数: {class_name}")
                 cursor.execute(query, (class_name,))
             else:
-                query = 'SELECT id, name, gender, class, comments, updated_at FROM students ORDER BY class, CAST(id AS INTEGER)'
+                query = 'SELECT id, name, gender, class, comments, updated_at FROM students ORDER BY class, id_num'
                 logger.info(f"管理员模式: 执行查询: {query}")
                 cursor.execute(query)
         
@@ -218,6 +178,23 @@ def export_comments_to_pdf(class_name=None, output_file=None, school_name=None,
         logger.error(traceback.format_exc())
         return {'status': 'error', 'message': f'查询学生数据时出错: {str(e)}'}
     
+    # 学生数据和导出参数都没有变化时直接返回上次生成的文件（指定了输出文件名时总是重新生成）
+    cache_key = None
+    if not output_file:
+        cache_key = export_cache.make_cache_key(
+            'comments_pdf', None, None,
+            {'class_name': class_name, 'school_name': school_name, 'school_year': school_year, 'font': font_name},
+            [list(s) for s in students])
+        cached_filename = export_cache.lookup(cache_key)
+        if cached_filename:
+            return {
+                'status': 'ok',
+                'file_path': os.path.join(EXPORTS_FOLDER, cached_filename),
+                'download_url': f"/download/exports/{cached_filename}",
+                'filename': cached_filename,
+                'cached': True
+            }
+    
     # 生成PDF文件
     try:
         # 分析学生数据
@@ -465,6 +442,8 @@ def export_comments_to_pdf(class_name=None, output_file=None, school_name=None,
             server_url = "http://127.0.0.1:8080"  # 默认本地地址
             download_url = f"/download/exports/{filename}"
             
+            export_cache.store(cache_key, filename)
+            
             # 返回结果
             elapsed_time = time.time() - start_time
             logger.info(f"PDF导出完成，用时: {elapsed_time:.2f}秒")
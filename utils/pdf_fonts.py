@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+"""
+PDF中文字体注册
+
+注册 TrueType 字体时 ReportLab 要解析整个字体文件（中文字体通常有十几MB），
+原来每次导出PDF都重新注册一次。这里在进程内记录已注册的字体，每个字体文件只解析一次，
+之后的导出直接使用已注册的字体名；找不到或无法解析的字体文件同样只尝试一次。
+
+可选的子集缓存（PDF_FONT_SUBSET_CACHE > 0 时启用）：生成PDF时 ReportLab 会为文档中用到的字符
+从字体中提取子集嵌入文件，同一班级反复导出时子集内容相同，缓存后不再重复提取。
+"""
+
+import os
+import logging
+import threading
+from collections import OrderedDict
+
+from config import PDF_FONT_SUBSET_CACHE
+
+logger = logging.getLogger(__name__)
+
+try:
+    from reportlab.pdfbase import pdfmetrics
+    from reportlab.pdfbase.ttfonts import TTFont
+    from reportlab.pdfbase.cidfonts import UnicodeCIDFont
+    REPORTLAB_AVAILABLE = True
+except ImportError:
+    REPORTLAB_AVAILABLE = False
+
+_lock = threading.Lock()
+# 字体名 -> 字体文件路径（已注册的字体）
+_registered = {}
+# 注册失败的字体文件路径
+_failed = set()
+# 候选字体列表 -> 选中的字体名（None表示都不可用）
+_chosen = {}
+
+
+def _cache_subsets(face, size):
+    """让字体的子集提取结果按字符集缓存（LRU，最多 size 个子集）"""
+    make_subset = face.makeSubset
+    cache = OrderedDict()
+    cache_lock = threading.Lock()
+
+    def cached_make_subset(subset):
+        key = tuple(subset)
+        with cache_lock:
+            if key in cache:
+                cache.move_to_end(key)
+                return cache[key]
+        data = make_subset(subset)
+        with cache_lock:
+            cache[key] = data
+            while len(cache) > size:
+                cache.popitem(last=False)
+        return data
+
+    face.makeSubset = cached_make_subset
+
+
+def register_font(name, path):
+    """
+    注册 TrueType 字体，同一进程中每个字体只注册一次
+
+    字体名已经注册为其他字体文件时沿用已注册的字体（都是中文字体，可以互相替代）。
+
+    Returns:
+        bool: 字体名是否可用
+    """
+    if not REPORTLAB_AVAILABLE:
+        return False
+    with _lock:
+        if name in _registered:
+            if _registered[name] != path:
+                logger.debug(f"字体 {name} 已注册为 {_registered[name]}，不再注册 {path}")
+            return True
+        if path in _failed or not os.path.exists(path):
+            return False
+        try:
+            font = TTFont(name, path)
+        except Exception as e:
+            _failed.add(path)
+            logger.warning(f"注册字体 {path} 失败: {str(e)}")
+            return False
+        if PDF_FONT_SUBSET_CACHE > 0:
+            _cache_subsets(font.face, PDF_FONT_SUBSET_CACHE)
+        pdfmetrics.registerFont(font)
+        _registered[name] = path
+        logger.info(f"成功注册中文字体: {path} 作为 {name}")
+        return True
+
+
+def register_cid_font(name):
+    """注册 ReportLab 内置的CID字体（如 STSong-Light，不需要字体文件），返回字体名"""
+    with _lock:
+        if name not in _registered:
+            pdfmetrics.registerFont(UnicodeCIDFont(name))
+            _registered[name] = None
+            logger.info(f"已注册内置字体: {name}")
+    return name
+
+
+def find_font(candidates):
+    """
+    按顺序注册候选字体，返回第一个可用的字体名，结果在进程内缓存
+
+    Args:
+        candidates: [(字体文件路径, 字体名), ...]
+
+    Returns:
+        Optional[str]: 字体名，都不可用时返回None
+    """
+    key = tuple(candidates)
+    if key in _chosen:
+        return _chosen[key]
+
+    font_name = None
+    for path, name in candidates:
+        if register_font(name, path):
+            font_name = name
+            break
+    if font_name is None:
+        logger.warning(f"候选字体均不可用: {[path for path, _ in candidates]}")
+    _chosen[key] = font_name
+    return font_name
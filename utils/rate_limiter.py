@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""
+AI接口调用限速（多进程共享的令牌桶）
+
+多位老师同时点击"AI生成"时，各个工作进程的各个线程同时向DeepSeek发请求，超出接口配额后集中收到429。
+这里用 SQLite 的 rate_limits 表保存令牌桶状态，同一台服务器上的所有进程共用一个桶：
+令牌按 AI_RATE_LIMIT（次/分钟）匀速补充，最多积攒 AI_RATE_BURST 个；
+每次请求前预约一个令牌，令牌不足时按预约顺序排队等待，需要等待超过 AI_RATE_MAX_WAIT 秒则不再排队，直接报错。
+
+预约在一次写事务内完成（先补充令牌并扣除一个，再读出剩余数量），不需要轮询，也不依赖外部服务。
+"""
+
+import time
+import sqlite3
+import logging
+
+from database import get_db_connection
+from config import AI_RATE_LIMIT, AI_RATE_BURST, AI_RATE_MAX_WAIT
+
+logger = logging.getLogger(__name__)
+
+_RATE_LIMITS_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS rate_limits (
+    name TEXT PRIMARY KEY,
+    tokens REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+'''
+
+
+class RateLimitTimeout(RuntimeError):
+    """排队等待的时间会超过上限"""
+
+
+def ensure_rate_limits(conn):
+    """创建令牌桶表（启动时调用，可重复执行）"""
+    conn.executescript(_RATE_LIMITS_SCHEMA)
+    conn.commit()
+
+
+def _reserve(name, rate, capacity, max_wait, now):
+    """
+    补充令牌并预约一个，返回预约后的令牌数（负数表示前面还有人在排队）
+
+    排队时间会超过 max_wait 时不预约，返回None
+    """
+    conn = get_db_connection()
+    try:
+        conn.execute('INSERT OR IGNORE INTO rate_limits (name, tokens, updated_at) VALUES (?, ?, ?)',
+                     (name, capacity, now))
+        # 补充的令牌数 = 距上次更新的秒数 x 每秒速率，不超过桶容量
+        cursor = conn.execute('''
+            UPDATE rate_limits
+            SET tokens = MIN(:capacity, tokens + MAX(0, :now - updated_at) * :rate) - 1,
+                updated_at = MAX(updated_at, :now)
+            WHERE name = :name AND MIN(:capacity, tokens + MAX(0, :now - updated_at) * :rate) - 1 >= :floor
+        ''', {'capacity': capacity, 'now': now, 'rate': rate, 'name': name, 'floor': -rate * max_wait})
+        if cursor.rowcount == 0:
+            conn.commit()
+            return None
+        tokens = conn.execute('SELECT tokens FROM rate_limits WHERE name = ?', (name,)).fetchone()['tokens']
+        conn.commit()
+        return tokens
+    finally:
+        conn.close()
+
+
+def acquire(name='deepseek', per_minute=AI_RATE_LIMIT, capacity=AI_RATE_BURST, max_wait=AI_RATE_MAX_WAIT):
+    """
+    取得一次调用许可，令牌不足时排队等待
+
+    Args:
+        name: 令牌桶名称（每个外部接口一个）
+        per_minute: 每分钟允许的调用次数，0表示不限速
+        capacity: 空闲后最多可以连续发出的调用次数
+        max_wait: 最长排队秒数
+
+    Returns:
+        float: 实际等待的秒数
+
+    Raises:
+        RateLimitTimeout: 需要排队超过 max_wait 秒
+    """
+    if per_minute <= 0:
+        return 0.0
+    rate = per_minute / 60.0
+    try:
+        tokens = _reserve(name, rate, max(1, capacity), max_wait, time.time())
+    except sqlite3.Error as e:
+        # 限速表不可用时不阻塞调用
+        logger.warning(f"读取限速状态失败，本次不限速: {str(e)}")
+        return 0.0
+    if tokens is None:
+        logger.warning(f"{name} 调用排队超过 {max_wait} 秒，已拒绝")
+        raise RateLimitTimeout(f"AI接口请求过多，排队超过 {max_wait} 秒，请稍后再试")
+
+    wait = -tokens / rate if tokens < 0 else 0.0
+    if wait > 0:
+        logger.info(f"{name} 调用限速，排队等待 {wait:.1f} 秒")
+        time.sleep(wait)
+    return wait
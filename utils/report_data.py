@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""
+报告导出的数据读取
+
+批量导出报告时一次读取所有选中学生的信息、评语和成绩：
+评语和各科成绩都是 students 表的字段，随学生记录一起读出，不再为每个学生单独查询；
+旧版本数据库中的 grades 成绩表只在存在时查询一次（是否存在在启动时检查），
+查询次数与学生人数无关。
+"""
+
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+# students 表中的成绩字段
+GRADE_FIELDS = ('yuwen', 'shuxue', 'yingyu', 'daof', 'kexue', 'tiyu',
+                'yinyue', 'meishu', 'laodong', 'xinxi', 'zonghe', 'shufa')
+
+# grades 表是否存在，由 check_grades_table() 在启动时设置
+_grades_table = None
+
+
+def check_grades_table(conn):
+    """检查数据库中是否有 grades 成绩表（启动时调用一次）"""
+    global _grades_table
+    row = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'grades'").fetchone()
+    _grades_table = row is not None
+    logger.info(f"grades成绩表{'存在' if _grades_table else '不存在，成绩从students表读取'}")
+    return _grades_table
+
+
+def load_report_data(conn, student_ids, access_where='1=1', access_params=()):
+    """
+    读取导出报告所需的学生信息、评语和成绩
+
+    Args:
+        conn: 数据库连接
+        student_ids: 学生ID列表
+        access_where / access_params: 权限范围筛选条件（见 student_access_filter）
+
+    Returns:
+        Tuple[list, dict, dict]: (学生信息列表, {学生ID: {'content': 评语}}, {学生ID: {'grades': 成绩}})
+    """
+    if _grades_table is None:
+        check_grades_table(conn)
+
+    # 学生ID作为一个JSON数组参数传入，学生再多也只有一个参数、一次查询
+    ids_param = json.dumps([str(student_id) for student_id in student_ids])
+    rows = conn.execute(
+        f'SELECT * FROM students WHERE id IN (SELECT value FROM json_each(?)) AND {access_where}',
+        [ids_param] + list(access_params)).fetchall()
+
+    students = []
+    comments = {}
+    grades = {}
+    for row in rows:
+        student = dict(row)
+        # 确保关键字段非空 - 这里补充空字符串而不是None
+        for key in ['id', 'name', 'gender', 'class']:
+            if key not in student or student[key] is None:
+                student[key] = ''
+        students.append(student)
+
+        student_id = str(student['id'])
+        comments[student_id] = {'content': student.get('comments') or ''}
+        grades[student_id] = {'grades': {field: student[field] for field in GRADE_FIELDS if field in student}}
+
+    if _grades_table and students:
+        # 旧版本的 grades 表中有记录的学生以该表为准
+        grade_rows = conn.execute(
+            'SELECT * FROM grades WHERE student_id IN (SELECT value FROM json_each(?))',
+            (json.dumps(list(grades)),)).fetchall()
+        seen = set()
+        for grade_row in grade_rows:
+            record = dict(grade_row)
+            student_id = str(record.pop('student_id'))
+            record.pop('id', None)
+            if student_id in grades and student_id not in seen:
+                grades[student_id] = {'grades': record}
+                seen.add(student_id)
+
+    return students, comments, grades
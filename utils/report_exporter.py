@@ -1,12 +1,15 @@
 # -*- coding: utf-8 -*-
 import os
 import io
-import zipfile
-import tempfile
 import logging
+import itertools
 import traceback
 from datetime import datetime
-from typing import Dict, List, Any, Optional, Tuple, Union
+from typing import Dict, List, Any, Optional, Tuple, Union, Iterator, Callable
+
+from utils.report_pool import render_reports
+from utils.zip_stream import stream_zip
+from utils.report_pdf_renderer import has_pdf_layout, render_report_pdf
 
 # 配置日志
 logging.basicConfig(level=logging.INFO)
@@ -350,7 +353,7 @@ class ReportExporter:
                 
             # 导入docxtpl库，如果不存在则提示安装
             try:
-                from docxtpl import DocxTemplate
+                from utils.docx_template_cache import load_template, template_from_bytes
             except ImportError:
                 logger.error("未安装docxtpl库")
                 return False, "未安装docxtpl库，请运行 'pip install docxtpl' 安装"
@@ -369,34 +372,25 @@ class ReportExporter:
             context = self.prepare_template_data(student, comment, grades, settings)
             logger.debug(f"准备模板数据完成: {len(context)} 个字段")
             
-            # 生成报告
+            # 生成报告，模板按路径和修改时间缓存，批量导出时只解析、编译一次
             try:
                 if use_builtin_template:
                     # 使用内存中的模板
-                    doc_buffer = io.BytesIO(self.default_template)
-                    doc = DocxTemplate(doc_buffer)
+                    template = template_from_bytes('内置默认模板', self.default_template)
                 else:
                     # 尝试加载模板文件
                     try:
-                        doc = DocxTemplate(template_path)
+                        template = load_template(template_path)
                     except Exception as template_error:
                         logger.error(f"加载模板文件失败: {str(template_error)}")
                         if self.has_default_backup:
                             logger.info("模板加载失败，将使用内置默认模板")
-                            doc_buffer = io.BytesIO(self.default_template)
-                            doc = DocxTemplate(doc_buffer)
+                            template = template_from_bytes('内置默认模板', self.default_template)
                         else:
                             return False, f"模板文件加载失败: {str(template_error)}"
                 
-                # 渲染模板
-                doc.render(context)
-                
-                # 保存到内存
-                output = io.BytesIO()
-                doc.save(output)
-                output.seek(0)
-                
-                return True, output.getvalue()
+                # 渲染模板并保存到内存
+                return True, template.render(context)
             except Exception as e:
                 error_msg = f"模板渲染错误: {str(e)}"
                 logger.error(error_msg)
@@ -406,15 +400,8 @@ class ReportExporter:
                 if not use_builtin_template and self.has_default_backup:
                     logger.info("模板渲染失败，尝试使用内置默认模板")
                     try:
-                        doc_buffer = io.BytesIO(self.default_template)
-                        doc = DocxTemplate(doc_buffer)
-                        doc.render(context)
-                        
-                        output = io.BytesIO()
-                        doc.save(output)
-                        output.seek(0)
-                        
-                        return True, output.getvalue()
+                        template = template_from_bytes('内置默认模板', self.default_template)
+                        return True, template.render(context)
                     except Exception as backup_error:
                         logger.error(f"使用内置默认模板也失败: {str(backup_error)}")
                         return False, f"模板渲染错误: {str(e)}，并且内置默认模板也失败: {str(backup_error)}"
@@ -427,6 +414,224 @@ class ReportExporter:
             logger.error(traceback.format_exc())
             return False, error_msg
     
+    def export_single_pdf_report(self,
+                                 template_id: str,
+                                 student: Dict[str, Any],
+                                 comment: Optional[Dict[str, Any]],
+                                 grades: Optional[Dict[str, Any]],
+                                 settings: Dict[str, Any]) -> Tuple[bool, Union[bytes, str]]:
+        """
+        按模板的版式描述直接生成单个学生的PDF报告（不经过Word文档）
+        
+        Args:
+            template_id: 模板ID，须有版式描述（见 has_pdf_layout）
+            student: 学生信息
+            comment: 学生评语
+            grades: 学生成绩
+            settings: 导出设置
+            
+        Returns:
+            Tuple[bool, Union[bytes, str]]: (是否成功, PDF文件内容或错误信息)
+        """
+        try:
+            data = self.prepare_template_data(student, comment, grades, settings)
+            return True, render_report_pdf(template_id, data)
+        except Exception as e:
+            error_msg = f"PDF报告生成过程中发生错误: {str(e)}"
+            logger.error(error_msg)
+            logger.error(traceback.format_exc())
+            return False, error_msg
+    
+    def get_report_filename(self, student: Dict[str, Any], settings: Dict[str, Any], extension: str = '.docx') -> str:
+        """
+        按导出设置中的文件名格式生成报告文件名（默认为 学号_姓名.docx）
+        
+        Args:
+            student: 学生信息
+            settings: 导出设置
+            extension: 文件扩展名
+            
+        Returns:
+            str: 报告文件名
+        """
+        student_id = student.get('id')
+        student_name = student.get('name')
+        filename_format = settings.get('fileNameFormat', 'id_name')
+        
+        if filename_format == 'name_id':
+            return f"{student_name or '未知'}_{student_id}{extension}"
+        elif filename_format == 'id':
+            return f"{student_id}{extension}"
+        elif filename_format == 'name':
+            return f"{student_name or '未知'}{extension}"
+        else:  # default: id_name
+            return f"{student_id}_{student_name or '未知'}{extension}"
+    
+    def _resolve_template(self, template_id: str) -> Tuple[bool, Optional[str]]:
+        """
+        确定批量导出使用的模板文件
+        
+        Args:
+            template_id: 模板ID
+            
+        Returns:
+            Tuple[bool, Optional[str]]: (是否可用, 模板路径（None表示使用内置默认模板）或错误消息)
+        """
+        # 检查模板ID是否有效
+        if not template_id:
+            logger.error("未提供模板ID")
+            if self.has_default_backup:
+                logger.info("未提供模板ID，将使用内置默认模板")
+                return True, None  # 稍后在处理每个学生时使用内置模板
+            return False, "未提供模板ID"
+        
+        # 获取模板路径
+        template_path = self.get_template_path(template_id)
+        # 如果指定模板不存在，但有内置默认模板，使用内置模板
+        if not os.path.exists(template_path) and self.has_default_backup:
+            logger.warning(f"模板文件不存在: {template_path}，将使用内置默认模板")
+            return True, None  # 稍后在处理每个学生时使用内置模板
+        elif not os.path.exists(template_path):
+            logger.error(f"模板文件不存在: {template_path}")
+            return False, f"模板文件不存在: {template_path}"
+        return True, template_path
+    
+    def _iter_report_files(self,
+                           students: List[Dict[str, Any]],
+                           comments: Dict[str, Dict[str, Any]],
+                           grades: Dict[str, Dict[str, Any]],
+                           template_path: Optional[str],
+                           settings: Dict[str, Any],
+                           error_messages: List[str],
+                           on_report: Optional[Callable[[Dict[str, Any], bool], None]] = None,
+                           pdf_template_id: Optional[str] = None) -> Iterator[Tuple[str, bytes]]:
+        """
+        逐个生成学生报告，失败的学生记录到 error_messages 中
+        
+        Args:
+            on_report: 每处理完一个学生调用一次 on_report(学生信息, 是否成功)，可抛出异常中止导出
+            pdf_template_id: 指定时按该模板的版式描述直接生成PDF报告，不使用 template_path
+            
+        Yields:
+            Tuple[str, bytes]: (文件名, 报告文件内容)
+        """
+        # 收集需要生成报告的学生
+        jobs = []
+        for student in students:
+            # 安全访问student_id
+            student_id = student.get('id')
+            student_name = student.get('name')
+            
+            if not student_id:
+                logger.warning(f"学生ID为空，跳过该学生: {student}")
+                error_messages.append(f"学生数据不完整: 缺少ID")
+                if on_report:
+                    on_report(student, False)
+                continue
+            
+            if not student_name:
+                logger.warning(f"学生 {student_id} 缺少姓名，将继续尝试生成报告")
+            
+            # 获取学生评语和成绩
+            comment = comments.get(student_id, {})
+            grade = grades.get(student_id, {})
+            jobs.append((student, comment, grade))
+        
+        success_count = 0
+        if pdf_template_id:
+            # 直接生成PDF，每份只需几毫秒，在当前线程中逐个生成
+            extension = '.pdf'
+            results = (self.export_single_pdf_report(pdf_template_id, student, comment, grade, settings)
+                       for student, comment, grade in jobs)
+        else:
+            # 生成报告（学生较多时由渲染进程池并行生成），结果按学生顺序返回
+            # 传递实际模板路径或空字符串（使用内置模板）
+            extension = '.docx'
+            results = render_reports(self, template_path or "", jobs, settings)
+        for (student, _, _), (success, result) in zip(jobs, results):
+            student_id = student.get('id')
+            
+            if success:
+                filename = self.get_report_filename(student, settings, extension)
+                success_count += 1
+                logger.info(f"学生 {student_id} 的报告生成成功: {filename}")
+                if on_report:
+                    on_report(student, True)
+                yield filename, result
+            else:
+                logger.error(f"生成学生 {student_id} 的报告失败: {result}")
+                error_messages.append(f"学生 {student_id} 报告生成失败: {result}")
+                if on_report:
+                    on_report(student, False)
+        
+        logger.info(f"成功导出 {success_count}/{len(students)} 个学生报告")
+        if error_messages:
+            logger.warning(f"{len(error_messages)} 个学生报告生成失败")
+    
+    def _no_report_error(self, error_messages: List[str]) -> str:
+        """没有生成任何报告时返回的错误消息"""
+        error_summary = "\n".join(error_messages[:5])
+        if len(error_messages) > 5:
+            error_summary += f"\n...以及其他 {len(error_messages) - 5} 个错误"
+        
+        logger.error(f"没有成功生成任何报告. 错误: {error_summary}")
+        return f"没有成功生成任何报告. 错误: {error_summary}"
+    
+    def stream_reports(self,
+                       students: List[Dict[str, Any]],
+                       comments: Dict[str, Dict[str, Any]],
+                       grades: Dict[str, Dict[str, Any]],
+                       template_id: str,
+                       settings: Dict[str, Any],
+                       on_report: Optional[Callable[[Dict[str, Any], bool], None]] = None,
+                       native_pdf: bool = False) -> Tuple[bool, Union[Iterator[bytes], str]]:
+        """
+        批量导出多个学生的报告，以流的形式逐段返回ZIP数据
+        
+        返回前先生成第一份报告：全部失败时仍能返回错误消息；成功后其余报告边生成边输出，
+        内存中只保留当前这一份报告。参数与 export_reports 相同。
+        
+        Args:
+            on_report: 每处理完一个学生调用一次 on_report(学生信息, 是否成功)，用于报告进度；
+                       抛出的异常会中止导出并传给调用方
+            native_pdf: 为True时按模板的版式描述直接生成PDF报告（模板须满足 has_pdf_layout）
+        
+        Returns:
+            Tuple[bool, Union[Iterator[bytes], str]]: (是否成功, ZIP数据块的迭代器或错误消息)
+        """
+        try:
+            # 检查学生数据是否有效
+            if not students or not isinstance(students, list) or len(students) == 0:
+                logger.error(f"学生数据列表为空或无效")
+                return False, "没有提供有效的学生数据"
+            
+            if native_pdf:
+                if not has_pdf_layout(template_id):
+                    return False, f"模板 {template_id} 不支持直接生成PDF"
+                template_path = None
+                logger.info(f"开始流式导出PDF报告，学生数量: {len(students)}, 使用版式: {template_id}")
+            else:
+                ok, template_path = self._resolve_template(template_id)
+                if not ok:
+                    return False, template_path
+                
+                logger.info(f"开始流式导出报告，学生数量: {len(students)}, 使用模板: {template_path or '内置默认模板'}")
+            
+        except Exception as e:
+            logger.error(f"导出报告出错: {str(e)}")
+            logger.error(traceback.format_exc())
+            return False, f"导出报告失败: {str(e)}"
+        
+        # 单个学生的渲染错误在 export_single_report 中已处理，这里抛出的只会是 on_report 中止导出的异常
+        error_messages = []
+        files = self._iter_report_files(students, comments, grades, template_path, settings, error_messages, on_report,
+                                        pdf_template_id=template_id if native_pdf else None)
+        first = next(files, None)
+        if first is None:
+            return False, self._no_report_error(error_messages)
+        
+        return True, stream_zip(itertools.chain([first], files))
+    
     def export_reports(self, 
                        students: List[Dict[str, Any]],
                        comments: Dict[str, Dict[str, Any]],
@@ -446,124 +651,12 @@ class ReportExporter:
         Returns:
             Tuple[bool, Union[bytes, str]]: (是否成功, 生成的ZIP文件数据或错误消息)
         """
+        success, result = self.stream_reports(students, comments, grades, template_id, settings)
+        if not success:
+            return False, result
+        
         try:
-            # 检查学生数据是否有效
-            if not students or not isinstance(students, list) or len(students) == 0:
-                logger.error(f"学生数据列表为空或无效")
-                return False, "没有提供有效的学生数据"
-                
-            # 检查模板ID是否有效
-            if not template_id:
-                logger.error("未提供模板ID")
-                if self.has_default_backup:
-                    logger.info("未提供模板ID，将使用内置默认模板")
-                    template_path = None  # 稍后在处理每个学生时使用内置模板
-                else:
-                    return False, "未提供模板ID"
-            else:
-                # 获取模板路径
-                template_path = self.get_template_path(template_id)
-                # 如果指定模板不存在，但有内置默认模板，使用内置模板
-                if not os.path.exists(template_path) and self.has_default_backup:
-                    logger.warning(f"模板文件不存在: {template_path}，将使用内置默认模板")
-                    template_path = None  # 稍后在处理每个学生时使用内置模板
-                elif not os.path.exists(template_path):
-                    logger.error(f"模板文件不存在: {template_path}")
-                    return False, f"模板文件不存在: {template_path}"
-                
-            logger.info(f"开始批量导出报告，学生数量: {len(students)}, 使用模板: {template_id}")
-            if template_path:
-                logger.info(f"模板路径: {template_path}")
-            else:
-                logger.info("将使用内置默认模板")
-                
-            # 创建临时目录
-            with tempfile.TemporaryDirectory() as temp_dir:
-                # 创建ZIP文件
-                zip_path = os.path.join(temp_dir, "student_reports.zip")
-                
-                with zipfile.ZipFile(zip_path, 'w') as zipf:
-                    # 遍历学生生成报告
-                    success_count = 0
-                    error_messages = []
-                    
-                    for idx, student in enumerate(students):
-                        # 安全访问student_id
-                        student_id = student.get('id')
-                        student_name = student.get('name')
-                        
-                        if not student_id:
-                            logger.warning(f"学生ID为空，跳过该学生: {student}")
-                            error_messages.append(f"学生数据不完整: 缺少ID")
-                            continue
-                        
-                        if not student_name:
-                            logger.warning(f"学生 {student_id} 缺少姓名，将继续尝试生成报告")
-                            
-                        logger.info(f"处理第 {idx+1}/{len(students)} 个学生: ID={student_id}, 姓名={student_name or '未知'}")
-                            
-                        # 获取学生评语和成绩
-                        comment = comments.get(student_id, {})
-                        grade = grades.get(student_id, {})
-                        
-                        # 生成报告
-                        logger.info(f"为学生 {student_id} 生成报告...")
-                        
-                        # 传递实际模板路径或None（使用内置模板）
-                        success, result = self.export_single_report(
-                            template_path or "", student, comment, grade, settings
-                        )
-                        
-                        if success:
-                            # 设置文件名格式（默认为 学号_姓名.docx）
-                            filename_format = settings.get('fileNameFormat', 'id_name')
-                            
-                            if filename_format == 'name_id':
-                                filename = f"{student_name or '未知'}_{student_id}.docx"
-                            elif filename_format == 'id':
-                                filename = f"{student_id}.docx"
-                            elif filename_format == 'name':
-                                filename = f"{student_name or '未知'}.docx"
-                            else:  # default: id_name
-                                filename = f"{student_id}_{student_name or '未知'}.docx"
-                            
-                            logger.info(f"报告生成成功，准备保存为: {filename}")
-                            
-                            # 保存到临时文件
-                            file_path = os.path.join(temp_dir, filename)
-                            with open(file_path, 'wb') as f:
-                                f.write(result)
-                            
-                            # 添加到ZIP
-                            zipf.write(file_path, filename)
-                            success_count += 1
-                            logger.info(f"成功添加学生 {student_id} 的报告到ZIP文件")
-                        else:
-                            logger.error(f"生成学生 {student_id} 的报告失败: {result}")
-                            error_messages.append(f"学生 {student_id} 报告生成失败: {result}")
-                            
-                # 读取ZIP文件
-                if success_count > 0:
-                    logger.info(f"生成ZIP文件: {zip_path}")
-                    with open(zip_path, 'rb') as f:
-                        zip_data = f.read()
-                    
-                    logger.info(f"成功导出 {success_count}/{len(students)} 个学生报告")
-                    
-                    # 如果有部分失败，添加到返回的消息中
-                    message = f"成功导出 {success_count}/{len(students)} 个学生报告"
-                    if len(error_messages) > 0:
-                        message += f"，{len(error_messages)} 个学生报告生成失败"
-                    
-                    return True, zip_data
-                else:
-                    error_summary = "\n".join(error_messages[:5])
-                    if len(error_messages) > 5:
-                        error_summary += f"\n...以及其他 {len(error_messages) - 5} 个错误"
-                    
-                    logger.error(f"没有成功生成任何报告. 错误: {error_summary}")
-                    return False, f"没有成功生成任何报告. 错误: {error_summary}"
-                
+            return True, b''.join(result)
         except Exception as e:
             logger.error(f"导出报告出错: {str(e)}")
             logger.error(traceback.format_exc())
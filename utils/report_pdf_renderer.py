@@ -0,0 +1,320 @@
+# -*- coding: utf-8 -*-
+"""
+报告单PDF直接渲染（不经过Word文档）
+
+PDF导出原来要先渲染Word文档，再交给 LibreOffice 或 Word 转换，每份报告都要经过一次办公软件。
+对于有版式描述（REPORT_LAYOUTS）的模板，这里用 ReportLab 直接按版式画出报告单：
+数据与Word模板相同（ReportExporter.prepare_template_data() 的返回值），每份报告只需几毫秒，
+服务器上也不需要安装办公软件。没有版式描述的模板仍走 Word → PDF 转换。
+
+版式描述是按 templates/docx 中自带的Word模板写的，模板文件被修改后（内容与 template_sha256 不同）
+版式描述不会随之改变，这时同样改走 Word → PDF 转换，见 layout_matches_template()。
+
+版式描述是一个字典：
+- template_sha256: 对应的Word模板文件的SHA-256
+- margins: 页边距（毫米，上、右、下、左）
+- title: 标题文字，字号 title_size
+- columns: 表格各列宽度的比例，按页面可用宽度缩放
+- rows: 表格各行，每行是单元格列表；单元格为 dict：
+    text     文字，可包含 {姓名} 形式的占位符（键与 prepare_template_data() 相同），\n 换行
+    colspan  / rowspan  合并的列数、行数（默认1），被合并覆盖的位置不需要再写单元格
+    align    对齐方式 CENTER（默认）/ LEFT / RIGHT，valign 纵向对齐 MIDDLE（默认）/ TOP
+    bold     是否加粗（用于表头；使用 BOLD_FONT_CANDIDATES 中的黑体，找不到时与正文字体相同）
+    footer   单元格末尾右对齐的一行（如班主任签名）
+  行也可以是 dict：{'cells': [...], 'height': 最小行高（毫米）}，内容较多时行高随内容增加
+"""
+
+import io
+import os
+import hashlib
+import logging
+import threading
+
+from utils.pdf_fonts import find_font, register_cid_font
+
+logger = logging.getLogger(__name__)
+
+try:
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.units import mm
+    from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_RIGHT
+    from reportlab.lib.styles import ParagraphStyle
+    from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph
+    REPORTLAB_AVAILABLE = True
+except ImportError:
+    REPORTLAB_AVAILABLE = False
+
+FONTS_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fonts')
+
+# 字体目录中可用的TrueType字体，按顺序查找；都没有时使用 ReportLab 内置的宋体（STSong-Light，不嵌入字体文件）
+FONT_CANDIDATES = [
+    (os.path.join(FONTS_FOLDER, 'SimSun.ttf'), 'SimSun'),
+    ('C:/Windows/Fonts/simsun.ttc', 'SimSun'),
+]
+BUILTIN_CJK_FONT = 'STSong-Light'
+# 加粗文字（标题、表头）使用的字体：中文字体没有粗体字形，用黑体代替；都没有时使用正文字体
+BOLD_FONT_CANDIDATES = [
+    (os.path.join(FONTS_FOLDER, 'SimHei.ttf'), 'SimHei'),
+    ('C:/Windows/Fonts/simhei.ttf', 'SimHei'),
+]
+
+
+def _cell(text, colspan=1, rowspan=1, **options):
+    cell = {'text': text, 'colspan': colspan, 'rowspan': rowspan}
+    cell.update(options)
+    return cell
+
+
+def _header(text, colspan=1, rowspan=1):
+    return _cell(text, colspan, rowspan, bold=True)
+
+
+_SUBJECTS = ['道法', '语文', '数学', '英语', '体育', '音乐', '美术', '科学', '书法', '信息', '综合', '劳动']
+
+# 综合素质评价：(维度, 评分占位符, [关键表现, ...])
+_DIMENSIONS = [
+    ('道德品质与公民素养\n（30★）', '品质', [
+        '尊敬国旗，国徽，国歌；关心国家大事，热爱家乡。',
+        '孝敬父母，尊敬师长，团结有爱，乐于助人，诚实，守信。',
+        '遵纪守法，珍爱生命，学会自理和自我保护。',
+        '热爱大自然，爱护公物，勤俭节约。',
+    ]),
+    ('学习能力\n交流合作\n（30★）', '学习', [
+        '热爱学习，明确学习目的，上课认真，按时完成作业。',
+        '掌握学习方法，积极思考，养成良好的学习习惯。',
+        '热爱集体，主动与同伴合作，交流，分享。',
+        '认识自己的优缺点，虚心向别人学习。',
+    ]),
+    ('运动健康\n（20★）', '健康', [
+        '上好体育课，做好两操，坚持体育锻炼，具有良好的心理素质。',
+        '《学生体质健康标准》合格。',
+    ]),
+    ('审美表现\n（10★）', '审美', [
+        '热爱大自然，欣赏美好事物，仪表美，语言美，行为美。',
+        '上好艺术课，积极参加艺术活动。',
+    ]),
+    ('综合实践活动\n（10★）', '实践', [
+        '积极学习，认真参加研究性学习。',
+        '热爱劳动，爱惜劳动成果，积极参加家庭，社区，社会实践活动。',
+    ]),
+    ('生活能力\n（10★）', '生活', [
+        '合理安排作息时间，养成良好的生活习惯，能够自理自立。',
+    ]),
+]
+
+
+def _dimension_rows():
+    rows = [[_header('维度', 2), _header('序号'), _header('关键表现', 9), _header('考评', 2)]]
+    number = 0
+    for dimension, score_key, items in _DIMENSIONS:
+        for index, item in enumerate(items):
+            number += 1
+            row = [_cell(dimension, 2, len(items))] if index == 0 else []
+            row += [_cell(str(number)), _cell(item, 9, align='LEFT')]
+            if index == 0:
+                row.append(_cell(f'{{{score_key}}}★', 2, len(items)))
+            rows.append(row)
+    return rows
+
+
+# 泉州东海湾实验学校综合素质发展报告单（与 templates/docx 中的Word模板版式一致）
+# 表格共14列：维度名、小标题、12门学科
+QUANZHOU_REPORT_LAYOUT = {
+    'template_sha256': 'd370050d28843563ac25166f857c95982dd4a1e5f8a837f98f7ab8936cfee422',
+    'margins': (25.4, 31.75, 25.4, 31.75),
+    'title': '学生综合素质发展报告单{学年}学年{学期}',
+    'title_size': 16,
+    'font_size': 10.5,
+    'columns': [15, 18] + [9.5] * 12,
+    'rows': [
+        [_header('姓名', 2), _cell('{姓名}', 4), _header('性别', 2), _cell('{性别}', 2),
+         _header('班级', 2), _cell('{班级}', 2)],
+        [_header('身体状况', 1, 3), _header('身高'), _cell('{身高}cm', 2), _header('肺活量', 2),
+         _cell('{肺活量}', 2), _header('视力', 2, 2), _header('左'), _cell('{视力左}', 3)],
+        [_header('体重'), _cell('{体重}kg', 6), _header('右'), _cell('{视力右}', 3)],
+        {'cells': [_header('体测情况'), _cell('{体测情况}', 12)], 'height': 8},
+        [_header('学科文化', 1, 2), _header('学科')] + [_header(subject) for subject in _SUBJECTS],
+        {'cells': [_header('考查情况')] + [_cell(f'{{{subject}}}') for subject in _SUBJECTS], 'height': 13},
+        {'cells': [_cell('综合性描述评语：\n\u3000\u3000{评语}', 14, align='LEFT',
+                         footer='班主任：{班主任}')], 'height': 23},
+        {'cells': [_cell('家长的话：', 14, align='LEFT', valign='TOP')], 'height': 11},
+    ] + _dimension_rows() + [
+        {'cells': [_header('通知', 2), _cell('新学期定于{开学时间}开学，请家长督促子女注意假期安全，遵守社会公共秩序，'
+                                           '认真完成假期作业，开学前做好收心工作，按时入学上课。', 12, align='LEFT')],
+         'height': 12.6},
+    ],
+}
+
+# 模板ID → 版式描述
+REPORT_LAYOUTS = {
+    '泉州东海湾实验学校综合素质发展报告单': QUANZHOU_REPORT_LAYOUT,
+}
+
+def get_font_name():
+    """中文字体名（字体在进程内只注册一次）"""
+    return find_font(FONT_CANDIDATES) or register_cid_font(BUILTIN_CJK_FONT)
+
+
+def get_bold_font_name():
+    """加粗文字使用的字体名，没有黑体时与正文字体相同"""
+    return find_font(BOLD_FONT_CANDIDATES) or get_font_name()
+
+
+def has_pdf_layout(template_id):
+    """模板是否可以直接渲染为PDF"""
+    return REPORTLAB_AVAILABLE and template_id in REPORT_LAYOUTS
+
+
+_template_lock = threading.Lock()
+# (模板文件路径, 修改时间, 大小) -> 是否与版式描述对应的模板相同
+_template_checks = {}
+
+
+def layout_matches_template(template_id, template_path):
+    """
+    模板文件是否与版式描述对应的Word模板相同
+
+    比较文件的SHA-256，结果按文件的修改时间和大小缓存，模板文件不变时不再重复计算。
+    模板被修改过时返回False并记录警告，调用方应改用 Word → PDF 转换，修改才会体现在PDF中。
+    """
+    layout = REPORT_LAYOUTS.get(template_id)
+    if layout is None:
+        return False
+    try:
+        stat = os.stat(template_path)
+    except OSError:
+        return False
+    key = (os.path.abspath(template_path), stat.st_mtime_ns, stat.st_size)
+    with _template_lock:
+        if key in _template_checks:
+            return _template_checks[key]
+
+    with open(template_path, 'rb') as f:
+        matches = hashlib.sha256(f.read()).hexdigest() == layout.get('template_sha256')
+    if not matches:
+        logger.warning(f"模板 {template_path} 与PDF版式描述对应的模板不同，PDF将由Word文档转换生成")
+    with _template_lock:
+        _template_checks[key] = matches
+    return matches
+
+
+class _TemplateData(dict):
+    """format_map 使用的数据，缺少的占位符替换为空字符串"""
+
+    def __missing__(self, key):
+        return ''
+
+
+def _fill(text, data):
+    return text.format_map(data)
+
+
+def _escape(text):
+    return text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+
+
+def _build_table(layout, data, font_name, bold_font_name, available_width):
+    """按版式描述生成表格：计算合并单元格在网格中的位置，生成 ReportLab 的 SPAN 命令"""
+    column_count = len(layout['columns'])
+    scale = available_width / sum(layout['columns'])
+    col_widths = [width * scale for width in layout['columns']]
+    font_size = layout.get('font_size', 10.5)
+    padding = 2
+
+    # (对齐方式, 是否加粗) -> 段落样式
+    styles = {}
+    for align, alignment in (('CENTER', TA_CENTER), ('LEFT', TA_LEFT), ('RIGHT', TA_RIGHT)):
+        for bold, name in ((False, font_name), (True, bold_font_name)):
+            styles[align, bold] = ParagraphStyle(f'report_{align}_{int(bold)}', fontName=name, fontSize=font_size,
+                                                 leading=font_size * 1.3, alignment=alignment, wordWrap='CJK')
+
+    def paragraph(text, align, bold=False):
+        text = _escape(_fill(text, data)).replace('\n', '<br/>')
+        return Paragraph(text, styles[align, bool(bold)])
+
+    grid = []
+    row_heights = []
+    commands = [
+        ('GRID', (0, 0), (-1, -1), 0.5, 'black'),
+        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+        ('LEFTPADDING', (0, 0), (-1, -1), padding),
+        ('RIGHTPADDING', (0, 0), (-1, -1), padding),
+    ]
+    # 被上方单元格纵向合并占用的位置：{(行, 列)}
+    occupied = set()
+    for row_index, row in enumerate(layout['rows']):
+        if isinstance(row, dict):
+            cells, min_height = row['cells'], row.get('height')
+        else:
+            cells, min_height = row, None
+
+        line = [''] * column_count
+        content_height = 0
+        column = 0
+        for cell in cells:
+            while (row_index, column) in occupied:
+                column += 1
+            colspan, rowspan = cell.get('colspan', 1), cell.get('rowspan', 1)
+            if column + colspan > column_count:
+                raise ValueError(f'版式第{row_index + 1}行超出{column_count}列')
+
+            flowables = [paragraph(cell['text'], cell.get('align', 'CENTER'), cell.get('bold'))]
+            if cell.get('footer'):
+                flowables.append(paragraph(cell['footer'], 'RIGHT'))
+            line[column] = flowables if len(flowables) > 1 else flowables[0]
+
+            if rowspan == 1 and min_height:
+                width = sum(col_widths[column:column + colspan]) - 2 * padding
+                content_height = max(content_height, sum(f.wrap(width, 0)[1] for f in flowables))
+            if colspan > 1 or rowspan > 1:
+                commands.append(('SPAN', (column, row_index), (column + colspan - 1, row_index + rowspan - 1)))
+            if cell.get('valign'):
+                commands.append(('VALIGN', (column, row_index), (column, row_index), cell['valign']))
+            for r in range(row_index, row_index + rowspan):
+                for c in range(column, column + colspan):
+                    occupied.add((r, c))
+            column += colspan
+        grid.append(line)
+
+        # 最小行高：内容放得下时固定为版式中的行高，否则由 ReportLab 按内容计算
+        if min_height and content_height + 6 <= min_height * mm:
+            row_heights.append(min_height * mm)
+        else:
+            row_heights.append(None)
+
+    table = Table(grid, colWidths=col_widths, rowHeights=row_heights)
+    table.setStyle(TableStyle(commands))
+    return table
+
+
+def render_report_pdf(template_id, data):
+    """
+    按模板的版式描述直接生成一份PDF报告单
+
+    Args:
+        template_id: 模板ID，须在 REPORT_LAYOUTS 中
+        data: 模板数据，即 ReportExporter.prepare_template_data() 的返回值
+
+    Returns:
+        bytes: PDF文件内容
+    """
+    if not REPORTLAB_AVAILABLE:
+        raise RuntimeError('ReportLab库未安装，无法直接生成PDF')
+    layout = REPORT_LAYOUTS[template_id]
+    font_name = get_font_name()
+    bold_font_name = get_bold_font_name()
+    data = _TemplateData({key: '' if value is None else str(value) for key, value in data.items()})
+
+    top, right, bottom, left = (margin * mm for margin in layout['margins'])
+    buffer = io.BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=A4, topMargin=top, rightMargin=right, bottomMargin=bottom,
+                            leftMargin=left, title=_fill(layout['title'], data), author='ClassMaster')
+
+    title_style = ParagraphStyle('report_title', fontName=bold_font_name, fontSize=layout['title_size'],
+                                 leading=layout['title_size'] * 1.5, alignment=TA_CENTER, spaceAfter=4 * mm)
+    story = [
+        Paragraph(_escape(_fill(layout['title'], data)), title_style),
+        _build_table(layout, data, font_name, bold_font_name, doc.width),
+    ]
+    doc.build(story)
+    return buffer.getvalue()
@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+"""
+报告并行渲染进程池
+
+模板渲染（Jinja渲染、XML序列化、压缩）是纯CPU计算，受GIL限制在一个进程里只能串行执行。
+批量导出时把学生分批交给进程池中的渲染进程：每个渲染进程初始化时创建自己的 ReportExporter
+（含内置默认模板），模板第一次使用后留在该进程的编译缓存中，之后的批次直接复用。
+
+渲染进程用 fork 创建，需要在进程还是单线程时由 start_render_pool() 一次启动全部进程（gunicorn 的 post_fork、
+开发服务器启动前）：fork 只复制调用它的线程，其他线程当时持有的锁（日志、导入锁等）在子进程中永远不会释放，
+在处理请求的线程中 fork 渲染进程可能卡死。spawn / forkserver 方式会在每个渲染进程中重新执行启动脚本
+（server.py 的依赖检查、初始化等），uWSGI 下也无法启动，不使用。
+
+各次导出共用启动时创建的进程池；没有创建进程池、学生较少、配置为单进程或渲染进程异常退出后，在当前进程串行渲染。
+"""
+
+import os
+import math
+import logging
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from config import REPORT_RENDER_WORKERS, REPORT_PARALLEL_MIN_STUDENTS
+
+logger = logging.getLogger(__name__)
+
+# 每批最多的学生数，批次太大时各进程负载不均
+MAX_BATCH_SIZE = 20
+# 与 ReportExporter 的默认模板目录相同
+DEFAULT_TEMPLATES_DIR = 'templates/docx'
+
+_executor = None
+_executor_templates_dir = None
+_executor_lock = threading.Lock()
+
+# 渲染进程中的 ReportExporter，由 _init_worker 创建
+_worker_exporter = None
+
+
+def _init_worker(templates_dir):
+    """渲染进程初始化：重新配置日志（fork 继承的后台写日志线程不存在），创建报告导出器"""
+    global _worker_exporter
+    from logger_config import setup_process_logger
+    from utils.report_exporter import ReportExporter
+
+    setup_process_logger()
+    _worker_exporter = ReportExporter(templates_dir)
+
+
+def _render_batch(template_path, jobs, settings):
+    """在渲染进程中生成一批报告，返回 [(是否成功, 文件内容或错误信息), ...]"""
+    return [_worker_exporter.export_single_report(template_path, student, comment, grade, settings)
+            for student, comment, grade in jobs]
+
+
+def start_render_pool(templates_dir=DEFAULT_TEMPLATES_DIR):
+    """
+    创建进程池并立即启动全部渲染进程，必须在进程还没有启动其他线程时调用
+
+    配置为单进程或平台不支持 fork 时不创建，导出时在当前进程串行渲染
+    """
+    global _executor, _executor_templates_dir
+    if REPORT_RENDER_WORKERS <= 1 or 'fork' not in multiprocessing.get_all_start_methods():
+        return
+
+    with _executor_lock:
+        if _executor is not None:
+            return
+        executor = ProcessPoolExecutor(
+            max_workers=REPORT_RENDER_WORKERS,
+            mp_context=multiprocessing.get_context('fork'),
+            initializer=_init_worker,
+            initargs=(templates_dir,),
+        )
+        # 进程池按需创建渲染进程，这里同时提交与进程数相同的任务，让全部渲染进程现在就启动
+        futures = [executor.submit(os.getpid) for _ in range(REPORT_RENDER_WORKERS)]
+        pids = {future.result() for future in futures}
+        _executor = executor
+        _executor_templates_dir = templates_dir
+    logger.info(f"已创建报告渲染进程池，进程数: {len(pids)}")
+
+
+def _get_executor(templates_dir):
+    """获取启动时创建的进程池，没有创建或模板目录不同时返回None"""
+    with _executor_lock:
+        if _executor is not None and _executor_templates_dir == templates_dir:
+            return _executor
+        return None
+
+
+def _discard_executor(executor):
+    """渲染进程异常退出后丢弃进程池，之后的导出在当前进程串行渲染（不在处理请求的线程中重新 fork）"""
+    global _executor
+    with _executor_lock:
+        if _executor is executor:
+            _executor = None
+    executor.shutdown(wait=False)
+
+
+def shutdown_render_pool():
+    """关闭进程池"""
+    global _executor
+    with _executor_lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown()
+
+
+def render_reports(exporter, template_path, jobs, settings):
+    """
+    为一组学生生成报告，按 jobs 的顺序逐个返回结果
+
+    Args:
+        exporter: 当前进程的 ReportExporter，串行渲染时使用
+        template_path: 模板文件路径，空字符串表示使用内置默认模板
+        jobs: [(学生信息, 评语, 成绩), ...]
+        settings: 导出设置
+
+    Yields:
+        Tuple[bool, Union[bytes, str]]: (是否成功, 结果文件内容或错误信息)，与 export_single_report 相同
+    """
+    executor = None
+    if REPORT_RENDER_WORKERS > 1 and len(jobs) >= REPORT_PARALLEL_MIN_STUDENTS:
+        executor = _get_executor(exporter.templates_dir)
+
+    done = 0
+    if executor is not None:
+        batch_size = min(MAX_BATCH_SIZE, max(1, math.ceil(len(jobs) / (REPORT_RENDER_WORKERS * 4))))
+        batches = [jobs[i:i + batch_size] for i in range(0, len(jobs), batch_size)]
+        logger.info(f"并行渲染 {len(jobs)} 份报告，共 {len(batches)} 批")
+        # 同时最多提交 REPORT_RENDER_WORKERS * 2 批，上一批的结果取走后再提交下一批，
+        # 渲染完还没写出的报告不会随学生人数在内存中堆积
+        pending = deque()
+        next_batch = 0
+        try:
+            while next_batch < len(batches) or pending:
+                while next_batch < len(batches) and len(pending) < REPORT_RENDER_WORKERS * 2:
+                    pending.append(executor.submit(_render_batch, template_path, batches[next_batch], settings))
+                    next_batch += 1
+                for result in pending.popleft().result():
+                    done += 1
+                    yield result
+        except BrokenProcessPool as e:
+            logger.error(f"报告渲染进程异常退出，剩余 {len(jobs) - done} 份报告改为串行生成: {str(e)}")
+            _discard_executor(executor)
+        finally:
+            # 导出中途取消时，已提交但还没开始的批次不再渲染
+            for future in pending:
+                future.cancel()
+
+    for student, comment, grade in jobs[done:]:
+        yield exporter.export_single_report(template_path, student, comment, grade, settings)
@@ -0,0 +1,233 @@
+# -*- coding: utf-8 -*-
+"""
+学生列表查询工具
+
+为 /api/students 等列表接口提供：
+- limit / after 分页：after 为基于学号排序键 id_num 的游标，翻页不需要 OFFSET 扫描
+- fields 字段投影：默认不返回 comments 等大字段
+- 总数统计：从触发器维护的 student_counts 计数表读取，不再额外 COUNT 扫描
+- 不分页的整表/整班列表以流式JSON输出，内存占用与学生人数无关
+"""
+
+import logging
+
+from utils.json_stream import iter_query, stream_json_list
+
+logger = logging.getLogger(__name__)
+
+# 默认不返回的大字段，需要时通过 fields 参数显式指定
+HEAVY_COLUMNS = ('comments',)
+
+# 单页最大条数
+MAX_LIMIT = 1000
+
+# 按班级计数的触发器，class_id 为空的学生计入 class_key = 0
+_COUNTER_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS student_counts (
+    class_key INTEGER PRIMARY KEY,
+    total INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE TRIGGER IF NOT EXISTS trg_student_counts_insert AFTER INSERT ON students
+BEGIN
+    INSERT INTO student_counts (class_key, total) VALUES (COALESCE(NEW.class_id, 0), 1)
+    ON CONFLICT(class_key) DO UPDATE SET total = total + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_student_counts_delete AFTER DELETE ON students
+BEGIN
+    UPDATE student_counts SET total = total - 1 WHERE class_key = COALESCE(OLD.class_id, 0);
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_student_counts_move AFTER UPDATE OF class_id ON students
+WHEN COALESCE(OLD.class_id, 0) IS NOT COALESCE(NEW.class_id, 0)
+BEGIN
+    UPDATE student_counts SET total = total - 1 WHERE class_key = COALESCE(OLD.class_id, 0);
+    INSERT INTO student_counts (class_key, total) VALUES (COALESCE(NEW.class_id, 0), 1)
+    ON CONFLICT(class_key) DO UPDATE SET total = total + 1;
+END;
+'''
+
+# students表的列名缓存
+_student_columns = []
+
+
+def ensure_student_counters(conn):
+    """创建计数表和触发器，并按当前数据重建计数（启动时调用）"""
+    conn.executescript(_COUNTER_SCHEMA)
+    conn.execute('DELETE FROM student_counts')
+    conn.execute('''
+        INSERT INTO student_counts (class_key, total)
+        SELECT COALESCE(class_id, 0), COUNT(*) FROM students GROUP BY COALESCE(class_id, 0)
+    ''')
+    conn.commit()
+
+
+def count_students(conn, class_id=None):
+    """
+    获取学生总数
+
+    Args:
+        class_id: 班级ID，为None时返回全校学生数
+    """
+    if class_id is None:
+        row = conn.execute('SELECT COALESCE(SUM(total), 0) FROM student_counts').fetchone()
+    else:
+        row = conn.execute('SELECT total FROM student_counts WHERE class_key = ?', (class_id,)).fetchone()
+    return row[0] if row else 0
+
+
+def get_student_columns(conn, refresh=False):
+    """获取students表的列名（进程内缓存）"""
+    if refresh or not _student_columns:
+        columns = [row[1] for row in conn.execute('PRAGMA table_info(students)').fetchall()]
+        _student_columns[:] = columns
+    return list(_student_columns)
+
+
+def parse_list_args(conn, args):
+    """
+    解析列表接口的 limit / after / fields 参数
+
+    Args:
+        args: request.args
+
+    Returns:
+        dict: fields（要返回的列）、limit（None表示不分页）、after（(id_num, rowid)或None）
+
+    Raises:
+        ValueError: 参数无效
+    """
+    columns = get_student_columns(conn)
+
+    # 字段投影
+    fields_arg = (args.get('fields') or '').strip()
+    if fields_arg in ('*', 'all'):
+        fields = columns
+    elif fields_arg:
+        fields = [field.strip() for field in fields_arg.split(',') if field.strip()]
+        unknown = [field for field in fields if field not in columns]
+        if unknown:
+            # 列可能是启动后新增的，刷新一次缓存再校验
+            columns = get_student_columns(conn, refresh=True)
+            unknown = [field for field in fields if field not in columns]
+        if unknown:
+            raise ValueError(f'未知字段: {", ".join(unknown)}')
+    else:
+        fields = [column for column in columns if column not in HEAVY_COLUMNS]
+
+    # 分页条数
+    limit = args.get('limit')
+    if limit not in (None, ''):
+        try:
+            limit = int(limit)
+        except (TypeError, ValueError):
+            raise ValueError('limit 必须是整数')
+        if limit <= 0:
+            raise ValueError('limit 必须大于0')
+        limit = min(limit, MAX_LIMIT)
+    else:
+        limit = None
+
+    # 游标：'学号排序键' 或上一页返回的 '学号排序键_rowid'
+    after = args.get('after')
+    if after not in (None, ''):
+        try:
+            if '_' in after:
+                sort_key, row_id = after.split('_', 1)
+                after = (int(sort_key), int(row_id))
+            else:
+                after = (int(after), None)
+        except (TypeError, ValueError):
+            raise ValueError('after 游标格式无效')
+    else:
+        after = None
+
+    return {'fields': fields, 'limit': limit, 'after': after}
+
+
+def build_student_query(list_args, where=None, params=(), order_by='id_num'):
+    """
+    按列表参数构造学生查询语句
+
+    Args:
+        list_args: parse_list_args() 的返回值
+        where: 额外的WHERE条件（不含WHERE关键字）
+        params: WHERE条件的参数
+        order_by: 不分页时的排序方式；分页时固定按 id_num, rowid 排序以保证游标稳定
+
+    Returns:
+        tuple: (SQL, 参数列表)
+    """
+    columns = ', '.join(list_args['fields'])
+    sql = f'SELECT {columns}, id_num AS _sort_key, rowid AS _row_id FROM students'
+
+    conditions = []
+    query_params = list(params)
+    if where:
+        conditions.append(f'({where})')
+
+    after = list_args['after']
+    if after is not None:
+        sort_key, row_id = after
+        if row_id is None:
+            conditions.append('id_num > ?')
+            query_params.append(sort_key)
+        else:
+            conditions.append('(id_num, rowid) > (?, ?)')
+            query_params.extend([sort_key, row_id])
+
+    if conditions:
+        sql += ' WHERE ' + ' AND '.join(conditions)
+
+    paged = list_args['limit'] is not None or after is not None
+    sql += ' ORDER BY id_num, rowid' if paged else f' ORDER BY {order_by}'
+
+    if list_args['limit'] is not None:
+        sql += ' LIMIT ?'
+        query_params.append(list_args['limit'])
+
+    return sql, query_params
+
+
+def query_students(conn, list_args, where=None, params=(), order_by='id_num'):
+    """
+    按列表参数查询学生，参数同 build_student_query()
+
+    Returns:
+        tuple: (学生字典列表, 下一页游标或None)
+    """
+    sql, query_params = build_student_query(list_args, where, params, order_by)
+
+    students = []
+    last = None
+    for row in conn.execute(sql, query_params):
+        student = dict(row)
+        last = (student.pop('_sort_key'), student.pop('_row_id'))
+        students.append(student)
+
+    next_after = None
+    if list_args['limit'] is not None and len(students) == list_args['limit'] and last:
+        next_after = f'{last[0]}_{last[1]}'
+
+    return students, next_after
+
+
+def _strip_sort_columns(student):
+    student.pop('_sort_key', None)
+    student.pop('_row_id', None)
+    return student
+
+
+def stream_students(list_args, where=None, params=(), order_by='id_num', extra=None):
+    """
+    以流式JSON输出不分页的学生列表，参数同 build_student_query()
+
+    Args:
+        extra: 列表之前输出的字段，如 status、total
+
+    Returns:
+        Response: {...extra, "students": [...], "count": 条数}
+    """
+    sql, query_params = build_student_query(list_args, where, params, order_by)
+    return stream_json_list('students', iter_query(sql, query_params, row_hook=_strip_sort_columns), extra)
@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+"""
+Word 批量转换PDF（Windows）
+
+逐个文件转换时每份文档都要 CoInitialize、启动 Word、打开文档、退出 Word，
+启动 Word 的时间远大于转换本身。这里每次导出只启动一个 Word 实例，在同一会话中转换全部文档：
+- Word 在专用线程中运行（COM 对象只能在创建它的线程中使用），主线程按文档等待结果；
+- 每份文档都有超时，超时后结束该 Word 进程，这份文档记为失败，其余文档在新启动的 Word 中继续转换；
+- 单份文档打开或保存失败只影响这一份。
+"""
+
+import os
+import queue
+import signal
+import logging
+import threading
+
+from config import PDF_CONVERT_TIMEOUT
+
+logger = logging.getLogger(__name__)
+
+# Word 启动的最长等待秒数
+STARTUP_TIMEOUT = 60
+
+# Word 的PDF文件格式常量（wdFormatPDF）
+WD_FORMAT_PDF = 17
+
+try:
+    import pythoncom
+    import win32process
+    from win32com.client import DispatchEx
+    WORD_COM_AVAILABLE = True
+except ImportError:
+    WORD_COM_AVAILABLE = False
+
+
+class _WordSession:
+    """在专用线程中运行的 Word 实例"""
+
+    def __init__(self):
+        self.pid = None
+        self._tasks = queue.Queue()
+        self._results = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name='word-pdf-session', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        ok, error = self._results.get(timeout=STARTUP_TIMEOUT)
+        if not ok:
+            raise RuntimeError(f'Word 启动失败: {error}')
+
+    def _run(self):
+        pythoncom.CoInitialize()
+        word = None
+        try:
+            try:
+                # DispatchEx 总是启动新的 Word 进程，不会占用用户正在使用的 Word
+                word = DispatchEx('Word.Application')
+                word.Visible = False
+                word.DisplayAlerts = 0
+                try:
+                    self.pid = win32process.GetWindowThreadProcessId(word.Hwnd)[1]
+                except Exception:
+                    logger.warning("无法获取 Word 进程ID，超时后将无法结束 Word 进程")
+            except Exception as e:
+                self._results.put((False, str(e)))
+                return
+            self._results.put((True, None))
+
+            while True:
+                task = self._tasks.get()
+                if task is None:
+                    break
+                docx_path, pdf_path = task
+                doc = None
+                try:
+                    doc = word.Documents.Open(docx_path, ConfirmConversions=False, ReadOnly=True,
+                                              AddToRecentFiles=False)
+                    doc.SaveAs(pdf_path, FileFormat=WD_FORMAT_PDF)
+                    self._results.put((True, None))
+                except Exception as e:
+                    self._results.put((False, str(e)))
+                finally:
+                    if doc is not None:
+                        try:
+                            doc.Close(False)
+                        except Exception:
+                            logger.warning(f"关闭文档 {os.path.basename(docx_path)} 时出错")
+        finally:
+            if word is not None:
+                try:
+                    word.Quit()
+                except Exception:
+                    logger.warning("退出Word时出错")
+            pythoncom.CoUninitialize()
+
+    def convert(self, docx_path, pdf_path, timeout):
+        """
+        转换一份文档
+
+        Returns:
+            Tuple[bool, Optional[str]]: (是否成功, 错误信息)；超时时抛出 TimeoutError
+        """
+        self._tasks.put((os.path.abspath(docx_path), os.path.abspath(pdf_path)))
+        try:
+            return self._results.get(timeout=timeout)
+        except queue.Empty:
+            raise TimeoutError(f'转换超过 {timeout} 秒')
+
+    def close(self):
+        """退出 Word"""
+        self._tasks.put(None)
+        self._thread.join(timeout=30)
+
+    def kill(self):
+        """结束卡住的 Word 进程，阻塞中的转换线程随之退出"""
+        if self.pid:
+            try:
+                os.kill(self.pid, signal.SIGTERM)
+            except OSError as e:
+                logger.warning(f"结束 Word 进程 {self.pid} 失败: {str(e)}")
+
+
+def convert_with_word(docx_paths, output_dir, timeout=PDF_CONVERT_TIMEOUT, check_cancelled=None):
+    """
+    在一个 Word 会话中把一组文档转换为PDF
+
+    Args:
+        docx_paths: 待转换的文档路径列表
+        output_dir: PDF输出目录
+        timeout: 每份文档的超时秒数
+        check_cancelled: 每份文档转换前调用，可抛出异常中止转换
+
+    Returns:
+        dict: {docx路径: pdf路径或None}
+    """
+    results = {docx_path: None for docx_path in docx_paths}
+    if not WORD_COM_AVAILABLE:
+        logger.error("无法使用Word转换：pywin32不可用")
+        return results
+
+    pending = list(docx_paths)
+    while pending:
+        session = _WordSession()
+        try:
+            session.start()
+        except Exception as e:
+            logger.error(str(e))
+            break
+        logger.info(f"Word 已启动，剩余 {len(pending)} 份文档待转换")
+
+        try:
+            while pending:
+                if check_cancelled:
+                    check_cancelled()
+                docx_path = pending.pop(0)
+                pdf_path = os.path.join(output_dir, os.path.splitext(os.path.basename(docx_path))[0] + '.pdf')
+                try:
+                    ok, error = session.convert(docx_path, pdf_path, timeout)
+                except TimeoutError as e:
+                    # Word 卡在这份文档上，结束进程后在新的会话中继续
+                    logger.error(f"转换 {os.path.basename(docx_path)} 超时，重新启动Word: {str(e)}")
+                    session.kill()
+                    session = None
+                    break
+                if ok and os.path.exists(pdf_path) and os.path.getsize(pdf_path) > 0:
+                    results[docx_path] = pdf_path
+                else:
+                    logger.warning(f"Word 转换 {os.path.basename(docx_path)} 失败: {error}")
+        finally:
+            if session is not None:
+                session.close()
+
+    converted = sum(1 for pdf_path in results.values() if pdf_path)
+    logger.info(f"Word 批量转换完成: {converted}/{len(docx_paths)}")
+    return results
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+"""
+流式ZIP输出
+
+边生成文件边输出ZIP数据：每写入一个文件就把这部分数据交给调用方（通常直接写入HTTP响应），
+不需要先在磁盘或内存中拼出完整的压缩包。写入不可定位的流时 zipfile 会在每个文件之后
+写出数据描述符（data descriptor），生成的是标准ZIP文件。
+"""
+
+import zipfile
+
+
+class _ChunkSink:
+    """只能追加写入的缓冲区，zipfile 写入的数据在这里暂存，由 stream_zip 取走"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        if data:
+            self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self):
+        """取出并清空已写入的数据"""
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def stream_zip(files, compression=zipfile.ZIP_STORED):
+    """
+    把文件逐个写成ZIP并逐段输出
+
+    Args:
+        files: 可迭代的 (文件名, 文件内容bytes) 序列，可以是边生成边返回的生成器
+        compression: 压缩方式，默认为不压缩（docx、pdf 等本身已压缩的文件再压缩收益很小）
+
+    Yields:
+        bytes: ZIP数据，按顺序拼接即为完整的压缩包
+    """
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, 'w', compression=compression) as zipf:
+        for filename, data in files:
+            zipf.writestr(filename, data)
+            chunk = sink.take()
+            if chunk:
+                yield chunk
+    # 关闭时写出中央目录
+    chunk = sink.take()
+    if chunk:
+        yield chunk